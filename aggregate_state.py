@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+#    aggregate_state.py contains tools for storing and loading the state of the top stats computation.
+#    Copyright (C) 2021 Freya Fleckenstein
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import hashlib
+import os
+import pickle
+
+from io_helper import myprint
+from stat_classes import AggregateState
+
+# increase whenever the data stored in an AggregateState changes, so old state files are not used anymore
+state_version = 3
+
+
+# get a hash of all config fields that influence the aggregated top stats
+# Input:
+# config = the config to use for top stats computation
+# Output:
+# hex string of the hash
+def get_state_config_hash(config):
+    relevant_fields = [state_version,
+                       config.stats_to_compute,
+                       sorted(config.duration_for_averages.items()),
+                       sorted(config.spike_dmg_windows.items()),
+                       sorted(config.num_players_considered_top.items()),
+                       config.min_allied_players, config.min_fight_duration, config.min_enemy_players,
+                       sorted(config.squad_buff_abbrev.items()),
+                       sorted(config.self_buff_abbrev.items())]
+    return hashlib.sha256(repr(relevant_fields).encode('utf-8')).hexdigest()
+
+
+
+# Store the state of the top stats computation in a file. Needs to be called after compute_total_values and before
+# compute_avg_values, since computing the averages rounds the total values.
+# Input:
+# state_file = path of the file to write to
+# processed_files = names of all log files that were added
+# players, player_index, account_index, fights = state of the computation as in collect_stat_data
+# found_all_buff_ids, found_healing, found_barrier = state of the computation as in collect_stat_data
+# config = the config used for top stats computation, including the buff ids read so far
+def save_state(state_file, processed_files, players, player_index, account_index, fights, found_all_buff_ids, found_healing, found_barrier, config):
+    state = AggregateState(config_hash = get_state_config_hash(config),
+                           processed_files = processed_files,
+                           players = players,
+                           player_index = player_index,
+                           account_index = account_index,
+                           fights = fights,
+                           found_all_buff_ids = found_all_buff_ids,
+                           found_healing = found_healing,
+                           found_barrier = found_barrier,
+                           squad_buff_ids = config.squad_buff_ids,
+                           self_buff_ids = config.self_buff_ids,
+                           buffs_stacking_duration = config.buffs_stacking_duration,
+                           buffs_stacking_intensity = config.buffs_stacking_intensity,
+                           buffs_not_stacking = config.buffs_not_stacking)
+    tmp_file = state_file+".tmp"
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # replacing makes sure the old state is kept if writing fails
+    os.replace(tmp_file, state_file)
+
+
+
+# Load the state of a previous top stats computation and restore the buff ids in the config.
+# Input:
+# state_file = path of the file to read from
+# config = the config to use for top stats computation
+# log = log file to write to
+# fallback (optional) = what is done instead if there is no usable state file, for the messages
+# Output:
+# AggregateState, or None if there is no usable state file
+def load_state(state_file, config, log, fallback = "processing all logs"):
+    if not os.path.isfile(state_file):
+        myprint(log, "No state file "+state_file+" found, "+fallback+".", "info")
+        return None
+    try:
+        with open(state_file, 'rb') as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        myprint(log, "Couldn't read state file "+state_file+", "+fallback+".", "info")
+        return None
+    if not isinstance(state, AggregateState) or state.config_hash != get_state_config_hash(config):
+        myprint(log, "State file "+state_file+" was created with a different configuration, "+fallback+".", "info")
+        return None
+
+    config.squad_buff_ids = state.squad_buff_ids
+    config.self_buff_ids = state.self_buff_ids
+    config.buffs_stacking_duration = state.buffs_stacking_duration
+    config.buffs_stacking_intensity = state.buffs_stacking_intensity
+    config.buffs_not_stacking = state.buffs_not_stacking
+    return state
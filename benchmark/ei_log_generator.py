@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+#    ei_log_generator.py generates synthetic logs in the json format written by Elite Insights.
+#    Copyright (C) 2021 Freya Fleckenstein
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import json
+import os.path
+import random
+from datetime import datetime, timedelta
+
+professions = ["Scourge", "Reaper", "Harbinger", "Vindicator", "Herald", "Renegade",
+               "Willbender", "Dragonhunter", "Firebrand", "Chronomancer", "Mirage", "Virtuoso",
+               "Tempest", "Weaver", "Catalyst", "Scrapper", "Holosmith", "Mechanist",
+               "Deadeye", "Daredevil", "Specter", "Spellbreaker", "Bladesworn", "Berserker",
+               "Druid", "Soulbeast", "Untamed"]
+
+# buff ids and names as they appear in the buffMap of real logs
+buffs = [(1122, "Stability", False), (717, "Protection", False), (743, "Aegis", False),
+         (26980, "Resistance", False), (718, "Regeneration", False), (740, "Might", True),
+         (725, "Fury", False), (1187, "Quickness", False), (30328, "Alacrity", False),
+         (873, "Resolution", False), (719, "Swiftness", False), (726, "Vigor", False),
+         (5974, "Superspeed", False), (10332, "Chaos Aura", False), (5677, "Fire Aura", False),
+         (5579, "Frost Aura", False), (25518, "Light Aura", False), (5684, "Magnetic Aura", False),
+         (5577, "Shocking Aura", False), (39978, "Dark Aura", False),
+         (59579, "Explosive Entrance", False), (42502, "Explosive Temper", False),
+         (42499, "Big Boomer", False), (5777, "Med Kit", False)]
+self_buffs = ["Explosive Entrance", "Explosive Temper", "Big Boomer", "Med Kit"]
+auras = [buff_id for buff_id, name, _ in buffs if "Aura" in name]
+squad_buffs = [buff_id for buff_id, name, _ in buffs if name not in self_buffs and "Aura" not in name]
+self_buff_ids = [buff_id for buff_id, name, _ in buffs if name in self_buffs]
+regen_id = 718
+
+polling_rate = 150
+
+
+# get a cumulative list of per second values
+def cumulative(values):
+    total = 0
+    result = list()
+    for value in values:
+        total += value
+        result.append(total)
+    return result
+
+
+# generate the json data of one player in a fight
+# Input:
+# rng = random number generator to use
+# account, name, profession = identity of the player
+# duration = fight duration in s
+# num_targets = number of enemy targets
+# num_allies = number of squad members
+# commander = whether this player has the commander tag
+# running_healing = whether this player runs the healing addon
+# tag_positions = positions of the commander, or None if this is the commander
+def generate_player(rng, account, name, profession, duration, num_targets, num_allies, commander, running_healing, tag_positions):
+    num_positions = int(duration * 1000 / polling_rate)
+    if tag_positions is None:
+        x, y = rng.uniform(0, 1000), rng.uniform(0, 1000)
+        positions = list()
+        for i in range(num_positions):
+            x += rng.uniform(-3, 3)
+            y += rng.uniform(-3, 3)
+            positions.append([round(x, 2), round(y, 2)])
+    else:
+        offset_x, offset_y = rng.uniform(-20, 20), rng.uniform(-20, 20)
+        if rng.random() < 0.05:
+            # running back from far away
+            offset_x += 5000
+        positions = [[round(p[0] + offset_x + rng.uniform(-2, 2), 2), round(p[1] + offset_y + rng.uniform(-2, 2), 2)] for p in tag_positions]
+
+    # downs and deaths; every death is preceded by a down ending at the time of death
+    down = list()
+    dead = list()
+    t = rng.randint(5000, 40000)
+    while t < duration * 1000 - 20000 and rng.random() < 0.4:
+        down_end = t + rng.randint(1000, 8000)
+        if rng.random() < 0.6:
+            dead_end = down_end + rng.randint(5000, 15000)
+            down.append([t, down_end])
+            dead.append([down_end, dead_end])
+            t = dead_end + rng.randint(5000, 40000)
+        else:
+            down.append([t, down_end])
+            t = down_end + rng.randint(5000, 40000)
+
+    # damage per second on each target
+    target_damage = list()
+    total_player_damage = 0
+    active_rate = rng.uniform(0.1, 0.6)
+    for target in range(num_targets):
+        per_second = [rng.randint(0, 3000) if rng.random() < active_rate / max(1, num_targets / 10) else 0 for _ in range(duration + 1)]
+        cumulative_damage = cumulative(per_second)
+        total_player_damage += cumulative_damage[-1]
+        target_damage.append([cumulative_damage])
+    power_damage = cumulative([rng.randint(0, 2000) if rng.random() < active_rate else 0 for _ in range(duration + 1)])
+    damage = cumulative([rng.randint(0, 3000) if rng.random() < active_rate else 0 for _ in range(duration + 1)])
+    other_damage = rng.randint(0, 50000)
+
+    health_percents = [[0, 100.0]]
+    health = 100.0
+    for t in range(0, duration * 1000, rng.randint(1500, 4000)):
+        health = min(100.0, max(0.0, health + rng.uniform(-20, 15)))
+        health_percents.append([t, round(health, 2)])
+
+    player = {
+        "account": account,
+        "name": name,
+        "profession": profession,
+        "group": rng.randint(1, 6),
+        "hasCommanderTag": commander,
+        "activeTimes": [duration * 1000 - sum(d[1] - d[0] for d in dead)],
+        "healthPercents": health_percents,
+        "powerDamage1S": [power_damage],
+        "damage1S": [damage],
+        "targetDamage1S": target_damage,
+        "dpsAll": [{"dps": int(total_player_damage / max(1, duration)), "damage": total_player_damage + other_damage}],
+        "statsAll": [{"distToCom": round(rng.uniform(100, 1500), 2), "killed": rng.randint(0, 5), "downed": rng.randint(0, 8),
+                      "downContribution": rng.randint(0, 80000), "interrupts": rng.randint(0, 10)}],
+        "support": [{"condiCleanse": rng.randint(0, 200), "boonStrips": rng.randint(0, 80)}],
+        "defenses": [{"damageTaken": rng.randint(0, 300000), "damageBarrier": rng.randint(0, 40000),
+                      "deadCount": len(dead), "downCount": len(down), "boonStrips": rng.randint(0, 50)}],
+        "squadBuffs": [{"id": buff_id, "buffData": [{"generation": round(rng.uniform(0, 60), 2), "overstack": 0.0, "wasted": 0.0}]}
+                       for buff_id in squad_buffs if rng.random() < 0.8],
+        "buffUptimes": [{"id": buff_id, "buffData": [{"uptime": round(rng.uniform(0, 40), 3), "presence": 0.0}],
+                         "states": [[t * 1000, rng.randint(0, 1)] for t in range(0, duration, 5)]}
+                        for buff_id in auras if rng.random() < 0.5],
+        "selfBuffs": [{"id": buff_id, "buffData": [{"generation": round(rng.uniform(0, 100), 2)}]}
+                      for buff_id in self_buff_ids if profession in ["Scrapper", "Holosmith", "Mechanist"] and rng.random() < 0.7],
+        # subtrees that are not needed for the top stats, but make up a large part of real logs
+        "rotation": [{"id": rng.randint(1000, 70000), "skills": [{"castTime": rng.randint(0, duration * 1000), "duration": rng.randint(0, 2000),
+                                                                  "timeGained": 0, "quickness": 0.0} for _ in range(rng.randint(5, 30))]}
+                     for _ in range(10)],
+        "totalDamageDist": [[{"id": rng.randint(1000, 70000), "totalDamage": rng.randint(0, 100000), "min": 0, "max": rng.randint(0, 9000),
+                              "hits": rng.randint(0, 100), "connectedHits": 0, "crit": 0, "glance": 0, "flank": 0, "missed": 0,
+                              "invulned": 0, "interrupted": 0, "evaded": 0, "blocked": 0, "shieldDamage": 0, "critDamage": 0,
+                              "indirectDamage": False} for _ in range(25)]],
+        "combatReplayData": {"start": 0, "down": down, "dead": dead, "dc": [], "positions": positions},
+    }
+
+    if running_healing:
+        allied_healing = [[cumulative([rng.randint(0, 300) if rng.random() < 0.3 else 0 for _ in range(duration + 1)])] for _ in range(num_allies)]
+        allied_total = sum(h[0][-1] for h in allied_healing)
+        regen_hits = rng.randint(0, 500)
+        player["extHealingStats"] = {
+            "outgoingHealing": [{"healing": allied_total + rng.randint(0, 20000), "hps": 0}],
+            "alliedHealing1S": allied_healing,
+            "totalHealingDist": [[{"id": regen_id, "totalHealing": regen_hits * rng.randint(100, 300), "hits": regen_hits, "min": 0, "max": 0},
+                                  {"id": rng.randint(1000, 70000), "totalHealing": rng.randint(0, 50000), "hits": rng.randint(0, 100), "min": 0, "max": 0}]],
+        }
+        player["extBarrierStats"] = {"outgoingBarrier": [{"barrier": rng.randint(0, 100000), "bps": 0}]}
+    return player
+
+
+
+# generate the json data of one fight
+# Input:
+# rng = random number generator to use
+# squad = list of (account, name, profession) available for this fight
+# num_players = squad size
+# num_enemies = number of enemy players
+# duration = fight duration in s
+# start = start time of the fight
+def generate_fight(rng, squad, num_players, num_enemies, duration, start):
+    members = rng.sample(squad, min(num_players, len(squad)))
+    # some accounts swap build or character between fights
+    members = [(account, name, rng.choice(professions)) if rng.random() < 0.03 else (account, name, profession)
+               for account, name, profession in members]
+    healing_players = [name for _, name, _ in members if rng.random() < 0.6]
+
+    commander_pos = [rng.uniform(0, 1000), rng.uniform(0, 1000)]
+    tag_positions = list()
+    for i in range(int(duration * 1000 / polling_rate)):
+        commander_pos = [commander_pos[0] + rng.uniform(-5, 5), commander_pos[1] + rng.uniform(-5, 5)]
+        tag_positions.append([round(commander_pos[0], 2), round(commander_pos[1], 2)])
+
+    players = list()
+    for i, (account, name, profession) in enumerate(members):
+        commander = (i == 0)
+        players.append(generate_player(rng, account, name, profession, duration, num_enemies, len(members), commander,
+                                       name in healing_players, None if commander else tag_positions))
+    players[0]["combatReplayData"]["positions"] = tag_positions
+
+    targets = list()
+    for i in range(num_enemies):
+        dead = [[rng.randint(0, duration * 1000), 0]] * rng.randint(0, 2)
+        targets.append({"name": "Enemy "+str(i), "enemyPlayer": True, "combatReplayData": {"dead": dead, "down": [], "positions": []}})
+
+    end = start + timedelta(seconds=duration)
+    used_buffs = {"b"+str(buff_id): {"name": name, "stacking": stacking, "icon": "https://example.com/"+str(buff_id)+".png",
+                                     "classification": "Boon"} for buff_id, name, stacking in buffs}
+    return {
+        "eliteInsightsVersion": "2.50.0.0",
+        "fightName": "Detailed WvW - Eternal Battlegrounds",
+        "timeStartStd": start.strftime("%Y-%m-%d %H:%M:%S +01:00"),
+        "timeEndStd": end.strftime("%Y-%m-%d %H:%M:%S +01:00"),
+        "duration": "{:02d}m {:02d}s {:03d}ms".format(duration // 60, duration % 60, rng.randint(0, 999)),
+        "usedExtensions": [{"name": "Healing Stats", "version": "2.0", "runningExtension": healing_players}],
+        "combatReplayMetaData": {"inchToPixel": 0.009, "pollingRate": polling_rate, "sizes": [1000, 1000]},
+        "players": players,
+        "targets": targets,
+        "buffMap": used_buffs,
+    }
+
+
+
+# generate a set of fights and write them as json files to output_directory
+# Input:
+# output_directory = directory to write the logs to
+# num_fights = number of fights to generate
+# squad_size = number of squad members per fight
+# num_enemies = number of enemy players per fight
+# fight_duration = duration of each fight in s
+# seed = seed for the random number generator
+def generate_logs(output_directory, num_fights, squad_size, num_enemies, fight_duration, seed=0):
+    rng = random.Random(seed)
+    # pool of accounts, some more than a squad so that attendance varies
+    squad = [("Account."+str(1000+i), "Character "+str(i), rng.choice(professions)) for i in range(int(squad_size * 1.5))]
+    start = datetime(2022, 1, 17, 19, 58, 5)
+    filenames = list()
+    for fight in range(num_fights):
+        # every few fights, generate a small skirmish that will be skipped
+        enemies = num_enemies if fight % 7 != 6 else 3
+        duration = max(10, int(fight_duration * rng.uniform(0.6, 1.4)))
+        json_data = generate_fight(rng, squad, squad_size, enemies, duration, start)
+        filename = os.path.join(output_directory, start.strftime("%Y%m%d-%H%M%S")+"_detailed_wvw_kill.json")
+        with open(filename, 'w', encoding='utf-8') as json_file:
+            json.dump(json_data, json_file)
+        filenames.append(filename)
+        start += timedelta(seconds=duration + rng.randint(30, 300))
+    return filenames
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='This generates synthetic Elite Insights json logs for testing and benchmarking.')
+    parser.add_argument('output_directory', help='Directory to write the generated .json files to')
+    parser.add_argument('-f', '--fights', dest="num_fights", type=int, help="Number of fights to generate", default=10)
+    parser.add_argument('-s', '--squad_size', dest="squad_size", type=int, help="Number of squad members per fight", default=30)
+    parser.add_argument('-e', '--enemies', dest="num_enemies", type=int, help="Number of enemy players per fight", default=40)
+    parser.add_argument('-d', '--duration', dest="fight_duration", type=int, help="Average fight duration in s", default=120)
+    parser.add_argument('--seed', dest="seed", type=int, help="Seed for the random number generator", default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_directory, exist_ok=True)
+    generate_logs(args.output_directory, args.num_fights, args.squad_size, args.num_enemies, args.fight_duration, args.seed)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+#    run_benchmark.py measures the time and memory needed for each phase of the top stats computation.
+#    Copyright (C) 2021 Freya Fleckenstein
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import sys
+from os import path
+sys.path.append( path.dirname( path.dirname( path.abspath(__file__) ) ) )
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+from parse_top_stats_tools import *
+from io_helper import *
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+# phases of the top stats computation, in the order they are run
+phases = ['load', 'get_stats_from_json_data', 'get_overall_stats', 'ranking', 'write_xls', 'write_to_json']
+default_baseline_file = path.join(path.dirname(path.abspath(__file__)), "baseline.json")
+# phases only count as regression if they got slower by at least this many s, since very short phases vary a lot
+min_regression = 0.05
+
+
+
+# get the peak memory used by this process so far in MB, or None if it can't be determined
+def get_peak_memory():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in KB everywhere else
+    if sys.platform == 'darwin':
+        return round(peak / 1024 / 1024, 1)
+    return round(peak / 1024, 1)
+
+
+
+# generate the logs for the benchmark. This runs in a separate process, so it doesn't count towards the peak memory.
+# Input:
+# log_directory = directory to write the logs to
+# args = cmd line arguments with the size parameters
+def generate_logs(log_directory, args):
+    generator = path.join(path.dirname(path.abspath(__file__)), "ei_log_generator.py")
+    subprocess.run([sys.executable, generator, log_directory, "--fights", str(args.num_fights), "--squad_size", str(args.squad_size),
+                    "--enemies", str(args.num_enemies), "--duration", str(args.fight_duration), "--seed", str(args.seed)], check=True)
+
+
+
+# run all phases of the top stats computation on the logs in log_directory and measure them
+# Input:
+# log_directory = directory with the logs
+# output_directory = directory to write the xls and json output to
+# config = the config to use for top stats computation
+# Output:
+# dict of phase -> wall time in s, number of logs, size of the logs in MB
+def run_phases(log_directory, output_directory, config):
+    times = {phase: 0. for phase in phases}
+    log_files = sorted(filename for filename in os.listdir(log_directory) if filename.endswith('.json'))
+    input_size = sum(os.path.getsize(path.join(log_directory, filename)) for filename in log_files) / 1024 / 1024
+
+    log = open(os.devnull, 'w')
+    players = []
+    player_index = {}
+    account_index = {}
+    fights = []
+    found_all_buff_ids, found_healing, found_barrier = False, False, False
+    projection = get_json_projection(config)
+
+    # the tools print progress to stdout, which would distort the timings
+    with log, contextlib.redirect_stdout(log):
+        for filename in log_files:
+            start = time.perf_counter()
+            json_data = load_json_file(path.join(log_directory, filename), projection)
+            times['load'] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            found_all_buff_ids, found_healing, found_barrier = get_stats_from_json_data(json_data, players, player_index, account_index, fights, config, found_all_buff_ids, found_healing, found_barrier, log, filename)
+            times['get_stats_from_json_data'] += time.perf_counter() - start
+            del json_data
+
+        start = time.perf_counter()
+        get_overall_stats(players, fights, config)
+        overall_squad_stats = get_overall_squad_stats(fights, config)
+        overall_raid_stats = get_overall_raid_stats(fights)
+        times['get_overall_stats'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        top_stat_players = {stat_type: {stat: list() for stat in config.stats_to_compute} for stat_type in StatType}
+        for stat in config.stats_to_compute:
+            top_stat_players[StatType.CONSISTENT][stat] = get_top_players(players, config, stat, StatType.CONSISTENT)
+            top_stat_players[StatType.TOTAL][stat] = get_top_players(players, config, stat, StatType.TOTAL)
+            top_stat_players[StatType.AVERAGE][stat] = get_top_players(players, config, stat, StatType.AVERAGE)
+            top_stat_players[StatType.PERCENTAGE][stat], _ = get_top_percentage_players(players, config, stat, overall_raid_stats['num_used_fights'], top_stat_players[StatType.CONSISTENT][stat])
+        times['ranking'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        write_xls(fights, overall_squad_stats, overall_raid_stats, players, top_stat_players[StatType.AVERAGE], config.stats_to_compute, config, path.join(output_directory, "top_stats_detailed.xlsx"))
+        times['write_xls'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        write_to_json(overall_raid_stats, overall_squad_stats, fights, players, top_stat_players[StatType.TOTAL], top_stat_players[StatType.AVERAGE], top_stat_players[StatType.CONSISTENT], top_stat_players[StatType.PERCENTAGE], path.join(output_directory, "top_stats_detailed.json"))
+        times['write_to_json'] = time.perf_counter() - start
+
+    return times, len(log_files), input_size
+
+
+
+# compare the results to a baseline measured with the same size parameters
+# Input:
+# results = results of this run
+# baseline = results of the baseline run
+# tolerance = factor by which a phase may be slower than in the baseline before it counts as regression, see also min_regression
+# Output:
+# list of phases that got slower than the tolerance allows
+def compare_to_baseline(results, baseline, tolerance):
+    regressions = list()
+    print("\nComparison to baseline ("+baseline['date']+"):")
+    for phase in phases + ['total']:
+        ratio = results['times'][phase] / baseline['times'][phase] if baseline['times'][phase] > 0 else 1.
+        marker = ""
+        if ratio > tolerance and results['times'][phase] - baseline['times'][phase] >= min_regression:
+            regressions.append(phase)
+            marker = "  <-- regression"
+        print("{:<26} {:>9.3f} s  baseline {:>9.3f} s  ({:.2f}x){}".format(phase, results['times'][phase], baseline['times'][phase], ratio, marker))
+    if results['peak_memory'] is not None and baseline['peak_memory'] is not None:
+        print("{:<26} {:>9.1f} MB baseline {:>9.1f} MB ({:.2f}x)".format("peak memory", results['peak_memory'], baseline['peak_memory'], results['peak_memory'] / baseline['peak_memory']))
+    return regressions
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='This measures the time and memory needed for each phase of the top stats computation on synthetic logs.')
+    parser.add_argument('-f', '--fights', dest="num_fights", type=int, help="Number of fights", default=20)
+    parser.add_argument('-s', '--squad_size', dest="squad_size", type=int, help="Number of squad members per fight", default=40)
+    parser.add_argument('-e', '--enemies', dest="num_enemies", type=int, help="Number of enemy players per fight", default=50)
+    parser.add_argument('-d', '--duration', dest="fight_duration", type=int, help="Average fight duration in s", default=120)
+    parser.add_argument('--seed', dest="seed", type=int, help="Seed for generating the logs", default=0)
+    parser.add_argument('-c', '--config_file', dest="config_file", help="Config file with all the settings", default="parser_config_detailed")
+    parser.add_argument('--log_directory', dest="log_directory", help="Use the logs in this directory instead of generating new ones", default=None)
+    parser.add_argument('--baseline', dest="baseline_file", help="Baseline file to compare to", default=default_baseline_file)
+    parser.add_argument('--save_baseline', dest="save_baseline", help="Store the results as new baseline", default=False, action='store_true')
+    parser.add_argument('--tolerance', dest="tolerance", type=float, help="Factor by which a phase may be slower than in the baseline", default=1.25)
+    parser.add_argument('-o', '--output', dest="output_file", help="json file to write the results to", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_directory:
+        log_directory = args.log_directory
+        if log_directory is None:
+            log_directory = path.join(work_directory, "logs")
+            os.makedirs(log_directory)
+            print("Generating "+str(args.num_fights)+" fights with "+str(args.squad_size)+" players and "+str(args.num_enemies)+" enemies...")
+            generate_logs(log_directory, args)
+
+        parser_config = importlib.import_module("parser_configs."+args.config_file , package=None)
+        config = fill_config(parser_config, None)
+        times, num_logs, input_size = run_phases(log_directory, work_directory, config)
+
+    times['total'] = sum(times.values())
+    results = {'date': time.strftime("%Y-%m-%d"),
+               'parameters': {'fights': args.num_fights, 'squad_size': args.squad_size, 'enemies': args.num_enemies,
+                              'duration': args.fight_duration, 'seed': args.seed, 'config': args.config_file,
+                              'log_directory': args.log_directory},
+               'num_logs': num_logs,
+               'input_size': round(input_size, 1),
+               'times': {phase: round(value, 3) for phase, value in times.items()},
+               'logs_per_s': round(num_logs / times['total'], 2) if times['total'] > 0 else None,
+               'load_mb_per_s': round(input_size / times['load'], 1) if times['load'] > 0 else None,
+               'peak_memory': get_peak_memory()}
+
+    print("\n{} logs, {:.1f} MB".format(num_logs, input_size))
+    for phase in phases + ['total']:
+        print("{:<26} {:>9.3f} s".format(phase, times[phase]))
+    print("throughput: {} logs/s, loading {} MB/s".format(results['logs_per_s'], results['load_mb_per_s']))
+    if results['peak_memory'] is not None:
+        print("peak memory: {} MB".format(results['peak_memory']))
+
+    if args.output_file is not None:
+        with open(args.output_file, 'w') as output_file:
+            json.dump(results, output_file, indent=4)
+
+    regressions = list()
+    if args.save_baseline:
+        with open(args.baseline_file, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=4)
+        print("Stored results as baseline in "+args.baseline_file)
+    elif os.path.isfile(args.baseline_file):
+        with open(args.baseline_file) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['parameters'] != results['parameters']:
+            print("\nBaseline "+args.baseline_file+" was measured with different parameters, not comparing.")
+        else:
+            regressions = compare_to_baseline(results, baseline, args.tolerance)
+
+    if regressions:
+        print("Phases slower than "+str(args.tolerance)+" times the baseline: "+", ".join(regressions))
+        sys.exit(1)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+#    run_json_backend_benchmark.py compares the json decoding backends for loading Elite Insights logs.
+#    Copyright (C) 2021 Freya Fleckenstein
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import sys
+from os import path
+sys.path.append( path.dirname( path.dirname( path.abspath(__file__) ) ) )
+
+import argparse
+import gzip
+import importlib
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+from stat_classes import fill_config
+from json_reader import load_json_file, get_json_projection, get_json_backend, json_backends
+from run_benchmark import generate_logs, get_peak_memory
+
+# decoding the whole logs with json.load is measured as reference
+reference = 'json.load'
+
+
+# load all logs in log_directory with one backend and measure the time. Each backend is measured in its own process,
+# so the peak memory of one backend doesn't hide the one of another.
+# Input:
+# log_directory = directory with the logs
+# backend = json backend to use, or reference for decoding the whole logs with json.load
+# config = the config to use for top stats computation, which determines the parts of the logs that are kept
+# repetitions = how often all logs are loaded; the fastest run counts
+# Output:
+# dict with the load time in s and the peak memory in MB
+def measure_backend(log_directory, backend, config, repetitions):
+    log_files = sorted(path.join(log_directory, filename) for filename in os.listdir(log_directory) if filename.endswith(('.json', '.json.gz')))
+    projection = get_json_projection(config)
+    times = list()
+    for i in range(repetitions):
+        start = time.perf_counter()
+        for log_file in log_files:
+            if backend == reference:
+                with (gzip.open(log_file) if log_file.endswith('.gz') else open(log_file, 'rb')) as json_file:
+                    json_data = json.load(json_file)
+            else:
+                json_data = load_json_file(log_file, projection, backend)
+            del json_data
+        times.append(time.perf_counter() - start)
+    return {'time': min(times), 'peak_memory': get_peak_memory()}
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='This compares the time and memory needed for loading logs with each installed json backend, and with decoding the whole logs with json.load.')
+    parser.add_argument('-f', '--fights', dest="num_fights", type=int, help="Number of fights", default=20)
+    parser.add_argument('-s', '--squad_size', dest="squad_size", type=int, help="Number of squad members per fight", default=40)
+    parser.add_argument('-e', '--enemies', dest="num_enemies", type=int, help="Number of enemy players per fight", default=50)
+    parser.add_argument('-d', '--duration', dest="fight_duration", type=int, help="Average fight duration in s", default=120)
+    parser.add_argument('--seed', dest="seed", type=int, help="Seed for generating the logs", default=0)
+    parser.add_argument('-c', '--config_file', dest="config_file", help="Config file with all the settings", default="parser_config_detailed")
+    parser.add_argument('--log_directory', dest="log_directory", help="Use the logs in this directory instead of generating new ones", default=None)
+    parser.add_argument('-r', '--repetitions', dest="repetitions", type=int, help="How often all logs are loaded with each backend", default=3)
+    parser.add_argument('--backend', dest="backend", help="Only measure this backend in this process and print the results as json", default=None)
+    args = parser.parse_args()
+
+    parser_config = importlib.import_module("parser_configs."+args.config_file , package=None)
+    config = fill_config(parser_config, None)
+    if args.backend is not None:
+        print(json.dumps(measure_backend(args.log_directory, args.backend, config, args.repetitions)))
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as work_directory:
+        log_directory = args.log_directory
+        if log_directory is None:
+            log_directory = path.join(work_directory, "logs")
+            os.makedirs(log_directory)
+            print("Generating "+str(args.num_fights)+" fights with "+str(args.squad_size)+" players and "+str(args.num_enemies)+" enemies...")
+            generate_logs(log_directory, args)
+        input_size = sum(entry.stat().st_size for entry in os.scandir(log_directory) if entry.name.endswith(('.json', '.json.gz'))) / 1024 / 1024
+
+        print("\n{:<10} {:>9} {:>10} {:>12}".format("backend", "time", "MB/s", "peak memory"))
+        for backend in json_backends + [reference]:
+            try:
+                if backend != reference:
+                    get_json_backend(backend)
+            except ValueError:
+                print("{:<10} not installed".format(backend))
+                continue
+            command = [sys.executable, path.abspath(__file__), "--log_directory", log_directory, "--backend", backend,
+                       "--config_file", args.config_file, "--repetitions", str(args.repetitions)]
+            results = json.loads(subprocess.run(command, capture_output=True, text=True, check=True).stdout)
+            print("{:<10} {:>7.3f} s {:>10.1f} {:>9} MB".format(backend, results['time'], input_size / results['time'], results['peak_memory']))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+#    run_startup_benchmark.py measures how long it takes until the top stats parser can start working.
+#    Copyright (C) 2021 Freya Fleckenstein
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from os import path
+
+package_directory = path.dirname( path.dirname( path.abspath(__file__) ) )
+# modules that are only needed for writing the xls file and should not be imported before
+xls_modules = ['pandas', 'openpyxl']
+# imports all modules needed for parsing logs and writing the json output and prints which xls modules were imported
+import_check = "import sys; import parse_top_stats_tools, io_helper; print(' '.join(m for m in "+str(xls_modules)+" if m in sys.modules))"
+
+
+
+# run a command repeatedly and measure its wall time
+# Input:
+# command = list of command line arguments
+# repetitions = how often the command is run
+# Output:
+# list of wall times in s
+def time_command(command, repetitions):
+    times = list()
+    for i in range(repetitions):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=package_directory, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='This measures the startup time of the top stats parser, i.e., the time needed for starting python and importing all modules.')
+    parser.add_argument('-r', '--repetitions', dest="repetitions", type=int, help="How often each command is run", default=10)
+    parser.add_argument('--max_time', dest="max_time", type=float, help="Fail if the median startup time is longer than this many s", default=None)
+    parser.add_argument('-o', '--output', dest="output_file", help="json file to write the results to", default=None)
+    args = parser.parse_args()
+
+    commands = {'python': [sys.executable, "-c", "pass"],
+                'help': [sys.executable, "parse_top_stats_detailed.py", "--help"],
+                'import_json_only': [sys.executable, "-c", import_check]}
+    results = {}
+    for name, command in commands.items():
+        times = time_command(command, args.repetitions)
+        results[name] = {'min': round(min(times), 3), 'median': round(statistics.median(times), 3)}
+        print("{:<20} min {:>7.3f} s  median {:>7.3f} s".format(name, min(times), statistics.median(times)))
+
+    imported = subprocess.run([sys.executable, "-c", import_check], cwd=package_directory, capture_output=True, text=True, check=True).stdout.split()
+    results['xls_modules_imported'] = imported
+    if imported:
+        print("Modules only needed for xls output were imported anyway: "+", ".join(imported))
+
+    if args.output_file is not None:
+        with open(args.output_file, 'w') as output_file:
+            json.dump(results, output_file, indent=4)
+
+    if imported or (args.max_time is not None and results['help']['median'] > args.max_time):
+        sys.exit(1)
@@ -1,21 +1,11 @@
 #!/usr/bin/env python3
 
 from stat_classes import *
-import xlrd
-from xlutils.copy import copy
-import jsons
 import json
-import pandas as pd
-from openpyxl.styles import colors
-from openpyxl.styles import Font, Color
-from openpyxl.worksheet.filters import (
-    FilterColumn,
-    CustomFilter,
-    CustomFilters,
-    DateGroupItem,
-    Filters,
-    )
-from openpyxl.utils import get_column_letter
+import gzip
+import numpy as np
+# pandas and openpyxl take much longer to import than the rest, so they are only imported in the functions writing the
+# xls file. Runs that don't write an xls file don't need them at all.
 
 
 # get the professions of all players indicated by the indices. Additionally, get the length of the longest profession name.
@@ -78,7 +68,23 @@ def is_string_column(column_name):
 # stat = which stat are we considering
 # xls_output_filename = where to write to
 def write_stats_xls(players, top_players, stat, xls_output_filename, config):
+    import pandas as pd
     writer = pd.ExcelWriter(xls_output_filename, engine = "openpyxl", mode = 'a')
+    add_stats_sheet_xls(writer, players, top_players, stat, config)
+    writer.book.save(xls_output_filename)
+
+
+
+# Add a sheet with the top x people who achieved top total stat to an open xls writer.
+# Input:
+# writer = pandas ExcelWriter using openpyxl
+# players = list of Players
+# top_players = list of indices in players that are considered as top
+# stat = which stat are we considering
+# config = the config used for stats computation
+def add_stats_sheet_xls(writer, players, top_players, stat, config):
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
 
     sorting_columns = config.sort_xls_by[stat]
 
@@ -109,14 +115,14 @@ def write_stats_xls(players, top_players, stat, xls_output_filename, config):
     column_names.append("Percentage Top"+str(config.num_players_considered_top[stat]))
 
     # rename the columns for the xls
-    if stat == 'spike_dmg':
+    if stat in config.spike_dmg_windows:
         column_names.append("Maximum "+stat)
     else:
         column_names.append("Total "+stat)
 
     if stat == 'deaths' or stat == 'kills' or stat == 'downs':
         column_names.append("Average "+stat+" per min "+config.duration_for_averages[stat])
-    elif stat == 'spike_dmg':
+    elif stat in config.spike_dmg_windows:
         column_names.append("Average "+stat+" over all fights")
     elif stat in config.squad_buff_ids and stat in config.buffs_not_stacking:
         column_names.append("Average "+stat+" in %")
@@ -150,8 +156,6 @@ def write_stats_xls(players, top_players, stat, xls_output_filename, config):
     filters = sheet.auto_filter
     filters.ref = "A3:" + get_column_letter(sheet.max_column) + str(sheet.max_row)
 
-    book.save(xls_output_filename)
-
 
     
 # Write xls fight overview
@@ -162,13 +166,108 @@ def write_stats_xls(players, top_players, stat, xls_output_filename, config):
 # config = the config to use for stats computation
 # xls_output_filename = where to write to
 def write_fights_overview_xls(fights, overall_squad_stats, overall_raid_stats, config, xls_output_filename):
+    import pandas as pd
     writer = pd.ExcelWriter(xls_output_filename, engine = "openpyxl")
+    add_fights_overview_sheet_xls(writer, fights, overall_squad_stats, overall_raid_stats, config)
+    writer.book.save(xls_output_filename)
 
+
+
+# Add the fight overview sheet to an open xls writer.
+# Input:
+# writer = pandas ExcelWriter using openpyxl
+# for all other inputs see write_fights_overview_xls
+def add_fights_overview_sheet_xls(writer, fights, overall_squad_stats, overall_raid_stats, config):
     df = create_panda_dataframe_overview(fights, overall_squad_stats, overall_raid_stats, config)
 #    print(df)
     df.to_excel(writer, sheet_name = "Fights Overview", index = False)
-    book = writer.book
-    book.save(xls_output_filename)
+
+
+
+# Write the fight overview and the top x people for all given stats to one xls file. The workbook is only created and
+# saved once, instead of reading and saving the whole file again for each stat.
+# Input:
+# fights = list of Fights as returned by collect_stat_data
+# overall_squad_stats = overall stats of the whole squad; output of get_overall_squad_stats
+# overall_raid_stats = raid stats like start time, end time, total kills, etc.; output of get_overall_raid_stats
+# players = list of Players
+# top_stat_players = dict of stat -> list of indices in players that are considered as top
+# stats = stats to write a sheet for, in the order of the sheets
+# config = the config to use for stats computation
+# xls_output_filename = where to write to
+def write_xls(fights, overall_squad_stats, overall_raid_stats, players, top_stat_players, stats, config, xls_output_filename):
+    import pandas as pd
+    with pd.ExcelWriter(xls_output_filename, engine = "openpyxl") as writer:
+        add_fights_overview_sheet_xls(writer, fights, overall_squad_stats, overall_raid_stats, config)
+        for stat in stats:
+            add_stats_sheet_xls(writer, players, top_stat_players[stat], stat, config)
+
+
+
+# convert a value to something that can be written by the json module. Objects like Fights and Players become dicts
+# of their attributes sorted by name, the stats per fight of a player a list of dicts, one for each fight, and numpy
+# arrays like the tag positions (nested) lists.
+# Input:
+# value = the value to convert
+# Output:
+# value consisting only of dicts, lists, strings, numbers, bools and None
+def get_json_value(value):
+    if isinstance(value, dict):
+        return {key: get_json_value(entry) for key, entry in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [get_json_value(entry) for entry in value]
+    if isinstance(value, PlayerStatsPerFight):
+        return value.to_list()
+    if isinstance(value, PlayerFightStats):
+        return value.to_dict()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if hasattr(value, '__dict__'):
+        return {key: get_json_value(entry) for key, entry in sorted(vars(value).items())}
+    return value
+
+
+
+# write a json object to a file one section at a time. Sections that are lists are also written one entry at a time,
+# so the whole document never has to be kept in memory. The result is the same as json.dump with indent=4, or without
+# any whitespace if compact is set.
+# Input:
+# json_file = file to write to
+# sections = list of (key, value) for each entry of the json object; value can also be a generator for lists
+# compact = write without indentation and whitespace
+def write_json_sections(json_file, sections, compact = False):
+    if compact:
+        dump = lambda value, indentation: json.dumps(value, separators=(',', ':'))
+        newline, item_separator = "", ","
+    else:
+        dump = lambda value, indentation: json.dumps(value, indent=4).replace("\n", "\n"+indentation)
+        newline, item_separator = "\n", ",\n"
+    section_indentation = "" if compact else " " * 4
+    entry_indentation = "" if compact else " " * 8
+    key_separator = ":" if compact else ": "
+
+    json_file.write("{")
+    for section_number, (key, value) in enumerate(sections):
+        if section_number > 0:
+            json_file.write(item_separator)
+        else:
+            json_file.write(newline)
+        json_file.write(section_indentation+json.dumps(key)+key_separator)
+        if isinstance(value, dict):
+            json_file.write(dump(value, section_indentation))
+            continue
+        # write lists entry by entry
+        json_file.write("[")
+        num_entries = 0
+        for entry in value:
+            json_file.write((item_separator if num_entries > 0 else newline)+entry_indentation+dump(entry, entry_indentation))
+            num_entries += 1
+        if num_entries > 0:
+            json_file.write(newline+section_indentation)
+        json_file.write("]")
+    if sections:
+        json_file.write(newline)
+    json_file.write("}")
 
 
 
@@ -177,27 +276,33 @@ def write_fights_overview_xls(fights, overall_squad_stats, overall_raid_stats, c
 # overall_raid_stats = raid stats like start time, end time, total kills, etc.; output of get_overall_raid_stats
 # overall_squad_stats = overall stats of the whole squad; output of get_overall_squad_stats
 # fights = list of Fights
-# config = the config used for stats computation
-# output = file to write to
-
-def write_to_json(overall_raid_stats, overall_squad_stats, fights, players, top_total_stat_players, top_average_stat_players, top_consistent_stat_players, top_percentage_stat_players, output_file):
-    json_dict = {}
-    json_dict["overall_raid_stats"] = {key: value for key, value in overall_raid_stats.items()}
-    json_dict["overall_squad_stats"] = {key: value for key, value in overall_squad_stats.items()}
-    json_dict["fights"] = [jsons.dump(fight) for fight in fights]
-    json_dict["players"] = [jsons.dump(player) for player in players]
-    json_dict["top_total_players"] =  {key: value for key, value in top_total_stat_players.items()}
-    json_dict["top_average_players"] =  {key: value for key, value in top_average_stat_players.items()}
-    json_dict["top_consistent_players"] =  {key: value for key, value in top_consistent_stat_players.items()}
-    json_dict["top_percentage_players"] =  {key: value for key, value in top_percentage_stat_players.items()}
-
-    with open(output_file, 'w') as json_file:
-        json.dump(json_dict, json_file, indent=4)
+# players = list of Players
+# top_total_stat_players, top_average_stat_players, top_consistent_stat_players, top_percentage_stat_players = dicts of stat -> indices of top players
+# output_file = file to write to
+# compact (optional) = write the json without indentation and whitespace
+# compress (optional) = write the json gzip compressed
+def write_to_json(overall_raid_stats, overall_squad_stats, fights, players, top_total_stat_players, top_average_stat_players, top_consistent_stat_players, top_percentage_stat_players, output_file, compact = False, compress = False):
+    sections = [("overall_raid_stats", get_json_value(overall_raid_stats)),
+                ("overall_squad_stats", get_json_value(overall_squad_stats)),
+                ("fights", (get_json_value(fight) for fight in fights)),
+                ("players", (get_json_value(player) for player in players)),
+                ("top_total_players", get_json_value(top_total_stat_players)),
+                ("top_average_players", get_json_value(top_average_stat_players)),
+                ("top_consistent_players", get_json_value(top_consistent_stat_players)),
+                ("top_percentage_players", get_json_value(top_percentage_stat_players))]
+
+    if compress:
+        json_file = gzip.open(output_file, 'wt')
+    else:
+        json_file = open(output_file, 'w')
+    with json_file:
+        write_json_sections(json_file, sections, compact)
 
 
 
 # Create a panda dataframe for a fights overview
 def create_panda_dataframe_overview(fights, overall_squad_stats, overall_raid_stats, config):
+    import pandas as pd
     first_col = ["" for i in range(len(fights))]
     fight_num = [i for i in range(len(fights))]
     start_date = [fight.start_time.split()[0] for fight in fights]
@@ -257,6 +362,7 @@ def create_panda_dataframe_overview(fights, overall_squad_stats, overall_raid_st
 # Output:
 # panda data frame containing data to be written to an excel sheet
 def create_panda_dataframe(players, top_players, stat, sorting_columns, sort_ascending, config):
+    import pandas as pd
     accounts = (players[top_players[i]].account for i in range(len(top_players)))
     names = (players[top_players[i]].name for i in range(len(top_players)))
     professions = (players[top_players[i]].profession for i in range(len(top_players)))
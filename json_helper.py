@@ -1,17 +1,60 @@
 #!/usr/bin/env python3
 import math
+import time
+import numpy as np
 
-from stat_classes import Fight, Config
+from stat_classes import Fight, Config, StatExtractor, PlayerFightContext, CombatTimeIndex
 from io_helper import myprint
 
-# get ids of buffs in the log from the buff map
+# json key paths that are read from a fight in any case, by get_stats_from_fight_json, get_buff_ids_from_json and for
+# the fight durations and group of each player. Each path is a tuple of keys; lists on the way are passed through,
+# i.e., the rest of the path applies to all entries of the list.
+fight_json_paths = [('duration',), ('timeStartStd',), ('timeEndStd',), ('usedExtensions',), ('buffMap',),
+                    ('combatReplayMetaData', 'pollingRate'), ('combatReplayMetaData', 'inchToPixel'),
+                    ('targets', 'enemyPlayer'), ('targets', 'combatReplayData', 'dead'),
+                    ('players', 'account'), ('players', 'name'), ('players', 'profession'), ('players', 'group'),
+                    ('players', 'hasCommanderTag'), ('players', 'activeTimes'), ('players', 'healthPercents'),
+                    ('players', 'powerDamage1S'), ('players', 'damage1S'), ('players', 'statsAll'),
+                    ('players', 'combatReplayData', 'positions'), ('players', 'combatReplayData', 'dead'),
+                    ('players', 'combatReplayData', 'down')]
+
+
+
+# get all json key paths that are needed for computing the top stats with this config
 # Input:
-# player_json: json data with the player info. In a json file as parsed by Elite Insights, one entry of the 'players' list.
+# config = the config to use for top stat computation
+# Output:
+# list of key paths, see fight_json_paths
+def get_json_paths(config):
+    paths = list(fight_json_paths)
+    for stat, _ in get_stat_extractors(config):
+        for dependency in get_stat_dependencies(stat, config):
+            paths += [('players',) + path for path in get_stat_extractor(dependency, config).json_paths]
+    return paths
+
+
+# get the entries of the buff map that are relevant for the top stats, i.e., all squad and self buffs in the config
+# Input:
+# json_data: json data of a whole fight as parsed by Elite Insights
 # config: config to use in top stats computation
-# changes config.buffs_stacking_intensity and config.buffs_stacking_duration inplace
-def get_buff_ids_from_json(json_data, config, log):
-    buffs = json_data['buffMap']
-    for buff_id, buff in buffs.items():
+# Output:
+# dict of buff id -> {'name', 'stacking'} for all relevant buffs
+def get_relevant_buff_map(json_data, config):
+    relevant_buff_map = {}
+    for buff_id, buff in json_data['buffMap'].items():
+        if buff['name'] in config.squad_buff_abbrev or buff['name'] in config.self_buff_abbrev:
+            relevant_buff_map[buff_id] = {'name': buff['name'], 'stacking': buff['stacking']}
+    return relevant_buff_map
+
+
+
+# get ids of buffs from a buff map
+# Input:
+# buff_map: buffMap as contained in a json file parsed by Elite Insights
+# config: config to use in top stats computation
+# changes config.squad_buff_ids, config.self_buff_ids, config.buffs_stacking_intensity, config.buffs_stacking_duration and config.buffs_not_stacking inplace
+def read_buff_ids(buff_map, config):
+    for buff_id, buff in buff_map.items():
         if buff['name'] in config.squad_buff_abbrev:
             abbrev_name = config.squad_buff_abbrev[buff['name']]
             config.squad_buff_ids[abbrev_name] = buff_id[1:]
@@ -24,7 +67,16 @@ def get_buff_ids_from_json(json_data, config, log):
         if buff['name'] in config.self_buff_abbrev:
             abbrev_name = config.self_buff_abbrev[buff['name']]
             config.self_buff_ids[abbrev_name] = buff_id[1:]
-    # check that all buff ids were found
+
+
+
+# check that the ids of all buffs in the config were found
+# Input:
+# config: config to use in top stats computation
+# log: log file to write to
+# Output:
+# True if all buff ids were found, False otherwise
+def check_buff_ids(config, log):
     found_all_ids = True
     for buff, abbrev in config.self_buff_abbrev.items():
         if abbrev not in config.self_buff_ids:
@@ -37,6 +89,18 @@ def get_buff_ids_from_json(json_data, config, log):
     return found_all_ids
 
 
+
+# get ids of buffs in the log from the buff map
+# Input:
+# json_data: json data of a whole fight as parsed by Elite Insights
+# config: config to use in top stats computation
+# log: log file to write to
+# changes config.squad_buff_ids, config.self_buff_ids, config.buffs_stacking_intensity, config.buffs_stacking_duration and config.buffs_not_stacking inplace
+def get_buff_ids_from_json(json_data, config, log):
+    read_buff_ids(json_data['buffMap'], config)
+    return check_buff_ids(config, log)
+
+
 # get stats for this fight from fight_json
 # Input:
 # fight_json = json object including one fight
@@ -129,7 +193,7 @@ def get_stats_from_fight_json(fight_json, config, log):
                 death_time = int(player['combatReplayData']['dead'][0][0] / fight.polling_rate)
                 tag_positions = tag_positions[:death_time]
                 commander_found = True
-    fight.tag_positions_until_death = tag_positions
+    fight.tag_positions_until_death = np.asarray(tag_positions, dtype=np.float64).reshape(-1, 2)
 
     return fight
 
@@ -150,39 +214,57 @@ def get_basic_player_data_from_json(player_json):
 # get the first time the player went down, leading to death and the corresponding time of death, or -1, -1 if they never died
 # Input:
 # player_json: json data with the player info. In a json file as parsed by Elite Insights, one entry of the 'players' list.
-def get_first_down_and_death_time(player_json):
-    first_down_time = -1
-    first_death_time = -1
-    
-    player_deaths = dict(player_json['combatReplayData']['dead'])
-    player_downs = dict(player_json['combatReplayData']['down'])
+# combat_time_index (optional): CombatTimeIndex of the player, see build_combat_time_index
+def get_first_down_and_death_time(player_json, combat_time_index = None):
+    if combat_time_index is None:
+        combat_time_index = build_combat_time_index(player_json)
 
     # find the first player downstate event that lead to death
-    for death_begin, death_end in player_deaths.items():
-        for down_begin, down_end in player_downs.items():
-            if death_begin == down_end:
-                # down times are logged in ms -> divide by 1000
-                first_down_time = down_begin / 1000
-                first_death_time = death_begin / 1000
-                return first_down_time, first_death_time
-    return first_down_time, first_death_time
+    for death_begin, death_end in combat_time_index.deaths:
+        if death_begin in combat_time_index.down_start_by_end:
+            # down times are logged in ms -> divide by 1000
+            first_down_time = combat_time_index.down_start_by_end[death_begin] / 1000
+            first_death_time = death_begin / 1000
+            return first_down_time, first_death_time
+    return -1, -1
+
+
+
+# get the distance to tag at each position given the player and tag positions, as long as both are known
+def get_distances_to_tag(player_positions, tag_positions):
+    player_positions = np.asarray(player_positions, dtype=np.float64).reshape(-1, 2)
+    tag_positions = np.asarray(tag_positions, dtype=np.float64).reshape(-1, 2)
+    num_positions = min(len(player_positions), len(tag_positions))
+    delta = player_positions[:num_positions] - tag_positions[:num_positions]
+    return np.sqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1])
 
 
 
 # get average distance to tag given the player and tag positions
 def get_distance_to_tag(player_positions, tag_positions, inch_to_pixel):
-    player_distances = list()
-    for position,tag_position in zip(player_positions, tag_positions):
-        deltaX = position[0] - tag_position[0]
-        deltaY = position[1] - tag_position[1]
-        player_distances.append(math.sqrt(deltaX * deltaX + deltaY * deltaY))
+    player_distances = get_distances_to_tag(player_positions, tag_positions)
     if len(player_distances) > 0:
-        return (sum(player_distances) / len(player_distances)) / inch_to_pixel
+        # cumsum adds up the distances in order, so the result is the same as with sum()
+        return (np.cumsum(player_distances)[-1].item() / len(player_distances)) / inch_to_pixel
+    else:
+        return -1
+
+
+
+# get average distance to tag of the player in context over the first num_positions positions. The distances are
+# computed once per player and fight and shared by all stats.
+def get_average_distance_to_tag(context, num_positions):
+    if context.cumulative_distances_to_tag is None:
+        player_distances = get_distances_to_tag(context.player_json['combatReplayData']['positions'], context.fight.tag_positions_until_death)
+        # cumsum adds up the distances in order, so the result is the same as with sum()
+        context.cumulative_distances_to_tag = np.cumsum(player_distances)
+    num_positions = min(num_positions, len(context.cumulative_distances_to_tag))
+    if num_positions > 0:
+        return (context.cumulative_distances_to_tag[num_positions - 1].item() / num_positions) / context.fight.inch_to_pixel
     else:
         return -1
     
 
-# TODO treat -1
 # get value of stat from player_json
 # return -1 if stat is not available or cannot be computed; or player was not present in the fight according to the duration_present relevant for the respective stat
 # Input:
@@ -192,391 +274,619 @@ def get_distance_to_tag(player_positions, tag_positions, inch_to_pixel):
 # player_duration_present: the player.duration_present dict for this player, needed for some stat computations
 # config: the config used for top stats computation
 def get_stat_from_player_json(player_json, stat, fight, player_duration_present, config):
-    #######################
-    ### Fight durations ###
-    #######################
-    if stat == 'time_active':
-        if 'activeTimes' not in player_json:
-            config.errors.append("Could not find activeTimes in json to determine time_active.")
-            return -1
-        return round(int(player_json['activeTimes'][0])/1000)
+    context = PlayerFightContext(player_json, fight, player_duration_present, config)
+    return extract_stat(context, stat, get_stat_extractor(stat, config))
+
 
-    if stat == 'time_in_combat':
-        return round(sum_breakpoints(get_combat_time_breakpoints(player_json)) / 1000)
-    
-    if stat == 'time_not_running_back':
-        if fight.tag_positions_until_death == list():
-            config.errors.append("Could not find tag positions to determine time_not_running_back.")
-            return -1
-        if 'combatReplayData' not in player_json or 'dead' not in player_json['combatReplayData'] or 'down' not in player_json['combatReplayData'] or 'statsAll' not in player_json or len(player_json['statsAll']) != 1 or 'distToCom' not in player_json['statsAll'][0]:
-            config.errors.append("json is missing combatReplayData or entries for dead, down, or distToCom to determine time_not_running_back.")
-            return -1
-        player_dist_to_tag = player_json['statsAll'][0]['distToCom']
-        player_positions = player_json['combatReplayData']['positions']
-        player_distances = list()
-        first_down_time, first_death_time = get_first_down_and_death_time(player_json)
-        first_tag_down_time = len(fight.tag_positions_until_death) * fight.polling_rate / 1000
-        
-        # if player didn't go down and die, use time when com died
-        if first_down_time < 0 or first_down_time < first_tag_down_time:
-            first_down_time = first_tag_down_time
-        
-        # check the avg distance to tag until a player died to see if they were running back
-        # if nobody was running back, just use the avg distance as computed by arcdps / EI
-        if first_down_time < len(player_positions) * fight.polling_rate / 1000:
-            first_down_position_index = int(first_down_time * 1000 / fight.polling_rate)
-            player_dist_to_tag = get_distance_to_tag(player_positions[:first_down_position_index], fight.tag_positions_until_death[:first_down_position_index], fight.inch_to_pixel)
-
-        # an average distance of more than 2000 until player or tag died likely means that the player was running back from the beginning
-        if player_dist_to_tag > 2000:
-            #print(f"distance of {player_json['name']} is {player_dist_to_tag}")
-            first_down_time = 0
-
-        # positions are recorded with polling rate in ms -> to get the time, need to multiply by that and divide by 1000
-        return first_down_time
-
-    #############
-    ### group ###
-    #############
-    if stat == 'group':
-        if 'group' not in player_json:
-            config.errors.append("Could not find group in json.")
-            return -1
-        return int(player_json['group'])
 
-    ########################################################
-    ### check that fight duration is valid for this stat ###
-    ########################################################
-    if config.duration_for_averages[stat] not in player_duration_present or player_duration_present[config.duration_for_averages[stat]] <= 0:
+# get value of stat for the player and fight in context, using the extractor of the stat
+# return -1 if stat is not available or cannot be computed; or player was not present in the fight according to the duration_present relevant for the respective stat
+# Each stat is only extracted once per context, so stats that depend on it reuse the value and errors are only reported once.
+# Input:
+# context: PlayerFightContext of the player and fight
+# stat: the stat being considered
+# extractor (optional): StatExtractor of the stat; looked up if not given
+def extract_stat(context, stat, extractor = None):
+    if stat in context.stat_values:
+        return context.stat_values[stat]
+    if extractor is None:
+        extractor = get_stat_extractor(stat, context.config)
+
+    # check that fight duration is valid for this stat
+    value = -1
+    config = context.config
+    if extractor.needs_duration and (config.duration_for_averages[stat] not in context.duration_present or context.duration_present[config.duration_for_averages[stat]] <= 0):
         config.errors.append("Player was not in this fight according to duration_present relevant for stat"+stat+", or duration_present was not computed yet.")
+    elif context.stat_times is None:
+        value = extractor.extract(context, stat)
+    else:
+        # profiling: the time of a stat includes the time for its dependencies if they weren't extracted yet
+        start = time.perf_counter()
+        value = extractor.extract(context, stat)
+        stat_times = context.stat_times.setdefault(stat, [0, 0.])
+        stat_times[0] += 1
+        stat_times[1] += time.perf_counter() - start
+
+    context.stat_values[stat] = value
+    return value
+
+
+
+# TODO treat -1
+#######################
+### Fight durations ###
+#######################
+def get_time_active(context, stat):
+    player_json = context.player_json
+    if 'activeTimes' not in player_json:
+        context.config.errors.append("Could not find activeTimes in json to determine time_active.")
         return -1
-    
-    ################
-    ### cleanses ###
-    ################
-    if stat == 'cleanses':
-        if 'support' not in player_json or len(player_json['support']) != 1 or 'condiCleanse' not in player_json['support'][0]:
-            config.errors.append("Could not find support or an entry for condiCleanse in json.")
-            return -1
-        return int(player_json['support'][0]['condiCleanse'])            
-
-    ##############
-    ### deaths ###
-    ##############
-    if stat == 'deaths':
-        # TODO split by death on tag / off tag
-        if 'defenses' not in player_json or len(player_json['defenses']) != 1 or 'deadCount' not in player_json['defenses'][0]:
-            config.errors.append("Could not find defenses or an entry for deadCount in json.")
-            return -1
-        return int(player_json['defenses'][0]['deadCount'])
+    return round(int(player_json['activeTimes'][0])/1000)
 
 
-    ################
-    ### distance ###
-    ################          
-    if stat == 'dist':
-        if fight.tag_positions_until_death == list():
-            config.errors.append("Could not find tag positions to determine distance to tag.")
-            return -1
-        if 'combatReplayData' not in player_json or 'dead' not in player_json['combatReplayData'] or 'down' not in player_json['combatReplayData'] or 'statsAll' not in player_json or len(player_json['statsAll']) != 1 or 'distToCom' not in player_json['statsAll'][0]:
-            config.errors.append("json is missing  combat replay data or entries for dead, down, or distToCom to determine distance to tag.")
-            return -1
-        # TODO this is hardcoded to not_running_back. make it possible to use active, total or in_combat too?
-        player_dist_to_tag = player_json['statsAll'][0]['distToCom']
-        if config.duration_for_averages[stat] == 'not_running_back':
-            first_down_time = player_duration_present['not_running_back']
-            player_positions = player_json['combatReplayData']['positions']
-
-            # if player or tag died before the fight ended, compute average distance until the first down time that lead to death
-            num_valid_positions = int(first_down_time * 1000 / fight.polling_rate)
-            player_dist_to_tag = get_distance_to_tag(player_positions[:num_valid_positions], fight.tag_positions_until_death[:num_valid_positions], fight.inch_to_pixel)
-        elif config.duration_for_averages[stat] == 'in_combat':
-            config.errors.append("average distance over time in combat is not implemented yet. Using overall average distance instead.")
-        return float(player_dist_to_tag)
-
-    #################
-    ### Dmg Taken ###
-    #################
-    # includes dmg absorbed by barrier
-    if stat == 'dmg_taken_total':
-        if 'defenses' not in player_json or len(player_json['defenses']) != 1 or 'damageTaken' not in player_json['defenses'][0]:
-            config.errors.append("Could not find defenses or an entry for damageTaken in json to determine dmg_taken(_total).")
-            return -1
-        return int(player_json['defenses'][0]['damageTaken'])
+def get_time_in_combat(context, stat):
+    return round(sum_breakpoints(get_combat_time_breakpoints(context.player_json, get_combat_time_index(context))) / 1000)
 
-    if stat == 'dmg_taken_absorbed':
-        if 'defenses' not in player_json or len(player_json['defenses']) != 1 or 'damageBarrier' not in player_json['defenses'][0]:
-            config.errors.append("Could not find defenses or an entry for damageBarrier in json to determine dmg_taken_absorbed.")
-            return -1
-        return int(player_json['defenses'][0]['damageBarrier'])
 
-    if stat == 'dmg_taken_hp_lost':
-        total_dmg_taken = get_stat_from_player_json(player_json, 'dmg_taken_total', fight, player_duration_present, config)
-        dmg_absorbed = get_stat_from_player_json(player_json, 'dmg_taken_absorbed', fight, player_duration_present, config)
-        if total_dmg_taken < 0 or dmg_absorbed < 0:
-            return -1
-        return total_dmg_taken - dmg_absorbed
-
-    #################
-    ### Dmg Dealt ###
-    #################
-    if stat == 'dmg_total':
-        if 'dpsAll' not in player_json or len(player_json['dpsAll']) != 1 or 'damage' not in player_json['dpsAll'][0]:
-            config.errors.append("Could not find dpsAll or an entry for damage in json to determine dmg_total.")
-            return -1
-        return int(player_json['dpsAll'][0]['damage'])  
+def get_time_not_running_back(context, stat):
+    player_json = context.player_json
+    fight = context.fight
+    if len(fight.tag_positions_until_death) == 0:
+        context.config.errors.append("Could not find tag positions to determine time_not_running_back.")
+        return -1
+    if 'combatReplayData' not in player_json or 'dead' not in player_json['combatReplayData'] or 'down' not in player_json['combatReplayData'] or 'statsAll' not in player_json or len(player_json['statsAll']) != 1 or 'distToCom' not in player_json['statsAll'][0]:
+        context.config.errors.append("json is missing combatReplayData or entries for dead, down, or distToCom to determine time_not_running_back.")
+        return -1
+    player_dist_to_tag = player_json['statsAll'][0]['distToCom']
+    player_positions = player_json['combatReplayData']['positions']
+    first_down_time, first_death_time = get_first_down_and_death_time(player_json, get_combat_time_index(context))
+    first_tag_down_time = len(fight.tag_positions_until_death) * fight.polling_rate / 1000
+
+    # if player didn't go down and die, use time when com died
+    if first_down_time < 0 or first_down_time < first_tag_down_time:
+        first_down_time = first_tag_down_time
+
+    # check the avg distance to tag until a player died to see if they were running back
+    # if nobody was running back, just use the avg distance as computed by arcdps / EI
+    if first_down_time < len(player_positions) * fight.polling_rate / 1000:
+        first_down_position_index = int(first_down_time * 1000 / fight.polling_rate)
+        player_dist_to_tag = get_average_distance_to_tag(context, first_down_position_index)
+
+    # an average distance of more than 2000 until player or tag died likely means that the player was running back from the beginning
+    if player_dist_to_tag > 2000:
+        #print(f"distance of {player_json['name']} is {player_dist_to_tag}")
+        first_down_time = 0
+
+    # positions are recorded with polling rate in ms -> to get the time, need to multiply by that and divide by 1000
+    return first_down_time
+
+
+#############
+### group ###
+#############
+def get_group(context, stat):
+    if 'group' not in context.player_json:
+        context.config.errors.append("Could not find group in json.")
+        return -1
+    return int(context.player_json['group'])
 
-    if stat == 'dmg_players':
-        if 'targetDamage1S' not in player_json:
-            config.errors.append("Could not find targetDamage1S in json to determine dmg_players.")
-            return -1
-        return sum(target[0][-1] for target in player_json['targetDamage1S'])
 
-    if stat == 'dmg_other':
-        total_dmg = get_stat_from_player_json(player_json, 'dmg_total', fight, player_duration_present, config)
-        players_dmg = get_stat_from_player_json(player_json, 'dmg_players', fight, player_duration_present, config)
-        if total_dmg < 0 or players_dmg < 0:
-            return -1
-        return total_dmg - players_dmg
+################
+### cleanses ###
+################
+def get_cleanses(context, stat):
+    player_json = context.player_json
+    if 'support' not in player_json or len(player_json['support']) != 1 or 'condiCleanse' not in player_json['support'][0]:
+        context.config.errors.append("Could not find support or an entry for condiCleanse in json.")
+        return -1
+    return int(player_json['support'][0]['condiCleanse'])
 
-    if stat == 'spike_dmg':
-        if 'targetDamage1S' not in player_json:
-            config.errors.append("Could not find targetDamage1S in json to determine spike_dmg.")
-            return -1
-        spike_dmg = -1
-        last_dmg = 0
-        for t in range(len(player_json['targetDamage1S'][0][0])):
-            new_dmg = sum(player_json['targetDamage1S'][enemy][0][t] for enemy in range(len(player_json['targetDamage1S'])))
-            spike_dmg = max(spike_dmg, new_dmg - last_dmg)
-            last_dmg = new_dmg
-        return spike_dmg
-    
-    ##############################
-    ### Kill/Down contribution ###
-    ##############################
 
-    if stat == 'kills':
-        if 'statsAll' not in player_json or len(player_json['statsAll']) == 0 or 'killed' not in player_json['statsAll'][0]:
-            config.errors.append("Could not find statsAll or killed in json to determine number of kills.")
-            return -1
-        return int(player_json['statsAll'][0]['killed'])
+##############
+### deaths ###
+##############
+def get_deaths(context, stat):
+    player_json = context.player_json
+    # TODO split by death on tag / off tag
+    if 'defenses' not in player_json or len(player_json['defenses']) != 1 or 'deadCount' not in player_json['defenses'][0]:
+        context.config.errors.append("Could not find defenses or an entry for deadCount in json.")
+        return -1
+    return int(player_json['defenses'][0]['deadCount'])
+
+
+################
+### distance ###
+################
+def get_dist(context, stat):
+    player_json = context.player_json
+    fight = context.fight
+    config = context.config
+    if len(fight.tag_positions_until_death) == 0:
+        config.errors.append("Could not find tag positions to determine distance to tag.")
+        return -1
+    if 'combatReplayData' not in player_json or 'dead' not in player_json['combatReplayData'] or 'down' not in player_json['combatReplayData'] or 'statsAll' not in player_json or len(player_json['statsAll']) != 1 or 'distToCom' not in player_json['statsAll'][0]:
+        config.errors.append("json is missing  combat replay data or entries for dead, down, or distToCom to determine distance to tag.")
+        return -1
+    # TODO this is hardcoded to not_running_back. make it possible to use active, total or in_combat too?
+    player_dist_to_tag = player_json['statsAll'][0]['distToCom']
+    if config.duration_for_averages[stat] == 'not_running_back':
+        first_down_time = context.duration_present['not_running_back']
+
+        # if player or tag died before the fight ended, compute average distance until the first down time that lead to death
+        num_valid_positions = int(first_down_time * 1000 / fight.polling_rate)
+        player_dist_to_tag = get_average_distance_to_tag(context, num_valid_positions)
+    elif config.duration_for_averages[stat] == 'in_combat':
+        config.errors.append("average distance over time in combat is not implemented yet. Using overall average distance instead.")
+    return float(player_dist_to_tag)
+
+
+#################
+### Dmg Taken ###
+#################
+# includes dmg absorbed by barrier
+def get_dmg_taken_total(context, stat):
+    player_json = context.player_json
+    if 'defenses' not in player_json or len(player_json['defenses']) != 1 or 'damageTaken' not in player_json['defenses'][0]:
+        context.config.errors.append("Could not find defenses or an entry for damageTaken in json to determine dmg_taken(_total).")
+        return -1
+    return int(player_json['defenses'][0]['damageTaken'])
 
-    if stat == 'downs':
-        if 'statsAll' not in player_json or len(player_json['statsAll']) == 0 or 'downed' not in player_json['statsAll'][0]:
-            config.errors.append("Could not find statsAll or downed in json to determine number of downed.")
-            return -1
-        return int(player_json['statsAll'][0]['downed'])
 
-    if stat == 'down_contrib':
-        if 'statsAll' not in player_json or len(player_json['statsAll']) == 0 or 'downContribution' not in player_json['statsAll'][0]:
-            config.errors.append("Could not find statsAll or downed in json to determine down contribution.")
-            return -1
-        return int(player_json['statsAll'][0]['downContribution'])
+def get_dmg_taken_absorbed(context, stat):
+    player_json = context.player_json
+    if 'defenses' not in player_json or len(player_json['defenses']) != 1 or 'damageBarrier' not in player_json['defenses'][0]:
+        context.config.errors.append("Could not find defenses or an entry for damageBarrier in json to determine dmg_taken_absorbed.")
+        return -1
+    return int(player_json['defenses'][0]['damageBarrier'])
 
-    ##################################
-    ### Incoming / Outgoing strips ###
-    ##################################
 
-    if stat == 'strips':
-        if 'support' not in player_json or len(player_json['support']) != 1 or 'boonStrips' not in player_json['support'][0]:
-            config.errors.append("Could not find support or an entry for boonStrips in json to determine strips.")
-            return -1
-        return int(player_json['support'][0]['boonStrips'])
-    
-    if stat == 'stripped':
-        if 'defenses' not in player_json or len(player_json['defenses']) != 1 or 'boonStrips' not in player_json['defenses'][0]:
-            config.errors.append("Could not find defenses or an entry for boonStrips in json to determine stripped.")
-            return -1
-        return int(player_json['defenses'][0]['boonStrips'])
+def get_dmg_taken_hp_lost(context, stat):
+    total_dmg_taken = extract_stat(context, 'dmg_taken_total')
+    dmg_absorbed = extract_stat(context, 'dmg_taken_absorbed')
+    if total_dmg_taken < 0 or dmg_absorbed < 0:
+        return -1
+    return total_dmg_taken - dmg_absorbed
 
-    ################
-    ### Interrupts #
-    ################
 
-    if stat == 'interrupts':
-        if 'statsAll' not in player_json or len(player_json['statsAll']) != 1 or 'interrupts' not in player_json['statsAll'][0]:
-            config.errors.append("Could not find statsAll or an entry for interrupts in json to determine interrupts.")
-            return -1
-        return int(player_json['statsAll'][0]['interrupts'])
-    
-    ######################
-    ### Heal & Barrier ###
-    ######################
-            
-    if stat == 'heal_total':
-        # check if healing was logged, save it
-        if player_json['name'] not in fight.players_running_healing_addon:
-            return -1
-        if 'extHealingStats' not in player_json or 'outgoingHealing' not in player_json['extHealingStats']:
-            config.errors.append("Could not find extHealingStats or an entry for outgoingHealing in json to determine heal_total.")
-            return -1
-        return player_json['extHealingStats']['outgoingHealing'][0]['healing']
+#################
+### Dmg Dealt ###
+#################
+def get_dmg_total(context, stat):
+    player_json = context.player_json
+    if 'dpsAll' not in player_json or len(player_json['dpsAll']) != 1 or 'damage' not in player_json['dpsAll'][0]:
+        context.config.errors.append("Could not find dpsAll or an entry for damage in json to determine dmg_total.")
+        return -1
+    return int(player_json['dpsAll'][0]['damage'])
 
-    if stat == 'heal_players':
-        # check if healing was logged, save it
-        if player_json['name'] not in fight.players_running_healing_addon:
-            return -1
-        if 'extHealingStats' not in player_json or 'alliedHealing1S' not in player_json['extHealingStats']:
-            config.errors.append("Could not find extHealingStats or an entry for alliedHealing1S in json to determine heal_players.")
-            return -1
-        return sum([healing[0][-1] for healing in player_json['extHealingStats']['alliedHealing1S']])
-    
-    if stat == 'heal_other':
-        # check if healing was logged, save it
-        total_heal = get_stat_from_player_json(player_json, 'heal_total', fight, player_duration_present, config)
-        player_heal = get_stat_from_player_json(player_json, 'heal_players', fight, player_duration_present, config)
-        if total_heal < 0 or player_heal < 0:
-            return -1
-        return total_heal - player_heal
 
-    if stat == 'barrier':
-        # check if barrier was logged, save it
-        if player_json['name'] not in fight.players_running_healing_addon:
-            return -1
-        if 'extBarrierStats' not in player_json or 'outgoingBarrier' not in player_json['extBarrierStats']:
-            config.errors.append("Could not find extBarrierStats or an entry for outgoingBarrier in json to determine barrier.")
-            return -1
-        return player_json['extBarrierStats']['outgoingBarrier'][0]['barrier']
-        
-    # TODO fix output for heal from regen
-    if stat == 'heal_from_regen':
-        # check if healing was logged, look for regen
-        if player_json['name'] not in fight.players_running_healing_addon:
-            return -1
-        if 'extHealingStats' not in player_json or 'totalHealingDist' not in player_json['extHealingStats']:
-            config.errors.append("Could not find extHealingStats or an entry for totalHealingDist in json to determine heal_from_regen.")
-            return -1
-        healing_json = player_json['extHealingStats']['totalHealingDist'][0]
-        for healing_json2 in healing_json:
-            if 'id' in healing_json2 and healing_json2['id'] == int(config.squad_buff_ids['regen']):
-                return healing_json2['totalHealing']
-        config.errors.append("Could not find regen in json to determine heal_from_regen.")
-        return -1    
-
-    if stat == 'hits_from_regen':
-        # check if healing was logged, look for regen
-        if player_json['name'] not in fight.players_running_healing_addon:
-            return -1
-        if 'extHealingStats' not in player_json or 'totalHealingDist' not in player_json['extHealingStats']:
-            config.errors.append("Could not find extHealingStats or an entry for totalHealingDist in json to determine hits_from_regen.")
-            return -1
-        healing_json = player_json['extHealingStats']['totalHealingDist'][0]
-        for healing_json2 in healing_json:
-            if 'id' in healing_json2 and healing_json2['id'] == int(config.squad_buff_ids['regen']):
-                return int(healing_json2['hits'])
-        config.errors.append("Could not find regen in json to determine hits_from_regen.")
+def get_dmg_players(context, stat):
+    player_json = context.player_json
+    if 'targetDamage1S' not in player_json:
+        context.config.errors.append("Could not find targetDamage1S in json to determine dmg_players.")
         return -1
+    return sum(target[0][-1] for target in player_json['targetDamage1S'])
 
-    #############
-    ### Auras ###
-    #############
 
-    if 'aura' in stat and stat in config.squad_buff_ids:
-        if 'buffUptimes' not in player_json:
-            config.errors.append("Could not find buffUptimes in json to determine "+stat+".")
-            return -1
-        for buff in player_json['buffUptimes']:
-            if 'id' not in buff:
-                continue
-            # find right buff
-            buffId = buff['id']
-            if buffId == int(config.squad_buff_ids[stat]):
-                if 'buffData' not in buff or len(buff['buffData']) == 0 or 'uptime' not in buff['buffData'][0]:
-                    config.errors.append("Could not find entry for buffData or uptime in json to determine "+stat+".")
-                    return -1
-                return float(buff['buffData'][0]['uptime'])
-        config.errors.append("Could not find the buff "+stat+" in the json. Treating as 0.")
-        return 0.
-    
-    ###################
-    ### Squad Buffs ###
-    ###################
+def get_dmg_other(context, stat):
+    total_dmg = extract_stat(context, 'dmg_total')
+    players_dmg = extract_stat(context, 'dmg_players')
+    if total_dmg < 0 or players_dmg < 0:
+        return -1
+    return total_dmg - players_dmg
 
-    if stat in config.squad_buff_ids:
-        if 'squadBuffs' not in player_json:
-            config.errors.append("Could not find squadBuffs in json to determine "+stat+".")
-            return -1
-        # get buffs in squad generation -> need to loop over all buffs
-        for buff in player_json['squadBuffs']:
-            if 'id' not in buff:
-                continue 
-            # find right buff
-            buffId = buff['id']
-            if buffId == int(config.squad_buff_ids[stat]):
-                if 'buffData' not in buff or len(buff['buffData']) == 0 or 'generation' not in buff['buffData'][0]:
-                    config.errors.append("Could not find entry for buffData or generation in json to determine "+stat+".")
-                    return -1
-                return float(buff['buffData'][0]['generation'])
-
-        config.errors.append("Could not find the buff "+stat+" in the json. Treating as 0.")
-        return 0.
-
-    ##################
-    ### Self Buffs ###
-    ##################
-
-    # for self buffs, only check if they were there (1) or not (0)
-    if stat in config.self_buff_ids:
-        if 'selfBuffs' not in player_json:
-            config.errors.append("Could not find selfBuffs in json to determine "+stat+".")
-            return -1
-        for buff in player_json['selfBuffs']:
-            if 'id' not in buff:
-                continue 
-            # find right buff
-            buffId = buff['id']
-            if buffId == int(config.self_buff_ids[stat]):
-                if 'buffData' not in buff or len(buff['buffData']) == 0 or 'generation' not in buff['buffData'][0]:
-                    config.errors.append("Could not find entry for buffData or generation in json to determine "+stat+".")
-                    return -1
-                return 1
-        config.errors.append("Could not find the buff "+stat+" in the json. Treating as 0.")
+
+def get_spike_dmg(context, stat):
+    player_json = context.player_json
+    if 'targetDamage1S' not in player_json:
+        context.config.errors.append("Could not find targetDamage1S in json to determine spike_dmg.")
+        return -1
+    targets = player_json['targetDamage1S']
+    if len(targets) == 0 or len(targets[0][0]) == 0:
+        return -1
+    # window in seconds within which the damage is summed up
+    window = context.config.spike_dmg_windows.get(stat, 1)
+    # cumulative damage dealt to all targets at each second
+    dmg = np.asarray([target[0] for target in targets]).sum(axis=0)
+    # damage dealt within the window ending at each second
+    window_dmg = dmg.copy()
+    window_dmg[window:] -= dmg[:-window]
+    return window_dmg.max().item()
+
+
+##############################
+### Kill/Down contribution ###
+##############################
+def get_kills(context, stat):
+    player_json = context.player_json
+    if 'statsAll' not in player_json or len(player_json['statsAll']) == 0 or 'killed' not in player_json['statsAll'][0]:
+        context.config.errors.append("Could not find statsAll or killed in json to determine number of kills.")
+        return -1
+    return int(player_json['statsAll'][0]['killed'])
+
+
+def get_downs(context, stat):
+    player_json = context.player_json
+    if 'statsAll' not in player_json or len(player_json['statsAll']) == 0 or 'downed' not in player_json['statsAll'][0]:
+        context.config.errors.append("Could not find statsAll or downed in json to determine number of downed.")
+        return -1
+    return int(player_json['statsAll'][0]['downed'])
+
+
+def get_down_contrib(context, stat):
+    player_json = context.player_json
+    if 'statsAll' not in player_json or len(player_json['statsAll']) == 0 or 'downContribution' not in player_json['statsAll'][0]:
+        context.config.errors.append("Could not find statsAll or downed in json to determine down contribution.")
+        return -1
+    return int(player_json['statsAll'][0]['downContribution'])
+
+
+##################################
+### Incoming / Outgoing strips ###
+##################################
+def get_strips(context, stat):
+    player_json = context.player_json
+    if 'support' not in player_json or len(player_json['support']) != 1 or 'boonStrips' not in player_json['support'][0]:
+        context.config.errors.append("Could not find support or an entry for boonStrips in json to determine strips.")
+        return -1
+    return int(player_json['support'][0]['boonStrips'])
+
+
+def get_stripped(context, stat):
+    player_json = context.player_json
+    if 'defenses' not in player_json or len(player_json['defenses']) != 1 or 'boonStrips' not in player_json['defenses'][0]:
+        context.config.errors.append("Could not find defenses or an entry for boonStrips in json to determine stripped.")
+        return -1
+    return int(player_json['defenses'][0]['boonStrips'])
+
+
+################
+### Interrupts #
+################
+def get_interrupts(context, stat):
+    player_json = context.player_json
+    if 'statsAll' not in player_json or len(player_json['statsAll']) != 1 or 'interrupts' not in player_json['statsAll'][0]:
+        context.config.errors.append("Could not find statsAll or an entry for interrupts in json to determine interrupts.")
+        return -1
+    return int(player_json['statsAll'][0]['interrupts'])
+
+
+######################
+### Heal & Barrier ###
+######################
+def get_heal_total(context, stat):
+    player_json = context.player_json
+    # check if healing was logged, save it
+    if player_json['name'] not in context.fight.players_running_healing_addon:
+        return -1
+    if 'extHealingStats' not in player_json or 'outgoingHealing' not in player_json['extHealingStats']:
+        context.config.errors.append("Could not find extHealingStats or an entry for outgoingHealing in json to determine heal_total.")
+        return -1
+    return player_json['extHealingStats']['outgoingHealing'][0]['healing']
+
+
+def get_heal_players(context, stat):
+    player_json = context.player_json
+    # check if healing was logged, save it
+    if player_json['name'] not in context.fight.players_running_healing_addon:
+        return -1
+    if 'extHealingStats' not in player_json or 'alliedHealing1S' not in player_json['extHealingStats']:
+        context.config.errors.append("Could not find extHealingStats or an entry for alliedHealing1S in json to determine heal_players.")
+        return -1
+    return sum([healing[0][-1] for healing in player_json['extHealingStats']['alliedHealing1S']])
+
+
+def get_heal_other(context, stat):
+    # check if healing was logged, save it
+    total_heal = extract_stat(context, 'heal_total')
+    player_heal = extract_stat(context, 'heal_players')
+    if total_heal < 0 or player_heal < 0:
+        return -1
+    return total_heal - player_heal
+
+
+def get_barrier(context, stat):
+    player_json = context.player_json
+    # check if barrier was logged, save it
+    if player_json['name'] not in context.fight.players_running_healing_addon:
+        return -1
+    if 'extBarrierStats' not in player_json or 'outgoingBarrier' not in player_json['extBarrierStats']:
+        context.config.errors.append("Could not find extBarrierStats or an entry for outgoingBarrier in json to determine barrier.")
+        return -1
+    return player_json['extBarrierStats']['outgoingBarrier'][0]['barrier']
+
+
+# get an index of buff id -> entry for a list of buff entries of a player, like squadBuffs. It is built once per player and fight
+# and shared by all stats using the same list. If a buff id is in the list several times, the first entry is used.
+# Input:
+# context = PlayerFightContext of the player and fight
+# name = name under which the index is stored in the context
+# buffs = list of buff entries in the player's json
+# Output:
+# dict of buff id -> buff entry
+def get_buff_index(context, name, buffs):
+    if name not in context.buff_indices:
+        buff_index = {}
+        for buff in buffs:
+            if 'id' in buff and buff['id'] not in buff_index:
+                buff_index[buff['id']] = buff
+        context.buff_indices[name] = buff_index
+    return context.buff_indices[name]
+
+
+
+# TODO fix output for heal from regen
+def get_heal_from_regen(context, stat):
+    player_json = context.player_json
+    # check if healing was logged, look for regen
+    if player_json['name'] not in context.fight.players_running_healing_addon:
+        return -1
+    if 'extHealingStats' not in player_json or 'totalHealingDist' not in player_json['extHealingStats']:
+        context.config.errors.append("Could not find extHealingStats or an entry for totalHealingDist in json to determine heal_from_regen.")
+        return -1
+    healing_index = get_buff_index(context, 'totalHealingDist', player_json['extHealingStats']['totalHealingDist'][0])
+    healing_json = None
+    if 'regen' in context.config.squad_buff_ids:
+        healing_json = healing_index.get(int(context.config.squad_buff_ids['regen']))
+    if healing_json is not None:
+        return healing_json['totalHealing']
+    context.config.errors.append("Could not find regen in json to determine heal_from_regen.")
+    return -1
+
+
+def get_hits_from_regen(context, stat):
+    player_json = context.player_json
+    # check if healing was logged, look for regen
+    if player_json['name'] not in context.fight.players_running_healing_addon:
+        return -1
+    if 'extHealingStats' not in player_json or 'totalHealingDist' not in player_json['extHealingStats']:
+        context.config.errors.append("Could not find extHealingStats or an entry for totalHealingDist in json to determine hits_from_regen.")
+        return -1
+    healing_index = get_buff_index(context, 'totalHealingDist', player_json['extHealingStats']['totalHealingDist'][0])
+    healing_json = None
+    if 'regen' in context.config.squad_buff_ids:
+        healing_json = healing_index.get(int(context.config.squad_buff_ids['regen']))
+    if healing_json is not None:
+        return int(healing_json['hits'])
+    context.config.errors.append("Could not find regen in json to determine hits_from_regen.")
+    return -1
+
+
+#############
+### Auras ###
+#############
+def get_aura_uptime(context, stat):
+    player_json = context.player_json
+    config = context.config
+    # the buff might not be in this log at all
+    if stat not in config.squad_buff_ids:
+        return 0
+    if 'buffUptimes' not in player_json:
+        config.errors.append("Could not find buffUptimes in json to determine "+stat+".")
+        return -1
+    # find right buff
+    buff = get_buff_index(context, 'buffUptimes', player_json['buffUptimes']).get(int(config.squad_buff_ids[stat]))
+    if buff is not None:
+        if 'buffData' not in buff or len(buff['buffData']) == 0 or 'uptime' not in buff['buffData'][0]:
+            config.errors.append("Could not find entry for buffData or uptime in json to determine "+stat+".")
+            return -1
+        return float(buff['buffData'][0]['uptime'])
+    config.errors.append("Could not find the buff "+stat+" in the json. Treating as 0.")
+    return 0.
+
+
+###################
+### Squad Buffs ###
+###################
+def get_squad_buff_generation(context, stat):
+    player_json = context.player_json
+    config = context.config
+    # the buff might not be in this log at all
+    if stat not in config.squad_buff_ids:
         return 0
+    if 'squadBuffs' not in player_json:
+        config.errors.append("Could not find squadBuffs in json to determine "+stat+".")
+        return -1
+    # find right buff in squad generation
+    buff = get_buff_index(context, 'squadBuffs', player_json['squadBuffs']).get(int(config.squad_buff_ids[stat]))
+    if buff is not None:
+        if 'buffData' not in buff or len(buff['buffData']) == 0 or 'generation' not in buff['buffData'][0]:
+            config.errors.append("Could not find entry for buffData or generation in json to determine "+stat+".")
+            return -1
+        return float(buff['buffData'][0]['generation'])
+    config.errors.append("Could not find the buff "+stat+" in the json. Treating as 0.")
+    return 0.
+
+
+##################
+### Self Buffs ###
+##################
+# for self buffs, only check if they were there (1) or not (0)
+def get_self_buff_present(context, stat):
+    player_json = context.player_json
+    config = context.config
+    # the buff might not be in this log at all
+    if stat not in config.self_buff_ids:
+        return 0
+    if 'selfBuffs' not in player_json:
+        config.errors.append("Could not find selfBuffs in json to determine "+stat+".")
+        return -1
+    # find right buff
+    buff = get_buff_index(context, 'selfBuffs', player_json['selfBuffs']).get(int(config.self_buff_ids[stat]))
+    if buff is not None:
+        if 'buffData' not in buff or len(buff['buffData']) == 0 or 'generation' not in buff['buffData'][0]:
+            config.errors.append("Could not find entry for buffData or generation in json to determine "+stat+".")
+            return -1
+        return 1
+    config.errors.append("Could not find the buff "+stat+" in the json. Treating as 0.")
+    return 0
 
 
-    if stat not in config.self_buff_abbrev.values() and stat not in config.squad_buff_abbrev.values():
-        config.errors.append("Stat ", stat, " is currently not supported! Treating it as 0.")
+def get_unsupported_stat(context, stat):
+    context.config.errors.append("Stat "+stat+" is currently not supported! Treating it as 0.")
     return 0
 
 
+
+# extractor for each stat that isn't a buff. Buff extractors are chosen by get_stat_extractor depending on the type of buff.
+stat_extractors = {
+    'time_active': StatExtractor(get_time_active, [('activeTimes',)], needs_duration = False),
+    'time_in_combat': StatExtractor(get_time_in_combat, [('healthPercents',), ('powerDamage1S',), ('damage1S',), ('activeTimes',), ('combatReplayData', 'dead'), ('combatReplayData', 'down')], needs_duration = False),
+    'time_not_running_back': StatExtractor(get_time_not_running_back, [('statsAll',), ('combatReplayData', 'positions'), ('combatReplayData', 'dead'), ('combatReplayData', 'down')], needs_duration = False),
+    'group': StatExtractor(get_group, [('group',)], needs_duration = False),
+    'cleanses': StatExtractor(get_cleanses, [('support',)]),
+    'deaths': StatExtractor(get_deaths, [('defenses',)]),
+    'dist': StatExtractor(get_dist, [('statsAll',), ('combatReplayData', 'positions'), ('combatReplayData', 'dead'), ('combatReplayData', 'down')]),
+    'dmg_taken_total': StatExtractor(get_dmg_taken_total, [('defenses',)]),
+    'dmg_taken_absorbed': StatExtractor(get_dmg_taken_absorbed, [('defenses',)]),
+    'dmg_taken_hp_lost': StatExtractor(get_dmg_taken_hp_lost, depends_on = ['dmg_taken_total', 'dmg_taken_absorbed']),
+    'dmg_total': StatExtractor(get_dmg_total, [('dpsAll',)]),
+    'dmg_players': StatExtractor(get_dmg_players, [('targetDamage1S',)]),
+    'dmg_other': StatExtractor(get_dmg_other, depends_on = ['dmg_total', 'dmg_players']),
+    'spike_dmg': StatExtractor(get_spike_dmg, [('targetDamage1S',)]),
+    'kills': StatExtractor(get_kills, [('statsAll',)]),
+    'downs': StatExtractor(get_downs, [('statsAll',)]),
+    'down_contrib': StatExtractor(get_down_contrib, [('statsAll',)]),
+    'strips': StatExtractor(get_strips, [('support',)]),
+    'stripped': StatExtractor(get_stripped, [('defenses',)]),
+    'interrupts': StatExtractor(get_interrupts, [('statsAll',)]),
+    'heal_total': StatExtractor(get_heal_total, [('extHealingStats', 'outgoingHealing')]),
+    'heal_players': StatExtractor(get_heal_players, [('extHealingStats', 'alliedHealing1S')]),
+    'heal_other': StatExtractor(get_heal_other, depends_on = ['heal_total', 'heal_players']),
+    'barrier': StatExtractor(get_barrier, [('extBarrierStats', 'outgoingBarrier')]),
+    'heal_from_regen': StatExtractor(get_heal_from_regen, [('extHealingStats', 'totalHealingDist')]),
+    'hits_from_regen': StatExtractor(get_hits_from_regen, [('extHealingStats', 'totalHealingDist')]),
+}
+# json key paths for buffs depend on the type of buff
+aura_json_paths = [('buffUptimes', 'id'), ('buffUptimes', 'buffData')]
+squad_buff_json_paths = [('squadBuffs', 'id'), ('squadBuffs', 'buffData')]
+self_buff_json_paths = [('selfBuffs', 'id'), ('selfBuffs', 'buffData')]
+
+
+
+# get the StatExtractor for a stat
+# Input:
+# stat = the stat being considered
+# config = the config used for top stats computation
+# Output:
+# StatExtractor of the stat
+def get_stat_extractor(stat, config):
+    if stat in stat_extractors:
+        return stat_extractors[stat]
+    if stat in config.spike_dmg_windows:
+        return StatExtractor(get_spike_dmg, [('targetDamage1S',)])
+    if stat in config.squad_buff_abbrev.values():
+        if 'aura' in stat:
+            return StatExtractor(get_aura_uptime, aura_json_paths)
+        return StatExtractor(get_squad_buff_generation, squad_buff_json_paths)
+    if stat in config.self_buff_abbrev.values():
+        return StatExtractor(get_self_buff_present, self_buff_json_paths)
+    return StatExtractor(get_unsupported_stat)
+
+
+
+# get a stat and all stats it depends on, directly or indirectly, such that each stat comes after its dependencies
+# Input:
+# stat = the stat being considered
+# config = the config used for top stats computation
+# Output:
+# list of stats, ending with stat
+def get_stat_dependencies(stat, config, dependent_stats = ()):
+    if stat in dependent_stats:
+        raise ValueError("Stat "+stat+" depends on itself via "+" -> ".join(dependent_stats + (stat,)))
+    dependencies = list()
+    for dependency in get_stat_extractor(stat, config).depends_on:
+        for dependency_stat in get_stat_dependencies(dependency, config, dependent_stats + (stat,)):
+            if dependency_stat not in dependencies:
+                dependencies.append(dependency_stat)
+    dependencies.append(stat)
+    return dependencies
+
+
+
+# get the extractors of all stats to compute. They are only looked up once per config.
+# Input:
+# config = the config used for top stats computation
+# Output:
+# list of (stat, StatExtractor) for all stats in config.stats_to_compute
+def get_stat_extractors(config):
+    if not config.stat_extractors:
+        # make sure the dependencies between stats can be resolved before extracting anything
+        for stat in config.stats_to_compute:
+            get_stat_dependencies(stat, config)
+        config.stat_extractors = [(stat, get_stat_extractor(stat, config)) for stat in config.stats_to_compute]
+    return config.stat_extractors
+
+
+# build the indices for finding the times in combat of a player, so that the start of combat after each death can be
+# found by binary search instead of going through the whole fight again
+# Input:
+# player_json = the json data for this player in this fight
+# Output:
+# CombatTimeIndex of the player
+def build_combat_time_index(player_json):
+    combat_time_index = CombatTimeIndex()
+    if 'healthPercents' in player_json and len(player_json['healthPercents']) > 0:
+        # healthPercents is sorted by time
+        health_percents = np.asarray(player_json['healthPercents'], dtype=np.float64)
+        combat_time_index.health_times = health_percents[:, 0]
+        # the health before the first entry is 100
+        previous_health = np.concatenate(([100.], health_percents[:-1, 1]))
+        combat_time_index.health_drops = np.flatnonzero(health_percents[:, 1] < previous_health)
+    if 'powerDamage1S' in player_json and len(player_json['powerDamage1S']) > 0:
+        power_damage = np.asarray(player_json['powerDamage1S'][0])
+        combat_time_index.power_damage_changes = np.flatnonzero(power_damage[1:] != power_damage[:-1]) + 1
+
+    replay = player_json.get('combatReplayData', {})
+    # deaths and downs are matched as dicts of start -> end, as in the json
+    combat_time_index.deaths = list(dict(replay.get('dead', [])).items())
+    for down_start, down_end in dict(replay.get('down', [])).items():
+        combat_time_index.down_start_by_end.setdefault(down_end, down_start)
+    return combat_time_index
+
+
+
+# get the CombatTimeIndex of the player in this context. It is only built once per player and fight.
+def get_combat_time_index(context):
+    if context.combat_time_index is None:
+        context.combat_time_index = build_combat_time_index(context.player_json)
+    return context.combat_time_index
+
+
+
 # find the first time a player took or dealt damage after initial_time
 # Input:
 # initial_time = check for first time this player was in combat after this time in the fight
 # player_json = the json data for this player in this fight
+# combat_time_index (optional) = CombatTimeIndex of the player, see build_combat_time_index
 # Output:
 # First time the player took or dealt damage after initial_time
-def get_combat_start_from_player_json(initial_time, player_json):
+def get_combat_start_from_player_json(initial_time, player_json, combat_time_index = None):
+    if combat_time_index is None:
+        combat_time_index = build_combat_time_index(player_json)
     start_combat = -1
-    if ('healthPercents' not in player_json or len(player_json['healthPercents']) == 0) and ('powerDamage1S' not in player_json or len(player_json['powerDamage1S']) == 0):
+    if combat_time_index.health_times is None and combat_time_index.power_damage_changes is None:
         return start_combat
     
-    if 'healthPercents' in player_json:
-        last_health_percent = 100
-        for change in player_json['healthPercents']:
-            # look for last timestamp before initial time
-            if change[0] < initial_time:
-                last_health_percent = change[1]
-                continue
-            if change[1] - last_health_percent < 0:
-                # got dmg
-                start_combat = change[0]
-                break
-            last_health_percent = change[1]
+    if combat_time_index.health_times is not None:
+        # first time the health dropped, not counting entries before initial time
+        first_change = np.searchsorted(combat_time_index.health_times, initial_time, side='left')
+        drop = np.searchsorted(combat_time_index.health_drops, first_change, side='left')
+        if drop < len(combat_time_index.health_drops):
+            # got dmg
+            start_combat = player_json['healthPercents'][combat_time_index.health_drops[drop]][0]
         
     # from initial time until end of the fight, check when player dealt (power) dmg the first time
     # not using condi, because condis can still tick after a player died
-    if 'powerDamage1S' in player_json and len(player_json['powerDamage1S']) > 0:
-        for i in range(math.ceil(initial_time/1000), len(player_json['powerDamage1S'][0])):
-            if i == 0:
-                continue
-            if player_json['powerDamage1S'][0][i] != player_json['powerDamage1S'][0][i-1]:
-                if start_combat == -1:
-                    # if start_combat is -1 so far, the player didn't take damage until now -> this is the start of combat
-                    start_combat = i*1000
-                else:
-                    # otherwise he took dmg, check which was first
-                    start_combat = min(start_combat, i*1000)
-                break
+    if combat_time_index.power_damage_changes is not None:
+        change = np.searchsorted(combat_time_index.power_damage_changes, math.ceil(initial_time/1000), side='left')
+        if change < len(combat_time_index.power_damage_changes):
+            first_dmg_time = int(combat_time_index.power_damage_changes[change]) * 1000
+            if start_combat == -1:
+                # if start_combat is -1 so far, the player didn't take damage until now -> this is the start of combat
+                start_combat = first_dmg_time
+            else:
+                # otherwise he took dmg, check which was first
+                start_combat = min(start_combat, first_dmg_time)
 
     if start_combat == -1:
         start_combat = initial_time
@@ -587,10 +897,13 @@ def get_combat_start_from_player_json(initial_time, player_json):
 # find the combat breakpoints, i.e., start and end points of this player being in combat (interrupted by death)
 # Input:
 # player_json = the json data for this player in this fight
+# combat_time_index (optional) = CombatTimeIndex of the player, see build_combat_time_index
 # Output:
 # List of start and end timestamps of the player being in combat
-def get_combat_time_breakpoints(player_json):
-    start_combat = get_combat_start_from_player_json(0, player_json)
+def get_combat_time_breakpoints(player_json, combat_time_index = None):
+    if combat_time_index is None:
+        combat_time_index = build_combat_time_index(player_json)
+    start_combat = get_combat_start_from_player_json(0, player_json, combat_time_index)
     end_combat = (len(player_json['damage1S'][0]))*1000
     if 'combatReplayData' not in player_json:
         print("WARNING: combatReplayData not in json, using activeTimes as time in combat")
@@ -601,16 +914,12 @@ def get_combat_time_breakpoints(player_json):
         return [start_combat, end_combat]
 
     breakpoints = []
-    playerDeaths = dict(replay['dead'])
-    playerDowns = dict(replay['down'])
     # need corresponding down event for each death event. down end = death start
-    for deathStart, deathEnd in playerDeaths.items():
-        for downStart, downEnd in playerDowns.items():
-            if deathStart == downEnd:
-                if start_combat != -1:
-                    breakpoints.append([start_combat, deathStart])
-                start_combat = get_combat_start_from_player_json(deathEnd + 1000, player_json)
-                break
+    for death_start, death_end in combat_time_index.deaths:
+        if death_start in combat_time_index.down_start_by_end:
+            if start_combat != -1:
+                breakpoints.append([start_combat, death_start])
+            start_combat = get_combat_start_from_player_json(death_end + 1000, player_json, combat_time_index)
     if start_combat != -1 and start_combat < end_combat:
         breakpoints.append([start_combat, end_combat])
 
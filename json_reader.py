@@ -0,0 +1,647 @@
+#!/usr/bin/env python3
+
+#    json_reader.py contains tools for reading json files as written by Elite Insights.
+#    Copyright (C) 2021 Freya Fleckenstein
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import codecs
+import contextlib
+import glob
+import gzip
+import io
+import json
+import mmap
+import os
+import re
+import tarfile
+import time
+import zipfile
+from json.decoder import JSONDecodeError, WHITESPACE, scanstring
+
+from json_helper import get_json_paths
+
+# faster json decoders are used if they are installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+decoder = json.JSONDecoder()
+
+# json decoding backends in the order in which they are chosen by 'auto'
+json_backends = ['orjson', 'simdjson', 'stdlib']
+
+
+# build a projection from a list of key paths. A projection is a nested dict of key -> projection for the value of
+# this key, where True means the whole value is kept. Lists are passed through, i.e. the projection of a list
+# applies to all of its entries.
+# Input:
+# paths = list of key paths (tuples of keys)
+# Output:
+# projection containing all paths
+def get_projection_from_paths(paths):
+    projection = {}
+    for path in paths:
+        node = projection
+        for key in path[:-1]:
+            if node.get(key) is True:
+                # the whole value is kept anyway
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[path[-1]] = True
+    return projection
+
+
+
+# get the projection of the json data needed for computing the top stats with this config
+# Input:
+# config = the config to use for top stat computation
+# Output:
+# projection, see get_projection_from_paths
+def get_json_projection(config):
+    return get_projection_from_paths(get_json_paths(config))
+
+
+
+# number of characters of a json document that are read at once by the stdlib decoder, see JsonChunks
+chunk_size = 1 << 20
+
+# patterns for skipping json values that are not needed without decoding them. container_content matches the content
+# of an array or object up to its next bracket that isn't part of a string or of a nested array or object at most
+# three levels deep, so most discarded values are skipped in one match.
+string_pattern = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+no_string_or_bracket_pattern = r'[^"\[\]{}]*'
+brackets = ('[', ']', '{', '}')
+
+def get_container_content_pattern(max_depth):
+    content = no_string_or_bracket_pattern + '(?:' + string_pattern + no_string_or_bracket_pattern + ')*'
+    for depth in range(max_depth):
+        container = r'\[' + content + r'\]|\{' + content + r'\}'
+        content = no_string_or_bracket_pattern + '(?:(?:' + string_pattern + '|' + container + ')' + no_string_or_bracket_pattern + ')*'
+    return re.compile(content)
+
+container_content = get_container_content_pattern(3)
+number_continuation = re.compile(r'[-+.eE0-9]*')
+scalar_value = re.compile(string_pattern + r'|[^"\s,\]}]+')
+
+
+
+# This class holds the part of a json document that is being decoded by decode_projected. The document is read in
+# chunks, and the part before the value being decoded is dropped, so only about one chunk of text and the largest kept
+# value are in memory instead of the whole document. Positions in errors are relative to the text held at that time.
+class JsonChunks:
+    def __init__(self, read):
+        self.read = read                # function returning the next given number of characters of the document, "" at its end
+        self.text = ""                  # the part of the document read and not dropped yet
+        self.is_complete = False        # was the end of the document read?
+
+
+    # read more of the document, as much as is held already, so a large value only needs a few attempts to decode
+    # Output:
+    # False if the whole document was read already
+    def extend(self):
+        if self.is_complete:
+            return False
+        chunk = self.read(max(chunk_size, len(self.text)))
+        self.is_complete = not chunk
+        self.text += chunk
+        return not self.is_complete
+
+
+    # drop the text before idx once it gets short, and read the next chunk, so the following values are usually
+    # complete when they are decoded
+    # Output:
+    # index in the new text
+    def advance(self, idx):
+        if self.is_complete or len(self.text) - idx >= chunk_size // 2:
+            return idx
+        chunk = self.read(chunk_size)
+        self.is_complete = not chunk
+        self.text = self.text[idx:] + chunk
+        return 0
+
+
+
+# match a pattern at idx, reading more of the document if the match reaches the end of the text read so far
+def match_complete(chunks, pattern, idx):
+    while True:
+        match = pattern.match(chunks.text, idx)
+        if (match is not None and match.end() < len(chunks.text)) or not chunks.extend():
+            return match
+
+
+
+# skip the whitespace starting at idx
+# Output:
+# index of the next character that isn't whitespace
+def skip_whitespace(chunks, idx):
+    return match_complete(chunks, WHITESPACE, idx).end()
+
+
+
+# decode the json value starting at idx completely, reading more of the document if it isn't read completely yet
+# Output:
+# decoded value, index after the value
+def decode_value(chunks, idx):
+    while True:
+        try:
+            value, end = decoder.raw_decode(chunks.text, idx)
+        except JSONDecodeError:
+            if chunks.extend():
+                continue
+            raise
+        # a number could continue in the next chunk, e.g. 1.5 could be cut off as 1.
+        if number_continuation.match(chunks.text, end).end() < len(chunks.text) or not chunks.extend():
+            return value, end
+
+
+
+# decode the key string starting at idx
+# Output:
+# key, index after the key
+def decode_key(chunks, idx):
+    while True:
+        try:
+            return scanstring(chunks.text, idx + 1)
+        except JSONDecodeError:
+            if not chunks.extend():
+                raise
+
+
+
+# skip the json value starting at idx without decoding it. The value is only checked for where it ends.
+# Output:
+# index after the value
+def skip_value(chunks, idx):
+    if chunks.text[idx:idx+1] not in ('[', '{'):
+        match = match_complete(chunks, scalar_value, idx)
+        if match is None:
+            raise JSONDecodeError("Expecting value", chunks.text, idx)
+        return match.end()
+
+    depth = 0
+    while True:
+        if chunks.text[idx] in ('[', '{'):
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return idx + 1
+        # the content of an array or object ends at a bracket, unless the text read so far ends before
+        while True:
+            end = container_content.match(chunks.text, idx + 1).end()
+            if chunks.text[end:end+1] in brackets:
+                break
+            if not chunks.extend():
+                raise JSONDecodeError("Unterminated array or object", chunks.text, idx)
+        idx = end
+
+
+
+# decode the json value starting at idx, only building the parts described by projection.
+# Values that are not in the projection are skipped without building them, see skip_value.
+# Input:
+# chunks = JsonChunks of the document
+# idx = index of the first character of the value in chunks.text
+# projection = projection of the value, see get_projection_from_paths
+# Output:
+# decoded value, index after the value in chunks.text
+def decode_projected(chunks, idx, projection):
+    if projection is True:
+        return decode_value(chunks, idx)
+
+    char = chunks.text[idx:idx+1]
+    if char == '{':
+        result = {}
+        idx = skip_whitespace(chunks, idx + 1)
+        if chunks.text[idx:idx+1] == '}':
+            return result, idx + 1
+        while True:
+            if chunks.text[idx:idx+1] != '"':
+                raise JSONDecodeError("Expecting property name enclosed in double quotes", chunks.text, idx)
+            key, idx = decode_key(chunks, idx)
+            idx = skip_whitespace(chunks, idx)
+            if chunks.text[idx:idx+1] != ':':
+                raise JSONDecodeError("Expecting ':' delimiter", chunks.text, idx)
+            idx = skip_whitespace(chunks, idx + 1)
+            if key in projection:
+                result[key], idx = decode_projected(chunks, idx, projection[key])
+            else:
+                # not needed
+                idx = skip_value(chunks, idx)
+            idx = skip_whitespace(chunks, chunks.advance(idx))
+            char = chunks.text[idx:idx+1]
+            if char == '}':
+                return result, idx + 1
+            if char != ',':
+                raise JSONDecodeError("Expecting ',' delimiter", chunks.text, idx)
+            idx = skip_whitespace(chunks, idx + 1)
+
+    if char == '[':
+        result = []
+        idx = skip_whitespace(chunks, idx + 1)
+        if chunks.text[idx:idx+1] == ']':
+            return result, idx + 1
+        while True:
+            value, idx = decode_projected(chunks, idx, projection)
+            result.append(value)
+            idx = skip_whitespace(chunks, chunks.advance(idx))
+            char = chunks.text[idx:idx+1]
+            if char == ']':
+                return result, idx + 1
+            if char != ',':
+                raise JSONDecodeError("Expecting ',' delimiter", chunks.text, idx)
+            idx = skip_whitespace(chunks, idx + 1)
+
+    # any other value is kept as is
+    return decode_value(chunks, idx)
+
+
+
+# get a function that reads the next given number of characters of a utf-8 encoded json document
+# Input:
+# read_bytes = function returning the next given number of bytes of the document, b'' at its end
+def get_text_reader(read_bytes):
+    utf8_decoder = codecs.getincrementaldecoder('utf-8')()
+    def read(size):
+        data = read_bytes(size)
+        return utf8_decoder.decode(data, final = not data)
+    return read
+
+
+
+# get a function that reads the next given number of bytes of a bytes-like object, e.g., a memory-mapped file
+def get_bytes_reader(data):
+    position = 0
+    def read(size):
+        nonlocal position
+        # copied, so no views of data are left when it is closed
+        chunk = bytes(data[position:position+size])
+        position += len(chunk)
+        return chunk
+    return read
+
+
+
+# decode a json document that is read in chunks, only building the parts described by projection
+# Input:
+# read = function returning the next given number of characters of the document, see JsonChunks
+# projection = projection of the document, see get_projection_from_paths
+# Output:
+# decoded json data
+def decode_document(read, projection):
+    chunks = JsonChunks(read)
+    idx = skip_whitespace(chunks, chunks.advance(0))
+    json_data, idx = decode_projected(chunks, idx, projection)
+    if skip_whitespace(chunks, idx) != len(chunks.text):
+        raise JSONDecodeError("Extra data", chunks.text, idx)
+    return json_data
+
+
+
+# decode a json document, only building the parts described by projection. The document is decoded in chunks, so it
+# is never held as one string.
+# Input:
+# data = json document as string, or utf-8 encoded as bytes or any other buffer, e.g., a memory-mapped file
+# projection = projection of the document, see get_projection_from_paths. If None, the whole document is decoded.
+# Output:
+# decoded json data
+def loads_projected(data, projection):
+    if projection is None:
+        return json.loads(data if isinstance(data, (str, bytes, bytearray)) else bytes(data))
+    if isinstance(data, str):
+        return decode_document(io.StringIO(data).read, projection)
+    return decode_document(get_text_reader(get_bytes_reader(data)), projection)
+
+
+
+# read a utf-8 encoded json document from a binary file in chunks, only building the parts described by projection
+# Input:
+# json_file = file opened in binary mode, e.g., a GzipFile
+# projection = projection of the document, see get_projection_from_paths. If None, the whole document is decoded.
+# Output:
+# decoded json data
+def load_projected(json_file, projection):
+    if projection is None:
+        return json.load(json_file)
+    return decode_document(get_text_reader(json_file.read), projection)
+
+
+
+# only keep the parts of already decoded json data that are described by projection
+# Input:
+# json_data = decoded json data
+# projection = projection of the data, see get_projection_from_paths. If None, everything is kept.
+# Output:
+# projected json data
+def apply_projection(json_data, projection):
+    if projection is None or projection is True:
+        return json_data
+    if isinstance(json_data, dict):
+        return {key: apply_projection(value, projection[key]) for key, value in json_data.items() if key in projection}
+    if isinstance(json_data, list):
+        return [apply_projection(value, projection) for value in json_data]
+    return json_data
+
+
+
+# convert the parts of a document parsed by simdjson that are described by projection to python objects. simdjson
+# only parses the document into its own buffer, so the other parts are never built as python objects.
+# Input:
+# json_data = simdjson Object, Array or a python value for scalars
+# projection = projection of the data, see get_projection_from_paths. If None, everything is kept.
+# Output:
+# projected json data
+def convert_simdjson_projected(json_data, projection):
+    if isinstance(json_data, simdjson.Object):
+        if projection is None or projection is True:
+            return json_data.as_dict()
+        # items() would convert all values
+        return {key: convert_simdjson_projected(json_data[key], projection[key]) for key in json_data.keys() if key in projection}
+    if isinstance(json_data, simdjson.Array):
+        if projection is None or projection is True:
+            return json_data.as_list()
+        return [convert_simdjson_projected(value, projection) for value in json_data]
+    return json_data
+
+
+
+# get the json decoding backend to use
+# Input:
+# name = 'auto' for the fastest installed backend, or one of json_backends
+# Output:
+# name of the backend; raises ValueError if it is unknown or not installed
+def get_json_backend(name):
+    is_installed = {'orjson': orjson is not None, 'simdjson': simdjson is not None, 'stdlib': True}
+    installed = [backend for backend in json_backends if is_installed[backend]]
+    if name == 'auto':
+        return installed[0]
+    if name not in json_backends:
+        raise ValueError("Unknown json backend "+name+", use one of "+", ".join(['auto'] + json_backends))
+    if name not in installed:
+        raise ValueError("json backend "+name+" is not installed")
+    return name
+
+
+
+# decode a json document with the given backend, only keeping the parts described by projection
+# Input:
+# data = json document as bytes or any other buffer, e.g., a memory-mapped file
+# projection = projection of the document, see get_projection_from_paths. If None, everything is kept.
+# backend = json backend, see get_json_backend
+# Output:
+# decoded json data
+def loads_json(data, projection = None, backend = 'auto'):
+    backend = get_json_backend(backend)
+    if backend == 'orjson':
+        # decodes everything, the parts that are not needed are freed right away
+        return apply_projection(orjson.loads(data), projection)
+    if backend == 'simdjson':
+        return convert_simdjson_projected(simdjson.Parser().parse(data), projection)
+    return loads_projected(data, projection)
+
+
+
+# file endings of logs and of archives containing logs
+log_file_endings = ('.json', '.json.gz')
+zip_file_endings = ('.zip',)
+tar_file_endings = ('.tar', '.tar.gz', '.tgz')
+
+# the archive opened last in this process as (path, ZipFile or TarFile), see get_archive
+open_archive = None
+
+
+
+# is this the name of a log file? Output files of the top stats parser are no logs.
+def is_log_file(filename):
+    return filename.endswith(log_file_endings) and "top_stats" not in os.path.basename(filename)
+
+
+
+# is this the name of an archive that may contain logs?
+def is_archive_file(filename):
+    return filename.endswith(zip_file_endings) or filename.endswith(tar_file_endings)
+
+
+
+# get the log files in an archive
+# Input:
+# archive_path = path of a zip or tar archive
+# Output:
+# list of (file path, file name) sorted by member name, where the file path is (archive path, member name) and the
+# file name is the archive name followed by the member name
+def get_log_files_in_archive(archive_path):
+    archive = get_archive(archive_path)
+    if isinstance(archive, zipfile.ZipFile):
+        members = [info.filename for info in archive.infolist() if not info.is_dir()]
+    else:
+        members = [info.name for info in archive.getmembers() if info.isfile()]
+    archive_name = os.path.basename(archive_path)
+    return [((archive_path, member), archive_name+"/"+member) for member in sorted(members) if is_log_file(member)]
+
+
+
+# is the file at file_path at least min_age s old, i.e., was it not changed during the last min_age s?
+def is_file_complete(file_path, min_age):
+    if min_age <= 0:
+        return True
+    try:
+        return time.time() - os.path.getmtime(file_path) >= min_age
+    except OSError:
+        # removed in the meantime
+        return False
+
+
+
+# get the log files to parse
+# Input:
+# input_path = directory containing logs and/or archives of logs, or a single archive
+# min_age (optional) = skip logs and archives that were changed during the last min_age s, since they may still be written
+# Output:
+# list of (file path, file name) in the order in which the fights should be numbered. Logs in archives are
+# sorted by member name and take the place of their archive in the sorted directory.
+def get_log_files(input_path, min_age = 0):
+    log_files = list()
+    if os.path.isfile(input_path):
+        if is_file_complete(input_path, min_age):
+            log_files = get_log_files_in_archive(input_path)
+    else:
+        for filename in sorted(os.listdir(input_path)):
+            file_path = "".join((input_path,"/",filename))
+            if not (is_log_file(filename) or is_archive_file(filename)) or not is_file_complete(file_path, min_age):
+                continue
+            if is_log_file(filename):
+                log_files.append((file_path, filename))
+            else:
+                log_files.extend(get_log_files_in_archive(file_path))
+    # worker processes for parallel extraction must not share the file position of an archive opened here
+    close_archive()
+    return log_files
+
+
+
+# get the inputs given on the command line, expanding glob patterns
+# Input:
+# patterns = list of directories or archives of logs, or glob patterns matching them
+# Output:
+# list of directories and archives in the given order, the matches of each pattern sorted by name. Matches of
+# patterns that are neither directories nor archives are left out, inputs that don't exist are kept.
+def get_input_paths(patterns):
+    input_paths = list()
+    for pattern in patterns:
+        if glob.escape(pattern) == pattern:
+            matches = [pattern]
+        else:
+            matches = [match for match in sorted(glob.glob(pattern)) if os.path.isdir(match) or is_archive_file(match)]
+        for match in matches:
+            if match not in input_paths:
+                input_paths.append(match)
+    return input_paths
+
+
+
+# get an open archive. The archive opened last stays open, so consecutive members of one archive don't need to read
+# its index again. tar.gz archives can't be accessed randomly, but reading their members in the order in which they
+# are stored only needs to decompress the archive once.
+# Input:
+# archive_path = path of a zip or tar archive
+# Output:
+# ZipFile or TarFile
+def get_archive(archive_path):
+    global open_archive
+    if open_archive is not None and open_archive[0] == archive_path:
+        return open_archive[1]
+    close_archive()
+    if archive_path.endswith(zip_file_endings):
+        archive = zipfile.ZipFile(archive_path)
+    else:
+        archive = tarfile.open(archive_path)
+    open_archive = (archive_path, archive)
+    return archive
+
+
+
+# close the archive that was kept open by get_archive, if any
+def close_archive():
+    global open_archive
+    if open_archive is not None:
+        open_archive[1].close()
+        open_archive = None
+
+
+
+# open a file in an archive for reading
+# Input:
+# archive_path = path of a zip or tar archive
+# member = name of the file in the archive
+# Output:
+# file object in binary mode
+def open_archive_member(archive_path, member):
+    archive = get_archive(archive_path)
+    if isinstance(archive, zipfile.ZipFile):
+        return archive.open(member)
+    return archive.extractfile(member)
+
+
+
+# read the content of a file in an archive, see open_archive_member
+# Output:
+# content as bytes
+def read_archive_member(archive_path, member):
+    with open_archive_member(archive_path, member) as member_file:
+        return member_file.read()
+
+
+
+# open a json file as written by Elite Insights for reading, decompressing it while it is read if it is gzipped
+# Input:
+# file_path = path of the file, or (archive path, member name) for a log in an archive
+# Output:
+# context manager giving a file object in binary mode
+@contextlib.contextmanager
+def open_log_file(file_path):
+    is_archive_member = isinstance(file_path, tuple)
+    with open_archive_member(*file_path) if is_archive_member else open(file_path, 'rb') as log_file:
+        if (file_path[1] if is_archive_member else file_path).endswith('.gz'):
+            with gzip.GzipFile(fileobj = log_file) as gzip_file:
+                yield gzip_file
+        else:
+            yield log_file
+
+
+
+# decompress gzipped data into one buffer. Its size is taken from the gzip trailer, so the decompressed data is never
+# held twice, as it would be when joining the decompressed chunks.
+# Input:
+# compressed_file = seekable file object in binary mode with the gzipped data
+# Output:
+# decompressed data as bytearray
+def read_gzip(compressed_file):
+    # the trailer holds the size modulo 2**32 of the last member only, so more data may follow. Deflate compresses at
+    # most 1032:1, which limits the size given by a broken trailer.
+    compressed_size = compressed_file.seek(0, os.SEEK_END)
+    compressed_file.seek(max(compressed_size - 4, 0))
+    size = min(int.from_bytes(compressed_file.read(4), 'little'), compressed_size * 1032)
+    compressed_file.seek(0)
+    data = bytearray(size)
+    position = 0
+    with gzip.GzipFile(fileobj = compressed_file) as gzip_file:
+        view = memoryview(data)
+        while position < size:
+            num_read = gzip_file.readinto(view[position:position+chunk_size])
+            if not num_read:
+                break
+            position += num_read
+        view.release()
+        del data[position:]
+        data += gzip_file.read()
+    return data
+
+
+
+# load a json file as written by Elite Insights, optionally gzipped. The stdlib backend decodes the file while it is
+# read, so it is never held in memory as a whole. For the other backends, plain files are memory-mapped and decoded
+# directly from the mapping, and gzipped files are decompressed into one buffer, see read_gzip.
+# Input:
+# file_path = path of the file, or (archive path, member name) for a log in an archive
+# projection = projection of the json data to keep, see get_projection_from_paths. If None, everything is kept.
+# backend = json backend to use, see get_json_backend
+# Output:
+# json data
+def load_json_file(file_path, projection = None, backend = 'auto'):
+    backend = get_json_backend(backend)
+    if backend == 'stdlib':
+        with open_log_file(file_path) as json_file:
+            return load_projected(json_file, projection)
+    if isinstance(file_path, tuple):
+        data = read_archive_member(*file_path)
+        if file_path[1].endswith('.gz'):
+            data = read_gzip(io.BytesIO(data))
+        return loads_json(data, projection, backend)
+    if file_path.endswith('.gz'):
+        with open(file_path, 'rb') as compressed_file:
+            return loads_json(read_gzip(compressed_file), projection, backend)
+    with open(file_path, 'rb') as json_datafile:
+        if os.fstat(json_datafile.fileno()).st_size == 0:
+            # empty files can't be mapped
+            return loads_json(b'', projection, backend)
+        with mmap.mmap(json_datafile.fileno(), 0, access = mmap.ACCESS_READ) as mapped_file, memoryview(mapped_file) as data:
+            return loads_json(data, projection, backend)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+#    log_cache.py contains an on-disk cache for the stats extracted from arcdps logs as parsed by Elite Insights.
+#    Copyright (C) 2021 Freya Fleckenstein
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import hashlib
+import os
+import os.path
+import pickle
+
+# increase whenever the data stored in an ExtractedLog changes, so old cache entries are not used anymore
+cache_version = 2
+
+
+# get a hash of all config fields that influence the stats extracted from a single log
+# Input:
+# config = the config to use for top stats computation
+# Output:
+# hex string of the hash
+def get_config_hash(config):
+    relevant_fields = [cache_version,
+                       config.stats_to_compute,
+                       sorted(config.duration_for_averages.items()),
+                       sorted(config.spike_dmg_windows.items()),
+                       config.min_allied_players, config.min_fight_duration, config.min_enemy_players,
+                       sorted(config.squad_buff_abbrev.items()),
+                       sorted(config.self_buff_abbrev.items()),
+                       config.log_level]
+    return hashlib.sha256(repr(relevant_fields).encode('utf-8')).hexdigest()
+
+
+
+# This class stores the ExtractedLog of each log file on disk, so logs don't need to be parsed again in the next run.
+# A log file is identified by its path, size and modification time together with the relevant parts of the config.
+# The cache is limited to max_size bytes; if it gets larger, the least recently used entries are removed.
+class LogCache:
+    def __init__(self, cache_directory, max_size, config):
+        self.cache_directory = cache_directory
+        self.max_size = max_size
+        self.config_hash = get_config_hash(config)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(cache_directory) if entry.name.endswith('.pickle'))
+
+
+    # get the path of the cache entry for this log file
+    def get_entry_path(self, file_path):
+        # logs in archives are identified by the archive and their name in it
+        member = ""
+        if isinstance(file_path, tuple):
+            file_path, member = file_path
+        file_stat = os.stat(file_path)
+        identity = "|".join((os.path.abspath(file_path), member, str(file_stat.st_size), str(file_stat.st_mtime_ns), self.config_hash))
+        return os.path.join(self.cache_directory, hashlib.sha256(identity.encode('utf-8')).hexdigest()+".pickle")
+
+
+    # get the ExtractedLog of this log file, or None if it is not in the cache
+    def get(self, file_path):
+        entry_path = self.get_entry_path(file_path)
+        try:
+            with open(entry_path, 'rb') as entry_file:
+                extracted = pickle.load(entry_file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+            self.misses += 1
+            return None
+        # mark as recently used
+        os.utime(entry_path)
+        self.hits += 1
+        return extracted
+
+
+    # store the ExtractedLog of this log file
+    def put(self, file_path, extracted):
+        entry_path = self.get_entry_path(file_path)
+        tmp_path = entry_path+".tmp"
+        with open(tmp_path, 'wb') as entry_file:
+            pickle.dump(extracted, entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+        # replacing makes sure no partially written entries are read by concurrent runs
+        os.replace(tmp_path, entry_path)
+        self.size += os.path.getsize(entry_path)
+        if self.size > self.max_size:
+            self.evict()
+
+
+    # remove the least recently used entries until the cache is smaller than max_size
+    def evict(self):
+        entries = [entry for entry in os.scandir(self.cache_directory) if entry.name.endswith('.pickle')]
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        self.size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.size <= self.max_size:
+                break
+            self.size -= entry.stat().st_size
+            os.remove(entry.path)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+#    merge_state_files.py combines the state files of top stats computed separately for consecutive sets of logs.
+#    Copyright (C) 2021 Freya Fleckenstein
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import importlib
+import os
+import sys
+
+from parse_top_stats_tools import *
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='This merges the state files written by parse_top_stats_detailed.py with --append for different sets of logs, e.g., computed on different machines, into one state file. The merged top stats are the same as if all logs had been parsed in one run. Use the merged state file with parse_top_stats_detailed.py --append --state_file to write the top stats.')
+    parser.add_argument('output_file', help='State file to write the merged state to')
+    parser.add_argument('state_files', nargs='+', help='State files to merge, in the order of their fights')
+    parser.add_argument('-c', '--config_file', dest="config_file", help="Config file with all the settings; has to be the one used for writing the state files", default="parser_config_detailed")
+    args = parser.parse_args()
+
+    parser_config = importlib.import_module("parser_configs."+args.config_file , package=None)
+    # messages are printed anyway, there is no log file
+    log = open(os.devnull, "w")
+    config = fill_config(parser_config, log)
+
+    merged_state = AggregateState()
+    for state_file in args.state_files:
+        state = load_state(state_file, config, log, "stopping")
+        if state is None:
+            sys.exit(1)
+        # their fights would be counted twice
+        duplicate_files = set(merged_state.processed_files).intersection(state.processed_files)
+        if duplicate_files:
+            print("Error: "+state_file+" contains logs that are already in an earlier state file: "+", ".join(sorted(duplicate_files)))
+            sys.exit(1)
+        merge_states(merged_state, state, config)
+        print("Merged "+str(len(state.fights))+" fights from "+state_file)
+
+    save_state(args.output_file, merged_state.processed_files, merged_state.players, merged_state.player_index, merged_state.account_index, merged_state.fights, merged_state.found_all_buff_ids, merged_state.found_healing, merged_state.found_barrier, config)
+    print("Wrote "+str(len(merged_state.fights))+" fights to "+args.output_file)
@@ -23,39 +23,254 @@ from os import listdir
 import sys
 from enum import Enum
 import importlib
-import openpyxl
+import copy
+import time
+from datetime import date
 
 from parse_top_stats_tools import *
 from io_helper import *
+from json_reader import is_archive_file, zip_file_endings, tar_file_endings, json_backends, get_json_backend, get_input_paths, get_log_files
+
+# get the prefix of the output files for an input: output files are written to the input directory, or next to the
+# input archive with the archive name as prefix
+# Input:
+# input_path = directory or archive of logs
+# Output:
+# prefix of the output file names, or None if the input is neither a directory nor an archive
+def get_output_prefix(input_path):
+    if os.path.isdir(input_path):
+        return input_path+"/"
+    if os.path.isfile(input_path) and is_archive_file(input_path):
+        archive_ending = next(ending for ending in zip_file_endings + tar_file_endings if input_path.endswith(ending))
+        return input_path[:-len(archive_ending)]+"_"
+    return None
+
+
+
+# set the names of all output files that were not given on the command line
+# Input:
+# args = cmd line arguments, changed in place
+# output_prefix = prefix of the output file names, see get_output_prefix
+def set_default_output_filenames(args, output_prefix):
+    if args.xls_output_filename is None:
+        args.xls_output_filename = output_prefix+"top_stats_detailed.xlsx"
+    if args.json_output_filename is None:
+        args.json_output_filename = output_prefix+"top_stats_detailed.json"
+        if args.json_gzip:
+            args.json_output_filename += ".gz"
+    if args.log_file is None:
+        args.log_file = output_prefix+"log_detailed.txt"
+    if args.state_file is None:
+        args.state_file = output_prefix+"top_stats_state.pickle"
+    args.profile_filename = output_prefix+"top_stats_profile.json"
+
+
+
+# Compute the overall stats and top players and write the xls and json output.
+# Input:
+# args = cmd line arguments
+# config = the config used for top stats computation
+# players, fights, found_healing, found_barrier = output of collect_stat_data
+# profiler = Profiler that measures the time of each phase
+def write_top_stats(args, config, players, fights, found_healing, found_barrier, profiler):
+    # print overall stats
+    with profiler.phase('overall_stats'):
+        overall_squad_stats = get_overall_squad_stats(fights, config)
+        overall_raid_stats = get_overall_raid_stats(fights)
+        total_fight_duration = get_total_fight_duration_in_hms(overall_raid_stats['used_fights_duration'])
+
+    # print top x players for all stats. If less then x
+    # players, print all. If x-th place doubled, print all with the
+    # same amount of top x achieved.
+    num_used_fights = overall_raid_stats['num_used_fights']
+        
+    top_total_stat_players = {key: list() for key in config.stats_to_compute}
+    top_average_stat_players = {key: list() for key in config.stats_to_compute}
+    top_consistent_stat_players = {key: list() for key in config.stats_to_compute}
+    top_percentage_stat_players = {key: list() for key in config.stats_to_compute}
+    percentage_comparison_val = {key: 0 for key in config.stats_to_compute}
+    
+    with profiler.phase('ranking'):
+        for stat in config.stats_to_compute:
+            if (stat == 'heal' and not found_healing) or (stat == 'barrier' and not found_barrier):
+                continue
+
+            top_consistent_stat_players[stat] = get_top_players(players, config, stat, StatType.CONSISTENT)
+            top_total_stat_players[stat] = get_top_players(players, config, stat, StatType.TOTAL)
+            top_average_stat_players[stat] = get_top_players(players, config, stat, StatType.AVERAGE)            
+            top_percentage_stat_players[stat],percentage_comparison_val[stat] = get_top_percentage_players(players, config, stat, num_used_fights, top_consistent_stat_players[stat])
+
+    if 'json' in config.files_to_write:
+        with profiler.phase('write_to_json'):
+            write_to_json(overall_raid_stats, overall_squad_stats, fights, players, top_total_stat_players, top_average_stat_players, top_consistent_stat_players, top_percentage_stat_players, args.json_output_filename, args.json_compact, args.json_gzip)
+
+    if 'xls' in config.files_to_write:
+        with profiler.phase('write_xls'):
+            write_xls(fights, overall_squad_stats, overall_raid_stats, players, top_average_stat_players, config.stats_to_compute, config, args.xls_output_filename)
+
+
+
+# Compute the top stats of each input and the combined top stats of all inputs, extracting each log only once. The
+# output files of each input are written to the input, like when running on it alone; the combined ones to the
+# output files given in args.
+# Input:
+# args = cmd line arguments, args.input_paths are the inputs
+# config = the config used for top stats computation
+# log = log file to write to
+# profiler = Profiler that measures the time of each phase
+# Output:
+# players, fights, found_healing, found_barrier of the combined top stats, see collect_stat_data
+def collect_stat_data_per_input(args, config, log, profiler):
+    state = AggregateState()
+    log_files_per_input = [(input_path, get_log_files(input_path)) for input_path in args.input_paths]
+    database = get_stats_database(args, config)
+    try:
+        for input_path, input_state in add_logs_per_input(state, log_files_per_input, config, args.jobs, get_log_cache(args, config), log, profiler, database):
+            players, fights, found_healing, found_barrier = compute_final_stats(input_state, input_path, config, log, args.anonymize, profiler)
+            if fights is None:
+                continue
+            input_args = copy.copy(args)
+            input_args.xls_output_filename = input_args.json_output_filename = None
+            set_default_output_filenames(input_args, get_output_prefix(input_path))
+            write_top_stats(input_args, config, players, fights, found_healing, found_barrier, profiler)
+            print("Wrote the top stats of "+input_path)
+    finally:
+        if database is not None:
+            database.close()
+    return compute_final_stats(state, ", ".join(args.input_paths), config, log, args.anonymize, profiler)
+
+
+
+# Keep watching the input for new logs, add them to the stats kept in memory as soon as they are completely written,
+# and write the outputs again once no new logs arrived for args.watch_debounce s. Logs that can't be parsed are
+# reported and left out until the end of the run. Runs until it is interrupted.
+# Input:
+# args = cmd line arguments
+# config = the config used for top stats computation
+# log = log file to write to
+# profiler = Profiler that measures the time of each phase
+def watch_input(args, config, log, profiler):
+    state = get_initial_state(args, config, log, profiler)
+    cache = get_log_cache(args, config)
+    database = get_stats_database(args, config)
+    failed_files = set()
+    last_change = time.monotonic() if state.fights else None
+    print("Watching "+args.input_directory+" for new logs. Press Ctrl+C to stop.")
+    try:
+        while True:
+            # logs are complete if they were not changed for a while
+            already_processed = set(state.processed_files)
+            log_files = [(file_path, filename) for file_path, filename in get_log_files(args.input_directory, args.watch_settle_time) if filename not in already_processed and filename not in failed_files]
+            if log_files:
+                try:
+                    add_logs_to_state(state, log_files, config, args.jobs, cache, log, profiler, database)
+                except Exception as error:
+                    # the logs are added in order, so the failed one is the first one that wasn't added; the others are added in the next round
+                    already_processed = set(state.processed_files)
+                    failed_file = next((filename for file_path, filename in log_files if filename not in already_processed), None)
+                    if failed_file is None:
+                        raise
+                    failed_files.add(failed_file)
+                    myprint(log, "Couldn't parse "+failed_file+", leaving it out: "+repr(error), "info")
+                if args.append:
+                    with profiler.phase('save_state'):
+                        save_state(args.state_file, state.processed_files, state.players, state.player_index, state.account_index, state.fights, state.found_all_buff_ids, state.found_healing, state.found_barrier, config)
+                last_change = time.monotonic()
+
+            if last_change is not None and time.monotonic() - last_change >= args.watch_debounce:
+                players, fights, found_healing, found_barrier = compute_final_stats(state, args.input_directory, config, log, args.anonymize, profiler)
+                if fights is not None:
+                    write_top_stats(args, config, players, fights, found_healing, found_barrier, profiler)
+                    print("Updated the top stats with "+str(len(fights))+" fights")
+                    profiler.write_report(args.profile_filename)
+                log.flush()
+                last_change = None
+
+            time.sleep(args.watch_interval)
+    except KeyboardInterrupt:
+        print("Stopped watching "+args.input_directory)
+    finally:
+        if database is not None:
+            database.close()
+
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='This reads a set of arcdps reports in json format and generates top stats.')
-    parser.add_argument('input_directory', help='Directory containing .json files from arcdps reports')
+    parser.add_argument('input_directory', nargs='+', help='Directory containing .json or .json.gz files from arcdps reports and/or .zip, .tar or .tar.gz archives of them, or a single archive. With several directories or archives, or glob patterns matching them, the top stats of each one and the combined top stats of all of them are computed.')
     parser.add_argument('-x', '--xls_output', dest="xls_output_filename", help="xls file to write the computed top stats")    
     parser.add_argument('-j', '--json_output', dest="json_output_filename", help="json file to write the computed top stats to")    
+    parser.add_argument('--json_compact', dest="json_compact", help="Write the json file without indentation and whitespace.", default=False, action='store_true')
+    parser.add_argument('--json_gzip', dest="json_gzip", help="Write the json file gzip compressed.", default=False, action='store_true')
     parser.add_argument('-l', '--log_file', dest="log_file", help="Logging file with all the output")
     parser.add_argument('-c', '--config_file', dest="config_file", help="Config file with all the settings", default="parser_config_detailed")
     parser.add_argument('-a', '--anonymized', dest="anonymize", help="Create an anonymized version of the top stats. All account and character names will be replaced.", default=False, action='store_true')
+    parser.add_argument('--jobs', dest="jobs", type=int, help="Number of processes used for parsing the logs. Logs are parsed in parallel if this is larger than 1.", default=1)
+    parser.add_argument('--cache_dir', dest="cache_directory", help="Directory for caching the stats extracted from each log. Logs that didn't change since the last run are not parsed again.", default=None)
+    parser.add_argument('--cache_size', dest="cache_size", type=int, help="Maximum size of the cache in MB. If it gets larger, the least recently used logs are removed from the cache.", default=500)
+    parser.add_argument('--database', dest="database", help="SQLite database in which the stats of each parsed fight are stored, so they can be used again with --from_database.", default=None)
+    parser.add_argument('--from_database', dest="from_database", help="Read the fights from the database given with --database instead of parsing logs. The output files are written to the input directory.", default=False, action='store_true')
+    parser.add_argument('--from_date', dest="from_date", type=date.fromisoformat, help="With --from_database, only use fights that started on this day (YYYY-MM-DD, UTC) or later.", default=None)
+    parser.add_argument('--to_date', dest="to_date", type=date.fromisoformat, help="With --from_database, only use fights that started on this day (YYYY-MM-DD, UTC) or earlier.", default=None)
+    parser.add_argument('--append', dest="append", help="Only parse logs that were not parsed in the last run and add them to the top stats stored in the state file. The state file is created if it doesn't exist.", default=False, action='store_true')
+    parser.add_argument('--state_file', dest="state_file", help="State file used with --append")
+    parser.add_argument('--json_backend', dest="json_backend", help="json decoder for reading the logs. auto uses the fastest installed one of "+", ".join(json_backends)+".", default="auto", choices=['auto'] + json_backends)
+    parser.add_argument('--profile', dest="profile", help="Measure the time needed for each phase, stat and log file and write it to top_stats_profile.json in the output directory.", default=False, action='store_true')
+    parser.add_argument('--watch', dest="watch", help="Keep running, add new logs as soon as they appear in the input directory and update the output files.", default=False, action='store_true')
+    parser.add_argument('--watch_interval', dest="watch_interval", type=float, help="Time in s between checking the input directory for new logs with --watch.", default=1.)
+    parser.add_argument('--watch_settle_time', dest="watch_settle_time", type=float, help="Logs that were changed during the last this many s are considered as still being written with --watch.", default=2.)
+    parser.add_argument('--watch_debounce', dest="watch_debounce", type=float, help="With --watch, the output files are written once no new logs arrived for this many s.", default=3.)
     args = parser.parse_args()
 
-    if not os.path.isdir(args.input_directory):
-        print("Directory ",args.input_directory," is not a directory or does not exist!")
+    args.input_paths = get_input_paths(args.input_directory)
+    for input_path in args.input_paths:
+        if get_output_prefix(input_path) is None:
+            print("Directory ",input_path," is not a directory or an archive of logs or does not exist!")
+            sys.exit()
+    if not args.input_paths:
+        print("No directories or archives of logs match ",", ".join(args.input_directory))
         sys.exit()
-    if args.xls_output_filename is None:
-        args.xls_output_filename = args.input_directory+"/top_stats_detailed.xlsx"
-    if args.json_output_filename is None:
-        args.json_output_filename = args.input_directory+"/top_stats_detailed.json"                
-    if args.log_file is None:
-        args.log_file = args.input_directory+"/log_detailed.txt"
+    if len(args.input_paths) > 1 and (args.append or args.watch):
+        print("--append and --watch can only be used with a single input directory. Use --cache_dir to avoid parsing logs again.")
+        sys.exit()
+    if args.from_database and (args.database is None or args.watch or len(args.input_paths) > 1):
+        print("--from_database needs a database given with --database and a single output directory, and can't be used with --watch.")
+        sys.exit()
+    if (args.from_date is not None or args.to_date is not None) and not args.from_database:
+        print("--from_date and --to_date can only be used with --from_database.")
+        sys.exit()
+
+    # the combined output files of several inputs are written to the directory containing all of them
+    if len(args.input_paths) == 1:
+        args.input_directory = args.input_paths[0]
+        output_prefix = get_output_prefix(args.input_directory)
+    else:
+        args.input_directory = ", ".join(args.input_paths)
+        output_prefix = os.path.commonpath([os.path.abspath(input_path) for input_path in args.input_paths])+"/"
+    set_default_output_filenames(args, output_prefix)
 
     log = open(args.log_file, "w")
+    profiler = Profiler(args.profile)
 
     parser_config = importlib.import_module("parser_configs."+args.config_file , package=None) 
-    config = fill_config(parser_config, log)
+    try:
+        config = fill_config(parser_config, log)
+    except ValueError as error:
+        print(error)
+        sys.exit()
+    config.profile = args.profile
+    try:
+        config.json_backend = get_json_backend(args.json_backend)
+    except ValueError as error:
+        print(error)
+        sys.exit()
     if 'xls' not in config.files_to_write and 'json' not in config.files_to_write:
         myprint("You didn't choose to write the output to an xls or a json file. It will be lost! Consider changing the configuration.")
 
-    print_string = "Using input directory "+args.input_directory
+    if args.from_database:
+        print_string = "Using the fights in database "+args.database
+    else:
+        print_string = "Using input directory "+args.input_directory
     if 'xls' in config.files_to_write:
         print_string = print_string+", writing xls output to "+args.xls_output_filename
     if 'json' in config.files_to_write:
@@ -65,53 +280,21 @@ if __name__ == '__main__':
     print_string = "Considering fights with at least "+str(config.min_allied_players)+" allied players and at least "+str(config.min_enemy_players)+" enemies that took longer than "+str(config.min_fight_duration)+" s."
     myprint(log, print_string, "info")
 
-    players, fights, found_healing, found_barrier = collect_stat_data(args, config, log, args.anonymize)
+    if args.watch:
+        watch_input(args, config, log, profiler)
+        sys.exit()
+
+    with profiler.phase('collect_stat_data'):
+        if len(args.input_paths) == 1:
+            players, fights, found_healing, found_barrier = collect_stat_data(args, config, log, args.anonymize, profiler)
+        else:
+            players, fights, found_healing, found_barrier = collect_stat_data_per_input(args, config, log, profiler)
     if (not fights) or all(fight.skipped for fight in fights):
         myprint(log, "Aborting!", "info")
         exit(1)
 
-    # print overall stats
-    overall_squad_stats = get_overall_squad_stats(fights, config)
-    overall_raid_stats = get_overall_raid_stats(fights)
-    total_fight_duration = get_total_fight_duration_in_hms(overall_raid_stats['used_fights_duration'])
-
-    if 'xls' in config.files_to_write:
-        write_fights_overview_xls(fights, overall_squad_stats, overall_raid_stats, config, args.xls_output_filename)
+    write_top_stats(args, config, players, fights, found_healing, found_barrier, profiler)
 
-    # print top x players for all stats. If less then x
-    # players, print all. If x-th place doubled, print all with the
-    # same amount of top x achieved.
-    num_used_fights = overall_raid_stats['num_used_fights']
-        
-    top_total_stat_players = {key: list() for key in config.stats_to_compute}
-    top_average_stat_players = {key: list() for key in config.stats_to_compute}
-    top_consistent_stat_players = {key: list() for key in config.stats_to_compute}
-    top_percentage_stat_players = {key: list() for key in config.stats_to_compute}
-    percentage_comparison_val = {key: 0 for key in config.stats_to_compute}
-    
-    for stat in config.stats_to_compute:
-        if (stat == 'heal' and not found_healing) or (stat == 'barrier' and not found_barrier):
-            continue
-
-        top_consistent_stat_players[stat] = get_top_players(players, config, stat, StatType.CONSISTENT)
-        top_total_stat_players[stat] = get_top_players(players, config, stat, StatType.TOTAL)
-        top_average_stat_players[stat] = get_top_players(players, config, stat, StatType.AVERAGE)            
-        top_percentage_stat_players[stat],percentage_comparison_val[stat] = get_top_percentage_players(players, config, stat, num_used_fights, top_consistent_stat_players[stat])
-
-    if 'json' in config.files_to_write:
-        write_to_json(overall_raid_stats, overall_squad_stats, fights, players, top_total_stat_players, top_average_stat_players, top_consistent_stat_players, top_percentage_stat_players, args.json_output_filename)
-
-    if 'xls' in config.files_to_write:
-        for stat in config.stats_to_compute:
-            if stat == 'dist':
-                write_stats_xls(players, top_average_stat_players[stat], stat, args.xls_output_filename, config)
-            elif 'dmg_taken' in stat:
-                write_stats_xls(players, top_average_stat_players[stat], stat, args.xls_output_filename, config)
-            elif 'heal' in stat and stat != 'heal_from_regen' and found_healing:
-                write_stats_xls(players, top_average_stat_players[stat], stat, args.xls_output_filename, config)            
-            elif stat == 'barrier' and found_barrier:
-                write_stats_xls(players, top_average_stat_players[stat], stat, args.xls_output_filename, config)
-            elif stat == 'deaths':
-                write_stats_xls(players, top_average_stat_players[stat], stat, args.xls_output_filename, config)
-            else:
-                write_stats_xls(players, top_average_stat_players[stat], stat, args.xls_output_filename, config)
+    if args.profile:
+        profiler.write_report(args.profile_filename)
+        print("Profiling results written to "+args.profile_filename)
@@ -21,49 +21,58 @@ import os.path
 from os import listdir
 import importlib
 import json
+import io
+import copy
+import time
+import contextlib
+import itertools
+from collections import deque
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, Future
 
 from io_helper import myprint
 from stat_classes import *
 from json_helper import *
-
-# For all players considered to be top in stat in this fight, increase
-# the number of fights they reached top by 1 (i.e. increase
-# consistency_stats[stat]).
+from json_reader import load_json_file, get_json_projection, get_log_files, close_archive
+from log_cache import LogCache
+from stats_database import StatsDatabase
+from aggregate_state import save_state, load_state
+from profiler import Profiler
+
+# For all players considered to be top in this fight, increase the number of fights they reached top by 1 (i.e. increase
+# consistency_stats[stat]) for each stat. The top players in a stat are the num_players_considered_top[stat] present
+# players with the best valid values, plus everyone with the same value as the last of them (double places).
 # Input:
 # players = list of all players
-# sortedList = list of (player_index, stat_value) sorted by stat value in this fight
 # config = configuration to use
-# stat = stat that is considered
 # fight_number = index of the fight being considered
-def increase_top_x_reached(players, sortedList, config, stat, fight_number):
-    valid_values = 0
-    # for distance to tag: consider only players with values > 0 (distance 0 should only be com; distance < 0 is invalid)
-    i = 0
-    last_val = 0
-    # check the whole list or until the number of players considered to be "top" were found (including double places)
-    while i < len(sortedList) and (valid_values < config.num_players_considered_top[stat] or sortedList[i][1] == last_val):
-        # player wasn't present in this fight, ignore
-        if not players[sortedList[i][0]].stats_per_fight[fight_number]['present_in_fight']:
-            i += 1
-            continue
-
-        # only 0 deaths counts as top for a fight
-        if stat == 'deaths' and sortedList[i][1] == 0:
-            players[sortedList[i][0]].consistency_stats[stat] += 1
-            valid_values += 1
-            last_val = sortedList[i][1]
-        # for incoming strips or dmg taken, anything >= 0 can be top
-        elif (stat == 'stripped' or 'dmg_taken' in stat) and sortedList[i][1] >= 0:
-            players[sortedList[i][0]].consistency_stats[stat] += 1
-            valid_values += 1
-            last_val = sortedList[i][1]
+def increase_top_x_reached(players, config, fight_number):
+    if not players:
+        return
+    fight_players, values = players[0].stats_per_fight.stats.get_fight_stat_matrix(fight_number, config.stats_to_compute)
+    for stat_index, stat in enumerate(config.stats_to_compute):
+        stat_values = values[:, stat_index]
+        # for deaths, incoming strips or dmg taken, anything >= 0 can be top (0 deaths first, but if nobody had 0 deaths,
+        # the fewest deaths are top)
+        if stat == 'deaths' or stat == 'stripped' or 'dmg_taken' in stat:
+            is_top = stat_values >= 0
         # for all other stats, only values > 0 can be top
-        elif sortedList[i][1] > 0:
-            players[sortedList[i][0]].consistency_stats[stat] += 1
-            valid_values += 1
-            last_val = sortedList[i][1]
-        i += 1
-    return
+        else:
+            is_top = stat_values > 0
+
+        num_top = config.num_players_considered_top[stat]
+        if np.count_nonzero(is_top) > num_top:
+            # for tag distance, dmg taken, deaths, and stripped, low numbers are good
+            if stat == 'dist' or 'dmg_taken' in stat or stat == 'deaths' or stat == 'stripped':
+                scores = np.where(is_top, -stat_values, -np.inf)
+            else:
+                scores = np.where(is_top, stat_values, -np.inf)
+            # everyone at least as good as the num_top-th best valid value is top
+            threshold = np.partition(scores, len(scores) - num_top)[len(scores) - num_top]
+            is_top &= scores >= threshold
+
+        for i in np.flatnonzero(is_top).tolist():
+            players[fight_players[i]].consistency_stats[stat] += 1
 
 
 
@@ -75,16 +84,18 @@ def increase_top_x_reached(players, sortedList, config, stat, fight_number):
 # Output:
 # list of (player index, stat value in fight fight_num), sorted by total stat value in fight fight_num
 def sort_players_by_value_in_fight(players, stat, fight_num):
-    # get list of (stat value, index)
-    decorated = [(player.stats_per_fight[fight_num][stat], i) for i, player in enumerate(players)]
-    if stat == 'dist' or 'dmg_taken' in stat or stat == 'deaths' or stat == 'stripped':
-        # for tag distance, dmg taken, deaths, and stripped, low numbers are good
-        decorated.sort()
-    else:
-        # for all other stats, high numbers are good
-        decorated.sort(reverse=True)
-    # extract list of (index, stat value)
-    sorted_by_value = [(i, value) for value, i in decorated]
+    if not players:
+        return []
+    stats_per_fight = players[0].stats_per_fight.stats
+    values = stats_per_fight.get_stat_values(fight_num, stat)
+    # stable sort, so players with the same value are sorted by index
+    order = np.argsort(stats_per_fight.get_stat_array(fight_num, stat), kind='stable')
+    # for tag distance, dmg taken, deaths, and stripped, low numbers are good
+    # for all other stats, high numbers are good -> reverse the order (also for players with the same value, like sorting (value, index) in reverse)
+    if not (stat == 'dist' or 'dmg_taken' in stat or stat == 'deaths' or stat == 'stripped'):
+        order = order[::-1]
+    # list of (index, stat value)
+    sorted_by_value = [(i, values[i]) for i in order.tolist()]
     return sorted_by_value
 
 
@@ -271,19 +282,26 @@ def get_top_percentage_players(players, config, stat, num_used_fights, top_consi
 # players = list of Players
 # fights = light of Fights
 # config = the config being used to compute top stats
-def compute_total_values(players, fights, config):
+# first_fight_number (optional) = only add the values of this and all later fights, the earlier fights were already added
+def compute_total_values(players, fights, config, first_fight_number = 0):
     #print("computing totals")
-    for player in players:
-        for fight_number in range(len(fights)):
-            fight = fights[fight_number]
-            player_stats = player.stats_per_fight[fight_number]
-            if player_stats['present_in_fight']:
+    if not players:
+        return
+    stats_per_fight = players[0].stats_per_fight.stats
+    # only go through the players that took part in each fight; players are added in the order of their index, and fights
+    # in ascending order for each player
+    for fight_number in range(first_fight_number, len(fights)):
+        fight = fights[fight_number]
+        for player_number in stats_per_fight.get_fight_players(fight_number):
+            player = players[player_number]
+            if player.stats_per_fight[fight_number]['present_in_fight']:
+                player_stats = player.stats_per_fight[fight_number].to_dict()
                 # increase number of fights the player was present
                 player.num_fights_present += 1
                 # compute overall duration present (for all types) and the normalization factor of duration * allies
                 for duration_type in player.duration_present:
                     player.duration_present[duration_type] += player_stats['duration_present'][duration_type]
-                    player.normalization_time_allies[duration_type] += (fight.allies - 1) * player.stats_per_fight[fight_number]['duration_present'][duration_type]
+                    player.normalization_time_allies[duration_type] += (fight.allies - 1) * player_stats['duration_present'][duration_type]
 
                 # compute total values per player and per fight
                 for stat in config.stats_to_compute:
@@ -314,13 +332,13 @@ def compute_total_values(players, fights, config):
                             # only count whether or not buff was present
                             fight.total_stats[stat] += player_stats[stat]
                             player.total_stats[stat] += player_stats[stat]
-                        elif stat == 'spike_dmg':
+                        elif stat in config.spike_dmg_windows:
                             fight.total_stats[stat] = max(fight.total_stats[stat], player_stats[stat])
                             player.total_stats[stat] = max(player.total_stats[stat], player_stats[stat])
                         else:
                             # all other stats
-                            fight.total_stats[stat] += player.stats_per_fight[fight_number][stat]
-                            player.total_stats[stat] += player.stats_per_fight[fight_number][stat]
+                            fight.total_stats[stat] += player_stats[stat]
+                            player.total_stats[stat] += player_stats[stat]
 
 
 
@@ -332,12 +350,13 @@ def compute_total_values(players, fights, config):
 # config = the config being used to compute top stats
 # TODO use only duration of fight where stat >= 0
 def compute_avg_values(players, fights, config): 
+    stats_per_fight = players[0].stats_per_fight.stats
     total_normalization_time_per_fight = list()
     for fight_number in range(len(fights)):
         total_normalization_time_per_fight.append({})
         for duration_type in config.empty_stats['duration_present']:
             # sum_players (player_duration_present)
-            total_normalization_time_per_fight[fight_number][duration_type] = sum([player.stats_per_fight[fight_number]['duration_present'][duration_type] for player in players])
+            total_normalization_time_per_fight[fight_number][duration_type] = sum(stats_per_fight.get_fight_duration_values(fight_number, duration_type))
 
     total_normalization_time_allies_per_fight = list()
     for fight_number in range(len(fights)):
@@ -356,8 +375,10 @@ def compute_avg_values(players, fights, config):
             fight.avg_stats[stat] = fight.total_stats[stat]
 
             # TODO double check fight avg stats
-            if stat == 'spike_dmg':
-                fight.avg_stats[stat] = sum(player.stats_per_fight[fight_number][stat] for player in players)/len(players)
+            if stat in config.spike_dmg_windows:
+                # players that didn't take part in the fight are counted with their empty value
+                fight_values = stats_per_fight.get_fight_stat_values(fight_number, stat)
+                fight.avg_stats[stat] = (sum(fight_values) + (len(players) - len(fight_values)) * config.empty_stats[stat])/len(players)
             elif stat in config.squad_buff_ids and stat in config.buffs_not_stacking:
                 # all not stacking buff averages are per time, and the % values are always relative to the total fight duration
                 fight.avg_stats[stat] /= total_normalization_time_per_fight[fight_number]['total']
@@ -372,9 +393,9 @@ def compute_avg_values(players, fights, config):
                 # averages for buffs stacking duration are given in % -> * 100
                 fight.avg_stats[stat] *= 100
 
+    used_fights = len([fight for fight in fights if fight.skipped == False])
     for player in players:
         # compute percentage top stats and attendance percentage for each player
-        used_fights = len([fight for fight in fights if fight.skipped == False])
         player.attendance_percentage = round(player.num_fights_present / used_fights * 100)
         # round total and portion top stats
         for stat in config.stats_to_compute:
@@ -385,17 +406,16 @@ def compute_avg_values(players, fights, config):
                 continue
             
             # DON'T SWITCH DMG_TAKEN AND DMG OR HEAL_FROM_REGEN AND HEAL
-            if stat == 'spike_dmg':
+            if stat in config.spike_dmg_windows:
                 # find the fights that weren't skipped in which the player was present
-                fights_used_for_player = [fight for fight_number,fight in enumerate(fights) if fight.skipped == False and player.stats_per_fight[fight_number]['present_in_fight']]
+                fights_used_for_player = [fight_number for fight_number in player.stats_per_fight.get_fights() if fights[fight_number].skipped == False and player.stats_per_fight[fight_number]['present_in_fight']]
                 if not fights_used_for_player:
                     player.average_stats[stat] = 0
                 else:
                     player.average_stats[stat] = 0
                     # sum over all fights that weren't skipped and in which the player was present
-                    for fight_number,fight in enumerate(fights):
-                        if fight.skipped == False and player.stats_per_fight[fight_number]['present_in_fight']:
-                            player.average_stats[stat] += player.stats_per_fight[fight_number][stat]
+                    for fight_number in fights_used_for_player:
+                        player.average_stats[stat] += player.stats_per_fight[fight_number][stat]
                     # average over all fights in which he was present
                     player.average_stats[stat] /= len(fights_used_for_player)
 
@@ -421,193 +441,567 @@ def compute_avg_values(players, fights, config):
 
 
 
-def get_stats_from_json_data(json_data, players, player_index, account_index, fights, config, found_all_buff_ids, found_healing, found_barrier, log, filename):
+# Extract the stats of all players in one fight from the json data of the fight. The result only depends on this log
+# and the static parts of the config, buff ids are read from the buff map of this log.
+# Input:
+# json_data = json data of the whole fight as parsed by Elite Insights
+# config = the config to use for top stats computation
+# filename = name of the log file
+# Output:
+# ExtractedLog with the fight and player stats of this log
+def extract_stats_from_json_data(json_data, config, filename):
+    extracted = ExtractedLog(filename = filename)
+    log = io.StringIO()
+    stat_extractors = get_stat_extractors(config)
+    stat_times = None
+    if config.profile:
+        start_time = time.perf_counter()
+        stat_times = {}
+
+    # use a copy of the config with the buff ids of this log only
+    log_config = copy.copy(config)
+    log_config.squad_buff_ids = {}
+    log_config.self_buff_ids = {}
+    log_config.buffs_stacking_duration = list()
+    log_config.buffs_stacking_intensity = list()
+    log_config.buffs_not_stacking = list()
+    log_config.errors = list()
+    extracted.buff_map = get_relevant_buff_map(json_data, config)
+    read_buff_ids(extracted.buff_map, log_config)
+
     # get fight stats
-    fight = get_stats_from_fight_json(json_data, config, log)
-            
-    if not found_all_buff_ids:
-        found_all_buff_ids = get_buff_ids_from_json(json_data, config, log)
-                    
-    # add new entry for this fight in all players
-    for player in players:
-        player.stats_per_fight.append({key: value for key, value in config.empty_stats.items()})
-        player.stats_per_fight[-1]['duration_present'] = {key: value for key, value in config.empty_stats['duration_present'].items()}
+    fight = get_stats_from_fight_json(json_data, log_config, log)
+    extracted.fight = fight
 
-    fight_number = int(len(fights))
-        
     # don't compute anything for skipped fights
     if fight.skipped:
-        fights.append(fight)
-        log.write("skipped "+filename)            
-        return found_all_buff_ids, found_healing, found_barrier
+        extracted.log_output = log.getvalue()
+        if config.profile:
+            extracted.profile = {'stats': stat_times, 'load_time': 0., 'extract_time': time.perf_counter() - start_time}
+        return extracted
 
     # get stats for each player
     for player_data in json_data['players']:
-        create_new_player = False
-        build_swapped = False
-
-        account, name, profession = get_basic_player_data_from_json(player_data)                
+        account, name, profession = get_basic_player_data_from_json(player_data)
 
         if profession in fight.squad_composition:
             fight.squad_composition[profession] += 1
         else:
             fight.squad_composition[profession] = 1
 
-        # if this combination of charname + profession is not in the player index yet, create a new entry
-        name_and_prof = name+" "+profession
-        if name_and_prof not in player_index.keys():
-            print("creating new player",name_and_prof)
-            create_new_player = True
-
-        # if this account is not in the account index yet, create a new entry
-        if account not in account_index.keys():
-            account_index[account] = [len(players)]
-        elif name_and_prof not in player_index.keys():
-            # if account does already exist, but name/prof combo does not, this player swapped build or character
-            # -> note for all Player instances of this account
-            for ind in range(len(account_index[account])):
-                players[account_index[account][ind]].swapped_build = True
-            account_index[account].append(len(players))
-            build_swapped = True
-
-        if create_new_player:
-            new_player = Player(account, name, profession)
-            new_player.initialize(config)
-            player_index[name_and_prof] = len(players)
-            # fill up fights where the player wasn't there yet with empty stats
-            while len(new_player.stats_per_fight) <= fight_number:
-                new_player.stats_per_fight.append({key: value for key, value in config.empty_stats.items()})
-                new_player.stats_per_fight[-1]['duration_present'] = {key: value for key, value in config.empty_stats['duration_present'].items()}
-            players.append(new_player)
-
-        player = players[player_index[name_and_prof]]
-
-        player.stats_per_fight[fight_number]['duration_present']['total'] = fight.duration
-        player.stats_per_fight[fight_number]['duration_present']['active'] = get_stat_from_player_json(player_data, 'time_active', None, None, config)
-        player.stats_per_fight[fight_number]['duration_present']['in_combat'] = get_stat_from_player_json(player_data, 'time_in_combat', None, None, config)
-        player.stats_per_fight[fight_number]['duration_present']['not_running_back'] = get_stat_from_player_json(player_data, 'time_not_running_back', fight, None, config)
-        player.stats_per_fight[fight_number]['group'] = get_stat_from_player_json(player_data, 'group', fight, player.stats_per_fight[fight_number]['duration_present'], config)
-        player.stats_per_fight[fight_number]['present_in_fight'] = True
-
-        error_index = len(config.errors)
+        player_stats = {key: value for key, value in config.empty_stats.items()}
+        player_stats['duration_present'] = {key: value for key, value in config.empty_stats['duration_present'].items()}
+
+        context = PlayerFightContext(player_data, fight, player_stats['duration_present'], log_config, stat_times = stat_times)
+        player_stats['duration_present']['total'] = fight.duration
+        player_stats['duration_present']['active'] = extract_stat(context, 'time_active')
+        player_stats['duration_present']['in_combat'] = extract_stat(context, 'time_in_combat')
+        player_stats['duration_present']['not_running_back'] = extract_stat(context, 'time_not_running_back')
+        player_stats['group'] = extract_stat(context, 'group')
+        player_stats['present_in_fight'] = True
+
+        error_index = len(log_config.errors)
         # get all stats that are supposed to be computed from the player data
-        for stat in config.stats_to_compute:
+        for stat, extractor in stat_extractors:
             # TODO add total stats per fight and avg stats per fight; add option to decide whether "top" should be determined by total or avg ?
-            player.stats_per_fight[fight_number][stat] = get_stat_from_player_json(player_data, stat, fight, player.stats_per_fight[fight_number]['duration_present'], config)
-                    
-            if 'heal' in stat and player.stats_per_fight[fight_number][stat] >= 0:
-                found_healing = True
-            elif stat == 'barrier' and player.stats_per_fight[fight_number][stat] >= 0:
-                found_barrier = True                    
+            player_stats[stat] = extract_stat(context, stat, extractor)
+
+            if 'heal' in stat and player_stats[stat] >= 0:
+                extracted.found_healing = True
+            elif stat == 'barrier' and player_stats[stat] >= 0:
+                extracted.found_barrier = True
             elif stat == 'dist':
-                player.stats_per_fight[fight_number][stat] = round(player.stats_per_fight[fight_number][stat])
+                player_stats[stat] = round(player_stats[stat])
             elif 'dmg_taken' in stat:
                 # TODO fix with using proper duration for avg; check the rest of the comp is right
                 # if player wasn't present, dmg taken doesn't count
                 #TODO for anything where total-players or total-absorbed is something else, use same duration type?
-                if player.stats_per_fight[fight_number]['duration_present'][config.duration_for_averages[stat]] == 0:
-                    player.stats_per_fight[fight_number][stat] = -1
+                if player_stats['duration_present'][config.duration_for_averages[stat]] == 0:
+                    player_stats[stat] = -1
                 else:
                     # dmg taken per fight should be sorted by avg, what else?
-                    player.stats_per_fight[fight_number][stat] = player.stats_per_fight[fight_number][stat]/player.stats_per_fight[fight_number]['duration_present'][config.duration_for_averages[stat]]
+                    player_stats[stat] = player_stats[stat]/player_stats['duration_present'][config.duration_for_averages[stat]]
+
+        # errors are written to the log when the fight is added, since they refer to the fight number
+        player_errors = list()
+        if len(log_config.errors) > error_index:
+            player_errors = log_config.errors
+            log_config.errors = list()
 
-        player.swapped_build |= build_swapped
+        extracted.player_stats.append((account, name, profession, player_stats, player_errors))
+
+    extracted.log_output = log.getvalue()
+    if config.profile:
+        extracted.profile = {'stats': stat_times, 'load_time': 0., 'extract_time': time.perf_counter() - start_time}
+    return extracted
+
+
+
+# Load a log file and extract the stats of all players in it.
+# Input:
+# file_path = path of the log file
+# filename = name of the log file
+# config = the config to use for top stats computation
+# Output:
+# ExtractedLog with the fight and player stats of this log
+def extract_stats_from_file(file_path, filename, config):
+    print("parsing "+filename)
+
+    # load file, only keeping the parts of the json needed for the configured stats
+    start_time = time.perf_counter()
+    json_data = load_json_file(file_path, get_json_projection(config), config.json_backend)
+    load_time = time.perf_counter() - start_time
+
+    extracted = extract_stats_from_json_data(json_data, config, filename)
+    if extracted.profile is not None:
+        extracted.profile['load_time'] = load_time
+    return extracted
+
+
+
+# Extract the stats of all given log files, using a pool of worker processes if jobs > 1.
+# Input:
+# log_files = list of (file path, file name), in the order in which the fights should be numbered, see json_reader.get_log_files
+# config = the config to use for top stats computation
+# jobs = number of processes to use
+# cache (optional) = LogCache to get already extracted logs from and store newly extracted logs in
+# Output:
+# generator of ExtractedLogs in the order of log_files
+def extract_logs(log_files, config, jobs = 1, cache = None):
+    executor = None
+    if jobs > 1:
+        executor = ProcessPoolExecutor(max_workers = jobs)
+    # only keep a few logs waiting when extracting in parallel, they are consumed in order
+    max_pending = 2 * jobs if executor else 0
+
+    # list of (file path, ExtractedLog or Future, whether it was newly extracted)
+    pending = deque()
+    try:
+        for file_path, filename in log_files:
+            extracted = None
+            if cache is not None:
+                extracted = cache.get(file_path)
+            if extracted is not None:
+                print("using cached "+filename)
+                # the times of the run in which the log was cached don't apply
+                extracted.profile = None
+                pending.append((file_path, extracted, False))
+            elif executor is None:
+                pending.append((file_path, extract_stats_from_file(file_path, filename, config), True))
+            else:
+                pending.append((file_path, executor.submit(extract_stats_from_file, file_path, filename, config), True))
+
+            while len(pending) > max_pending:
+                yield get_pending_log(pending.popleft(), cache)
+        while pending:
+            yield get_pending_log(pending.popleft(), cache)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures = True)
+        close_archive()
+
+
+
+# get the ExtractedLog of one entry of the pending logs in extract_logs and store it in the cache if it was newly extracted
+def get_pending_log(pending_log, cache):
+    file_path, extracted, newly_extracted = pending_log
+    if isinstance(extracted, Future):
+        extracted = extracted.result()
+    if newly_extracted and cache is not None:
+        cache.put(file_path, extracted)
+    return extracted
+
+
+
+# Get the StatsPerFight in which the stats per fight of all players are stored. If there are no players yet, a new one
+# is created for the given fights.
+# Input:
+# players = list of all Players
+# fights = list of all Fights
+# config = the config to use for top stats computation
+# Output:
+# StatsPerFight of the players
+def get_stats_per_fight(players, fights, config):
+    if players:
+        return players[0].stats_per_fight.stats
+    stats_per_fight = StatsPerFight(config)
+    for fight in fights:
+        stats_per_fight.add_fight()
+    return stats_per_fight
+
+
+
+# Get the player with the given character name and profession, creating a new one if there is none yet. If the account
+# is already known with another character or profession, it swapped build or character, which is noted for all its
+# players.
+# Input:
+# account, name, profession = of the player
+# players = list of all Players, a new player is appended
+# player_index = dictionary that matches each player/profession combo to its index in players list
+# account_index = dictionary that matches each account name to a list of its indices in players list
+# stats_per_fight = StatsPerFight of the players, see get_stats_per_fight
+# config = the config to use for top stats computation
+# Output:
+# the Player
+def get_or_add_player(account, name, profession, players, player_index, account_index, stats_per_fight, config):
+    name_and_prof = name+" "+profession
+    if name_and_prof in player_index:
+        if account not in account_index:
+            account_index[account] = [player_index[name_and_prof]]
+        return players[player_index[name_and_prof]]
+
+    new_player = Player(account, name, profession)
+    new_player.initialize(config)
+    if account not in account_index:
+        account_index[account] = [len(players)]
+    else:
+        # if account does already exist, but name/prof combo does not, this player swapped build or character
+        # -> note for all Player instances of this account
+        for ind in account_index[account]:
+            players[ind].swapped_build = True
+        account_index[account].append(len(players))
+        new_player.swapped_build = True
+    player_index[name_and_prof] = len(players)
+    # the new player only gets stats for the fights they take part in
+    new_player.stats_per_fight = stats_per_fight.add_player()
+    players.append(new_player)
+    return new_player
+
+
+
+# Add the stats extracted from one log to the players and fights. This does all the bookkeeping across fights, so
+# extracted logs have to be added in the order of the fights.
+# Input:
+# extracted = ExtractedLog as returned by extract_stats_from_json_data
+# players = list of all Players, new players are appended
+# player_index = dictionary that matches each player/profession combo to its index in players list
+# account_index = dictionary that matches each account name to a list of its indices in players list
+# fights = list of all Fights, the fight of this log is appended
+# config = the config to use for top stats computation
+# found_all_buff_ids, found_healing, found_barrier = state of the computation so far
+# log = log file to write to
+# Output:
+# found_all_buff_ids, found_healing, found_barrier after adding this log
+def add_extracted_log(extracted, players, player_index, account_index, fights, config, found_all_buff_ids, found_healing, found_barrier, log):
+    fight = extracted.fight
+
+    if not found_all_buff_ids:
+        read_buff_ids(extracted.buff_map, config)
+        found_all_buff_ids = check_buff_ids(config, log)
+    log.write(extracted.log_output)
+
+    # add the fight, players only get an entry in it once their stats are added
+    stats_per_fight = get_stats_per_fight(players, fights, config)
+    fight_number = stats_per_fight.add_fight()
+
+    # don't compute anything for skipped fights
+    if fight.skipped:
+        fights.append(fight)
+        log.write("skipped "+extracted.filename)
+        return found_all_buff_ids, found_healing, found_barrier
+
+    found_healing |= extracted.found_healing
+    found_barrier |= extracted.found_barrier
+
+    for account, name, profession, player_stats, player_errors in extracted.player_stats:
+        if name+" "+profession not in player_index:
+            print("creating new player",name+" "+profession)
+        player = get_or_add_player(account, name, profession, players, player_index, account_index, stats_per_fight, config)
+        player.stats_per_fight[fight_number] = player_stats
 
         ################################
         ### print warning/debug logs ###
         ################################
-        if len(config.errors) > error_index:
-            myprint(log, "In fight "+str(fight_number)+", "+player.name+" ("+player.profession+"):", "warning", config)
-            for error in config.errors:
+        if player_errors:
+            myprint(log, "In fight "+str(fight_number)+", "+name+" ("+profession+"):", "warning", config)
+            for error in player_errors:
                 myprint(log, error, "warning", config)
-            config.errors = list()
-        
+
         myprint(log, name, "debug", config)
-        for stat in player.stats_per_fight[fight_number].keys():
-            myprint(log, stat+": "+str(player.stats_per_fight[fight_number][stat]), "debug", config)
+        for stat in player_stats.keys():
+            myprint(log, stat+": "+str(player_stats[stat]), "debug", config)
         myprint(log, "\n", "debug", config)
 
-    # create lists sorted according to stats
-    sortedStats = {key: list() for key in config.stats_to_compute}
-    for stat in config.stats_to_compute:
-        sortedStats[stat] = sort_players_by_value_in_fight(players, stat, fight_number)
-
     #######################
     ### print debug log ###
     #######################
-    for stat in config.stats_to_compute:
-        myprint(log, "sorted "+stat+": ", "debug", config)
-        for entry in sortedStats[stat]:
-            print_string = "("+str(entry[0])+", "+str(entry[1])+")"
-            myprint(log, print_string, "debug", config)
+    # the debug log lists all players sorted according to each stat, also the ones that weren't in this fight
+    if config.log_level == "debug":
+        for stat in config.stats_to_compute:
+            myprint(log, "sorted "+stat+": ", "debug", config)
+            for entry in sort_players_by_value_in_fight(players, stat, fight_number):
+                print_string = "("+str(entry[0])+", "+str(entry[1])+")"
+                myprint(log, print_string, "debug", config)
         
     # increase number of times top x was achieved for top x players in each stat
-    for stat in config.stats_to_compute:
-        increase_top_x_reached(players, sortedStats[stat], config, stat, fight_number)
+    increase_top_x_reached(players, config, fight_number)
         
     fights.append(fight)
 
     return found_all_buff_ids, found_healing, found_barrier
 
 
+
+# Get the stats of one fight and add them to the players and fights.
+# Input:
+# json_data = json data of the whole fight as parsed by Elite Insights
+# for all other inputs and the output see add_extracted_log
+def get_stats_from_json_data(json_data, players, player_index, account_index, fights, config, found_all_buff_ids, found_healing, found_barrier, log, filename):
+    extracted = extract_stats_from_json_data(json_data, config, filename)
+    return add_extracted_log(extracted, players, player_index, account_index, fights, config, found_all_buff_ids, found_healing, found_barrier, log)
+
+
     
-# Collect the top stats data.
+# Get the state from which the top stats computation starts: in append mode the state of the last run if there is a
+# usable one, otherwise an empty state.
 # Input:
 # args = cmd line arguments
 # config = configuration to use for top stats computation
 # log = log file to write to
+# profiler = Profiler that measures the time of each phase
 # Output:
-# list of Players with their stats
-# list of all fights (also the skipped ones)
-# was healing found in the logs?
-def collect_stat_data(args, config, log, anonymize=False):
+# AggregateState
+def get_initial_state(args, config, log, profiler):
+    if args.append:
+        with profiler.phase('load_state'):
+            state = load_state(args.state_file, config, log)
+        if state is not None:
+            myprint(log, "Loaded "+str(len(state.fights))+" fights from state file "+args.state_file, "info")
+            return state
+    return AggregateState()
+
+
+
+# get the LogCache to use according to the cmd line arguments, or None if no cache should be used
+def get_log_cache(args, config):
+    if args.cache_directory is None:
+        return None
+    return LogCache(args.cache_directory, args.cache_size * 1024 * 1024, config)
+
+
+
+# get the StatsDatabase to use according to the cmd line arguments, or None if no database should be used
+def get_stats_database(args, config):
+    database_file = getattr(args, 'database', None)
+    if database_file is None:
+        return None
+    return StatsDatabase(database_file, config)
+
+
+
+# Extract the given logs, add them to the state as new fights and add these fights to the total values.
+# Input:
+# state = AggregateState to add the logs to; its total values must not have been rounded by compute_avg_values yet
+# log_files = list of (file path, file name) in the order in which the fights should be numbered
+# config = configuration to use for top stats computation
+# jobs = number of processes to use for extracting the logs
+# cache = LogCache or None
+# log = log file to write to
+# profiler = Profiler that measures the time of each phase
+# database (optional) = StatsDatabase to store the extracted logs in, or None
+def add_logs_to_state(state, log_files, config, jobs, cache, log, profiler, database = None):
+    extracted_logs = extract_logs(log_files, config, jobs, cache)
+    if database is not None:
+        extracted_logs = database.store_extracted_logs(extracted_logs)
+    add_extracted_logs(state, extracted_logs, config, log, profiler)
+
+
+
+# Add extracted logs to the state as new fights and add these fights to the total values.
+# Input:
+# extracted_logs = iterable of ExtractedLogs in the order of the fights, see extract_logs
+# for all other inputs see add_logs_to_state
+def add_extracted_logs(state, extracted_logs, config, log, profiler):
+    first_new_fight = len(state.fights)
+
+    # logs are extracted independently (possibly in parallel or from the cache) and added in the order of the files
     # healing only in logs if addon was installed
-    found_healing = False # Todo what if some logs have healing and some don't
-    found_barrier = False    
+    # Todo what if some logs have healing and some don't
+    # if a log can't be extracted, the logs before it stay added, so the total values are computed for them anyway
+    try:
+        with profiler.phase('parse_logs'):
+            for extracted in extracted_logs:
+                with profiler.phase('add_extracted_log'):
+                    state.found_all_buff_ids, state.found_healing, state.found_barrier = add_extracted_log(extracted, state.players, state.player_index, state.account_index, state.fights, config, state.found_all_buff_ids, state.found_healing, state.found_barrier, log)
+                profiler.add_log(extracted)
+                state.processed_files.append(extracted.filename)
+    finally:
+        # only the new fights need to be added to the total values
+        with profiler.phase('compute_total_values'):
+            compute_total_values(state.players, state.fights, config, first_new_fight)
+
+
+
+# add the entries of source that are missing in target, which are either both dicts or both lists
+def add_missing_entries(target, source):
+    if isinstance(target, dict):
+        for key, value in source.items():
+            target.setdefault(key, value)
+    else:
+        target.extend([entry for entry in source if entry not in target])
 
-    players = []        # list of all player/profession combinations
-    player_index = {}   # dictionary that matches each player/profession combo to its index in players list
-    account_index = {}  # dictionary that matches each account name to a list of its indices in players list
 
-    fights = []
-    found_all_buff_ids = False
-    
-    # iterating over all fights in directory
-    files = listdir(args.input_directory)
-    sorted_files = sorted(files)
-    for filename in sorted_files:
-        # skip files of incorrect filetype
-        file_start, file_extension = os.path.splitext(filename)
-        if file_extension not in ['.json', '.gz'] or "top_stats" in file_start:
-            continue
 
-        print_string = "parsing "+filename
-        print(print_string)
-        file_path = "".join((args.input_directory,"/",filename))
+# Merge the state of a shard of fights into the state of the fights before it. The result is the same as if all logs
+# of both states had been added to one state: players are matched by character name and profession as in
+# add_extracted_log, see get_or_add_player, and the fights of other_state are numbered after the ones of state. Since
+# sums of floats depend on their order, the total values, durations and number of fights of the players are added up
+# again from the values per fight of the appended fights, in the order in which a single run would add them. This also
+# makes merging associative. The consistency stats only depend on each fight and are added. Neither state may have been passed to
+# compute_avg_values. other_state is not changed and shares no data with the result.
+# Input:
+# state = AggregateState of the earlier fights, changed in place
+# other_state = AggregateState of the later fights
+# config = configuration to use for top stats computation; buff ids found in either state are added to it
+# Output:
+# state, containing the fights of both states
+def merge_states(state, other_state, config):
+    if state.config_hash and other_state.config_hash and state.config_hash != other_state.config_hash:
+        raise ValueError("States created with different configurations can't be merged")
+    first_new_fight = len(state.fights)
+
+    for buff_field in ['squad_buff_ids', 'self_buff_ids', 'buffs_stacking_duration', 'buffs_stacking_intensity', 'buffs_not_stacking']:
+        add_missing_entries(getattr(state, buff_field), getattr(other_state, buff_field))
+        add_missing_entries(getattr(config, buff_field), getattr(state, buff_field))
+    state.found_all_buff_ids |= other_state.found_all_buff_ids
+    state.found_healing |= other_state.found_healing
+    state.found_barrier |= other_state.found_barrier
+    state.processed_files.extend(other_state.processed_files)
+
+    # index of each player of other_state in the merged players
+    stats_per_fight = get_stats_per_fight(state.players, state.fights, config)
+    player_map = list()
+    for other_player in other_state.players:
+        player = get_or_add_player(other_player.account, other_player.name, other_player.profession, state.players,
+                                   state.player_index, state.account_index, stats_per_fight, config)
+        player.swapped_build |= other_player.swapped_build
+        for stat in config.stats_to_compute:
+            player.consistency_stats[stat] += other_player.consistency_stats[stat]
+        player_map.append(state.player_index[other_player.name+" "+other_player.profession])
+
+    if other_state.players:
+        stats_per_fight.append_fights(other_state.players[0].stats_per_fight.stats, player_map)
+    else:
+        for fight in other_state.fights:
+            stats_per_fight.add_fight()
+    for fight in other_state.fights:
+        # the squad totals of the fight are added up again in the order of the merged players
+        fight = copy.deepcopy(fight)
+        fight.total_stats = {key: 0 for key in config.stats_to_compute}
+        state.fights.append(fight)
+
+    compute_total_values(state.players, state.fights, config, first_new_fight)
+    return state
 
-        # load file
-        if file_extension == '.gz':
-            with gzip.open(file_path, mode="r") as f:
-                json_data = json.loads(f.read().decode('utf-8'))
-        else:
-            json_datafile = open(file_path, encoding='utf-8')
-            json_data = json.load(json_datafile)
 
-        found_all_buff_ids, found_healing, found_barrier = get_stats_from_json_data(json_data, players, player_index, account_index, fights, config, found_all_buff_ids, found_healing, found_barrier, log, filename)
 
-    if (not fights) or all(fight.skipped for fight in fights):
+# Extract the logs of several inputs in one pass and compute the state of each input, which is then merged into the
+# combined state, in which players and fights are numbered across all inputs. The logs of all inputs are extracted
+# together, so extraction in parallel continues with the next input while the state of one input is being used.
+# Input:
+# state = combined AggregateState to merge the states of all inputs into
+# log_files_per_input = list of (input path, log files of this input as returned by get_log_files)
+# for all other inputs see add_logs_to_state
+# Output:
+# yields (input path, AggregateState of this input with the total values computed) once all logs of an input were
+# added and merged into the combined state
+def add_logs_per_input(state, log_files_per_input, config, jobs, cache, log, profiler, database = None):
+    log_files = [log_file for input_path, input_log_files in log_files_per_input for log_file in input_log_files]
+    with contextlib.closing(extract_logs(log_files, config, jobs, cache)) as extracted_logs:
+        if database is not None:
+            extracted_logs = database.store_extracted_logs(extracted_logs)
+        for input_path, input_log_files in log_files_per_input:
+            input_state = AggregateState()
+            add_extracted_logs(input_state, itertools.islice(extracted_logs, len(input_log_files)), config, log, profiler)
+            with profiler.phase('merge_states'):
+                merge_states(state, input_state, config)
+            yield input_path, input_state
+
+
+
+# Get a copy of a Player or Fight in which compute_avg_values and anonymize_players can change the total and average
+# values and the names without changing the original. The stats per fight and everything else that isn't changed
+# there is shared with the original.
+def copy_for_final_stats(entry):
+    entry_copy = copy.copy(entry)
+    for stats_field in ['total_stats', 'avg_stats', 'average_stats', 'portion_top_stats']:
+        if hasattr(entry, stats_field):
+            setattr(entry_copy, stats_field, dict(getattr(entry, stats_field)))
+    return entry_copy
+
+
+
+# Compute the average values of all players and fights in the state. They are computed on copies of the players and
+# fights, so the state is not changed and more logs can be added to it afterwards.
+# Input:
+# state = AggregateState with the total values computed
+# input_path = input directory or archive, for logging
+# config = configuration to use for top stats computation
+# log = log file to write to
+# anonymize = replace all account and character names
+# profiler = Profiler that measures the time of each phase
+# Output:
+# list of Players with their stats
+# list of all fights (also the skipped ones)
+# was healing found in the logs?
+# was barrier found in the logs?
+def compute_final_stats(state, input_path, config, log, anonymize, profiler):
+    if (not state.fights) or all(fight.skipped for fight in state.fights):
         # list of fights is empty or all were skipped -> no valid fights were found
-        myprint(log, "\n No valid fights were found in "+args.input_directory, "info")
+        myprint(log, "\n No valid fights were found in "+input_path, "info")
         return None, None, None, None
 
-    get_overall_stats(players, fights, config)
+    with profiler.phase('compute_avg_values'):
+        players = [copy_for_final_stats(player) for player in state.players]
+        fights = [copy_for_final_stats(fight) for fight in state.fights]
+        compute_avg_values(players, fights, config)
                 
     myprint(log, "\n", "info", config)
 
     if anonymize:
-        anonymize_players(players, account_index)
+        anonymize_players(players, state.account_index)
     
-    return players, fights, found_healing, found_barrier
+    return players, fights, state.found_healing, state.found_barrier
+
+
+
+# Collect the top stats data.
+# Input:
+# args = cmd line arguments
+# config = configuration to use for top stats computation
+# log = log file to write to
+# anonymize (optional) = replace all account and character names
+# profiler (optional) = Profiler that measures the time of each phase
+# Output:
+# list of Players with their stats
+# list of all fights (also the skipped ones)
+# was healing found in the logs?
+def collect_stat_data(args, config, log, anonymize=False, profiler=None):
+    if profiler is None:
+        profiler = Profiler()
+
+    # in append mode, continue from the state of the last run
+    state = get_initial_state(args, config, log, profiler)
+
+    # iterating over all fights in the directory or archive, or in the database, skipping files that were added in a previous run
+    already_processed = set(state.processed_files)
+    database = get_stats_database(args, config)
+    try:
+        if getattr(args, 'from_database', False):
+            add_extracted_logs(state, database.get_extracted_logs(getattr(args, 'from_date', None), getattr(args, 'to_date', None), already_processed), config, log, profiler)
+        else:
+            log_files = [(file_path, filename) for file_path, filename in get_log_files(args.input_directory) if filename not in already_processed]
+            add_logs_to_state(state, log_files, config, args.jobs, get_log_cache(args, config), log, profiler, database)
+    finally:
+        if database is not None:
+            database.close()
+
+    # the state is stored with the total values of all added logs, so the next run can add more logs to it
+    if args.append:
+        with profiler.phase('save_state'):
+            save_state(args.state_file, state.processed_files, state.players, state.player_index, state.account_index, state.fights, state.found_all_buff_ids, state.found_healing, state.found_barrier, config)
+
+    return compute_final_stats(state, args.input_directory, config, log, anonymize, profiler)
 
 
 
@@ -648,7 +1042,7 @@ def get_overall_squad_stats(fights, config):
     for fight in used_fights:
         for stat in config.stats_to_compute:
             # using max for spike dmg
-            if stat == 'spike_dmg':
+            if stat in config.spike_dmg_windows:
                 overall_squad_stats['total'][stat] = max(overall_squad_stats['total'][stat], fight.total_stats[stat])
             else:
                 overall_squad_stats['total'][stat] += fight.total_stats[stat]
@@ -656,7 +1050,7 @@ def get_overall_squad_stats(fights, config):
     # compute avg values
     normalizer_duration_allies = sum([f.duration * (f.allies - 1) * f.allies for f in used_fights])
     for stat in config.stats_to_compute:
-        if stat == 'spike_dmg':
+        if stat in config.spike_dmg_windows:
             # TODO fix
             spike_dmg = 0
             overall_allies = 0
@@ -101,6 +101,11 @@ relevant_classes_for_stat = {
 duration_for_averages_default = 'total'
 duration_for_averages = {'dist': 'not_running_back'}
 
+# time window in s for each spike damage stat, i.e., the maximum damage dealt to players within this time
+# To rank burst damage over several windows, add more spike damage stats here and in stats_to_compute, relevant_classes_for_stat,
+# stat_names and stat_descriptions, e.g., spike_dmg_windows = {'spike_dmg': 1, 'spike_dmg_3s': 3, 'spike_dmg_5s': 5}
+spike_dmg_windows = {'spike_dmg': 1}
+
 # Default column(s) to sort the xls by. valid values are: "account", "name", "profession", "attendance_num", "attendance_duration", "times_top", "percentage_top", "total", and "avg".
 default_sort_xls_by = ['total', 'avg']
 # Individual column(s) per stat to sort the xls by
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+#    profiler.py contains tools for measuring where the time of a top stats computation goes.
+#    Copyright (C) 2021 Freya Fleckenstein
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import contextlib
+import json
+import time
+
+
+# Collects the wall and cpu time of each phase of a run, the time and number of calls of each stat extractor, and the
+# time needed for each log. Logs report their times in ExtractedLog.profile, which is filled by the extraction if
+# config.profile is set, so this also works for logs extracted in other processes. If the profiler is not enabled,
+# nothing is recorded.
+class Profiler:
+    def __init__(self, enabled = False, num_slowest_logs = 10):
+        self.enabled = enabled
+        self.num_slowest_logs = num_slowest_logs
+        self.phases = {}            # phase -> {'wall_time', 'cpu_time', 'calls'}
+        self.stats = {}             # stat -> [number of calls, time in s]
+        self.logs = list()          # {'filename', 'load_time', 'extract_time', 'total_time'} for each extracted log
+        self.num_cached_logs = 0
+
+
+    # context manager that adds the time spent in it to phase
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            phase = self.phases.setdefault(name, {'wall_time': 0., 'cpu_time': 0., 'calls': 0})
+            phase['wall_time'] += time.perf_counter() - wall_start
+            phase['cpu_time'] += time.process_time() - cpu_start
+            phase['calls'] += 1
+
+
+    # add the times measured while extracting a log
+    # Input:
+    # extracted = ExtractedLog; its profile is None if it was taken from the cache
+    def add_log(self, extracted):
+        if not self.enabled:
+            return
+        if extracted.profile is None:
+            self.num_cached_logs += 1
+            return
+        for stat, (calls, stat_time) in extracted.profile['stats'].items():
+            stat_times = self.stats.setdefault(stat, [0, 0.])
+            stat_times[0] += calls
+            stat_times[1] += stat_time
+        self.logs.append({'filename': extracted.filename,
+                          'load_time': extracted.profile['load_time'],
+                          'extract_time': extracted.profile['extract_time'],
+                          'total_time': extracted.profile['load_time'] + extracted.profile['extract_time']})
+
+
+    # get all measured times
+    # Output:
+    # dict with the times of all phases, stats and the slowest logs
+    def get_report(self):
+        stats = sorted(self.stats.items(), key = lambda entry: entry[1][1], reverse = True)
+        return {'phases': {name: {key: round(value, 6) for key, value in phase.items()} for name, phase in self.phases.items()},
+                'stats': {stat: {'calls': calls, 'time': round(stat_time, 6)} for stat, (calls, stat_time) in stats},
+                'logs': {'num_extracted': len(self.logs),
+                         'num_cached': self.num_cached_logs,
+                         'load_time': round(sum(log['load_time'] for log in self.logs), 6),
+                         'extract_time': round(sum(log['extract_time'] for log in self.logs), 6)},
+                'slowest_logs': [{key: round(value, 6) if key != 'filename' else value for key, value in log.items()}
+                                 for log in sorted(self.logs, key = lambda log: log['total_time'], reverse = True)[:self.num_slowest_logs]]}
+
+
+    # write all measured times to a json file
+    def write_report(self, filename):
+        if not self.enabled:
+            return
+        with open(filename, 'w') as report_file:
+            json.dump(self.get_report(), report_file, indent=4)
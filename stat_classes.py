@@ -2,6 +2,7 @@
 
 from dataclasses import dataclass,field
 from enum import Enum
+import numpy as np
 
 class StatType(Enum):
     TOTAL = 1                       # top total stat value over all fights
@@ -36,7 +37,7 @@ class Player:
     average_stats: dict = field(default_factory=dict)         # what's the average stat per second for this player? (exception: deaths are per minute)
     portion_top_stats: dict = field(default_factory=dict)     # what percentage of fights did this player get into top for each stat, in relation to the number of fights they were involved in?
                                                               # = consistency_stats/num_fights_present
-    stats_per_fight: list = field(default_factory=list)       # what's the value of each stat for this player in each fight?
+    stats_per_fight: list = field(default_factory=list)       # what's the value of each stat for this player in each fight? (PlayerStatsPerFight once the player was added to a StatsPerFight)
 
     def initialize(self, config):
         self.duration_present = {'total': 0, 'active': 0, 'in_combat': 0, 'not_running_back': 0}
@@ -47,6 +48,332 @@ class Player:
         self.portion_top_stats = {key: 0 for key in config.stats_to_compute}
 
 
+
+        
+# This class stores the stats of all players in all fights, but only for the fights each player took part in. Each
+# participation of a player in a fight is one row of a table whose columns are the stats to compute, the duration types
+# of duration_present, and stats that are only stored for players present in a fight (group). The rows of each fight and
+# of each player are indexed, and players that didn't take part in a fight have the empty stats from the config there.
+# Values are stored as floats together with a mask of which values were ints, so every value is returned exactly as it
+# was stored. Whether a player was present in a fight is stored in a separate mask.
+class StatsPerFight:
+    optional_stats = ['group']      # stats that are only set if a player was present in the fight
+
+    def __init__(self, config):
+        self.keys = list(config.empty_stats.keys())     # keys of the stats per fight in the order of config.empty_stats
+        self.columns = {}                               # column of each stat
+        self.duration_columns = {}                      # column of each duration type
+        empty_values = list()
+        for key, value in config.empty_stats.items():
+            if key == 'present_in_fight':
+                continue
+            if key == 'duration_present':
+                for duration_type, duration_value in value.items():
+                    self.duration_columns[duration_type] = len(empty_values)
+                    empty_values.append(duration_value)
+            else:
+                self.columns[key] = len(empty_values)
+                empty_values.append(value)
+        # optional stats are nan as long as they weren't set
+        for key in self.optional_stats:
+            self.columns[key] = len(empty_values)
+            empty_values.append(np.nan)
+        self.empty_values = np.array(empty_values, dtype=np.float64)
+        self.empty_is_int = np.array([not isinstance(value, float) for value in empty_values], dtype=bool)
+
+        self.fight_rows = list()        # for each fight, dict of player -> row of the players that took part in it
+        self.player_rows = list()       # for each player, dict of fight -> row of the fights the player took part in
+        self.num_rows = 0
+        self.values = np.empty((0, len(empty_values)), dtype=np.float64)
+        self.is_int = np.empty((0, len(empty_values)), dtype=bool)
+        self.present = np.empty(0, dtype=bool)
+        self.resize(64)
+
+
+    @property
+    def num_fights(self):
+        return len(self.fight_rows)
+
+
+    @property
+    def num_players(self):
+        return len(self.player_rows)
+
+
+    # resize the table to the given number of rows
+    def resize(self, row_capacity):
+        values = np.empty((row_capacity, len(self.empty_values)), dtype=np.float64)
+        is_int = np.empty(values.shape, dtype=bool)
+        present = np.zeros(row_capacity, dtype=bool)
+        values[:self.num_rows] = self.values[:self.num_rows]
+        is_int[:self.num_rows] = self.is_int[:self.num_rows]
+        present[:self.num_rows] = self.present[:self.num_rows]
+        self.values, self.is_int, self.present = values, is_int, present
+
+
+    # only store the used rows when pickling
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['values'] = self.values[:self.num_rows].copy()
+        state['is_int'] = self.is_int[:self.num_rows].copy()
+        state['present'] = self.present[:self.num_rows].copy()
+        return state
+
+
+    # add a fight in which no player was present, returns the fight number
+    def add_fight(self):
+        self.fight_rows.append({})
+        return self.num_fights - 1
+
+
+    # add a player who wasn't present in any fight, returns the PlayerStatsPerFight of the new player
+    def add_player(self):
+        self.player_rows.append({})
+        return PlayerStatsPerFight(self, self.num_players - 1)
+
+
+    # append all fights of another StatsPerFight with the same columns
+    # Input:
+    # other = StatsPerFight whose fights are appended
+    # player_map = list of the index in this StatsPerFight of each player of other
+    def append_fights(self, other, player_map):
+        for fight in range(other.num_fights):
+            new_fight = self.add_fight()
+            for player, row in other.fight_rows[fight].items():
+                new_row = self.get_or_add_row(new_fight, player_map[player])
+                self.values[new_row] = other.values[row]
+                self.is_int[new_row] = other.is_int[row]
+                self.present[new_row] = other.present[row]
+
+
+    # get the row of a player in a fight, or None if the player didn't take part in it
+    def get_row(self, fight, player):
+        return self.player_rows[player].get(fight)
+
+
+    # get the row of a player in a fight, adding a row with the empty stats if the player didn't take part in it yet
+    def get_or_add_row(self, fight, player):
+        row = self.player_rows[player].get(fight)
+        if row is None:
+            if self.num_rows >= self.values.shape[0]:
+                self.resize(2 * self.values.shape[0])
+            row = self.num_rows
+            self.num_rows += 1
+            self.values[row] = self.empty_values
+            self.is_int[row] = self.empty_is_int
+            self.present[row] = False
+            self.fight_rows[fight][player] = row
+            self.player_rows[player][fight] = row
+        return row
+
+
+    # get the players that took part in a fight, sorted by index
+    def get_fight_players(self, fight):
+        return sorted(self.fight_rows[fight])
+
+
+    # get the fights a player took part in, in ascending order
+    def get_player_fights(self, player):
+        return sorted(self.player_rows[player])
+
+
+    def get_entry(self, fight, player, column):
+        row = self.get_row(fight, player)
+        if row is None:
+            value, value_is_int = self.empty_values[column], self.empty_is_int[column]
+        else:
+            value, value_is_int = self.values[row, column], self.is_int[row, column]
+        if value_is_int:
+            return int(value)
+        return float(value)
+
+
+    def set_entry(self, fight, player, column, value):
+        row = self.get_or_add_row(fight, player)
+        self.values[row, column] = value
+        self.is_int[row, column] = not isinstance(value, float)
+
+
+    # get the value of stat key of a player in a fight, as it would be in a dict from config.empty_stats
+    def get_value(self, fight, player, key):
+        if key == 'present_in_fight':
+            row = self.get_row(fight, player)
+            return row is not None and bool(self.present[row])
+        if key == 'duration_present':
+            return {duration_type: self.get_entry(fight, player, column) for duration_type, column in self.duration_columns.items()}
+        value = self.get_entry(fight, player, self.columns[key])
+        if value != value:
+            raise KeyError(key)
+        return value
+
+
+    # set the value of stat key of a player in a fight
+    def set_value(self, fight, player, key, value):
+        if key == 'present_in_fight':
+            self.present[self.get_or_add_row(fight, player)] = value
+        elif key == 'duration_present':
+            for duration_type, duration_value in value.items():
+                self.set_entry(fight, player, self.duration_columns[duration_type], duration_value)
+        else:
+            self.set_entry(fight, player, self.columns[key], value)
+
+
+    # get all stats of a player in a fight as a dict, with the keys in the same order as config.empty_stats
+    def get_stats(self, fight, player):
+        row = self.get_row(fight, player)
+        if row is None:
+            values, is_int, present = self.empty_values.tolist(), self.empty_is_int.tolist(), False
+        else:
+            values, is_int, present = self.values[row].tolist(), self.is_int[row].tolist(), bool(self.present[row])
+        stats = {}
+        for key in self.keys:
+            if key == 'present_in_fight':
+                stats[key] = present
+            elif key == 'duration_present':
+                stats[key] = {duration_type: int(values[column]) if is_int[column] else values[column] for duration_type, column in self.duration_columns.items()}
+            else:
+                column = self.columns[key]
+                stats[key] = int(values[column]) if is_int[column] else values[column]
+        for key in self.optional_stats:
+            column = self.columns[key]
+            if values[column] == values[column]:
+                stats[key] = int(values[column]) if is_int[column] else values[column]
+        return stats
+
+
+    # set all stats of a player in a fight from a dict like config.empty_stats
+    def set_stats(self, fight, player, stats):
+        for key, value in stats.items():
+            self.set_value(fight, player, key, value)
+
+
+    # get the values of a stat in a fight as numpy array over the players that took part in it, see get_fight_players
+    def get_fight_stat_array(self, fight, stat):
+        rows = [self.fight_rows[fight][player] for player in self.get_fight_players(fight)]
+        return self.values[rows, self.columns[stat]]
+
+
+    # get the values of a stat in a fight as list over the players that took part in it, see get_fight_players
+    def get_fight_stat_values(self, fight, stat):
+        return self.get_rows_values([self.fight_rows[fight][player] for player in self.get_fight_players(fight)], self.columns[stat])
+
+
+    # get the durations of a duration type in a fight as list over the players that took part in it, see get_fight_players
+    def get_fight_duration_values(self, fight, duration_type):
+        return self.get_rows_values([self.fight_rows[fight][player] for player in self.get_fight_players(fight)], self.duration_columns[duration_type])
+
+
+    # get the values of several stats in a fight for the players that were present in it
+    # Output: list of the present players sorted by index, array of their values indexed by [player, stat]
+    def get_fight_stat_matrix(self, fight, stats):
+        players = [player for player in self.get_fight_players(fight) if self.present[self.fight_rows[fight][player]]]
+        rows = np.array([self.fight_rows[fight][player] for player in players], dtype=np.intp)
+        columns = np.array([self.columns[stat] for stat in stats], dtype=np.intp)
+        return players, self.values[np.ix_(rows, columns)]
+
+
+    def get_rows_values(self, rows, column):
+        values = self.values[rows, column].tolist()
+        is_int = self.is_int[rows, column].tolist()
+        return [int(value) if value_is_int else value for value, value_is_int in zip(values, is_int)]
+
+
+    # get the values of a stat in a fight as numpy array over all players
+    def get_stat_array(self, fight, stat):
+        values = np.full(self.num_players, self.empty_values[self.columns[stat]])
+        players = self.get_fight_players(fight)
+        values[players] = self.get_fight_stat_array(fight, stat)
+        return values
+
+
+    # get the values of a stat in a fight as list over all players
+    def get_stat_values(self, fight, stat):
+        return self.get_column_values(fight, self.columns[stat])
+
+
+    # get the durations of a duration type in a fight as list over all players
+    def get_duration_values(self, fight, duration_type):
+        return self.get_column_values(fight, self.duration_columns[duration_type])
+
+
+    def get_column_values(self, fight, column):
+        empty_value = self.empty_values[column].item()
+        values = [int(empty_value) if self.empty_is_int[column] else empty_value] * self.num_players
+        for player, row in self.fight_rows[fight].items():
+            values[player] = int(self.values[row, column]) if self.is_int[row, column] else self.values[row, column].item()
+        return values
+
+
+
+# This class gives access to the stats of one player in a StatsPerFight like a list of dicts, one for each fight.
+class PlayerStatsPerFight:
+    def __init__(self, stats, player):
+        self.stats = stats      # the StatsPerFight the stats are stored in
+        self.player = player    # index of the player in stats
+
+    def __len__(self):
+        return self.stats.num_fights
+
+    def __getitem__(self, fight):
+        if fight < 0:
+            fight += self.stats.num_fights
+        if fight < 0 or fight >= self.stats.num_fights:
+            raise IndexError("fight index out of range")
+        return PlayerFightStats(self.stats, fight, self.player)
+
+    def __setitem__(self, fight, player_stats):
+        self[fight].update(player_stats)
+
+    def __iter__(self):
+        for fight in range(self.stats.num_fights):
+            yield PlayerFightStats(self.stats, fight, self.player)
+
+    # the fights this player took part in, in ascending order
+    def get_fights(self):
+        return self.stats.get_player_fights(self.player)
+
+    # all stats of this player as list of dicts
+    def to_list(self):
+        return [self.stats.get_stats(fight, self.player) for fight in range(self.stats.num_fights)]
+
+
+
+# This class gives access to the stats of one player in one fight in a StatsPerFight like a dict.
+class PlayerFightStats:
+    def __init__(self, stats, fight, player):
+        self.stats = stats
+        self.fight = fight
+        self.player = player
+
+    def __getitem__(self, key):
+        return self.stats.get_value(self.fight, self.player, key)
+
+    def __setitem__(self, key, value):
+        self.stats.set_value(self.fight, self.player, key, value)
+
+    def __contains__(self, key):
+        return key in self.to_dict()
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def update(self, player_stats):
+        self.stats.set_stats(self.fight, self.player, player_stats)
+
+    # all stats of this player in this fight as dict
+    def to_dict(self):
+        return self.stats.get_stats(self.fight, self.player)
+
+
         
 # This class stores information about a fight
 @dataclass
@@ -60,10 +387,86 @@ class Fight:
     kills: int = 0                                        # number of kills
     start_time: str = ""                                  # start time of the fight
     squad_composition: dict = field(default_factory=dict) # squad composition of the fight (how many of which class)
-    tag_positions_until_death: list = field(default_factory=list) # position of the commander until he died (empty if no com was found or more than one com was found)
+    tag_positions_until_death: np.ndarray = field(default_factory=lambda: np.empty((0, 2))) # position of the commander until he died as array of [x, y] (empty if no com was found or more than one com was found)
     polling_rate: int = 150                                       # polling rate of position data as read from json (could get overwritten)
     inch_to_pixel: float = 0.009                                  # inch to pixel conversion value; different for some maps -> might get overwritten
-    
+
+
+
+# This class stores all data extracted from a single log. It does not depend on any other log, so logs can be
+# extracted independently (e.g. in parallel) and added to the top stats afterwards in the order of the log files.
+@dataclass
+class ExtractedLog:
+    filename: str = ""                                    # name of the log file
+    fight: Fight = field(default_factory=Fight)           # fight stats of this log
+    # (account, character name, profession, stats, errors) for each player in the fight, where stats are the stats of this player
+    # in this fight and errors the problems found while computing them
+    player_stats: list = field(default_factory=list)
+    buff_map: dict = field(default_factory=dict)          # relevant entries of the buff map of this log
+    found_healing: bool = False                           # was healing found in this log?
+    found_barrier: bool = False                           # was barrier found in this log?
+    log_output: str = ""                                  # output written to the log file during extraction
+    profile: dict = None                                  # if config.profile is set, the time needed for loading and extracting this log and for each stat, see profiler.py
+
+
+
+# This class describes how a stat is extracted from the json data of a player in a fight.
+@dataclass
+class StatExtractor:
+    extract: object                 # function(PlayerFightContext, stat) returning the value of the stat, or -1 if it can't be computed
+    json_paths: list = field(default_factory=list)     # json key paths read by extract, relative to one entry of 'players'
+    needs_duration: bool = True     # the stat can only be computed if the player was present according to its duration_for_averages
+    depends_on: list = field(default_factory=list)     # stats whose values extract uses; they are extracted once per player and fight and shared
+
+
+
+# This class stores indices into the json data of one player for finding the times in combat by binary search,
+# see json_helper.get_combat_time_index
+@dataclass
+class CombatTimeIndex:
+    health_times: object = None                             # numpy array of the timestamps in healthPercents, or None if there are none
+    health_drops: object = None                             # numpy array of the indices in healthPercents at which the health dropped
+    power_damage_changes: object = None                     # numpy array of the seconds at which powerDamage1S changed, or None if there is no powerDamage1S
+    deaths: list = field(default_factory=list)              # (death start, death end) for each death in combatReplayData
+    down_start_by_end: dict = field(default_factory=dict)   # end of a down in combatReplayData -> start of the first down ending then
+
+
+
+# This class stores everything needed to extract the stats of one player in one fight.
+@dataclass
+class PlayerFightContext:
+    player_json: dict = field(default_factory=dict)         # json data of the player, one entry of the 'players' list
+    fight: object = None                                    # Fight the player was in
+    duration_present: dict = field(default_factory=dict)    # duration_present of the player in this fight, filled while extracting
+    config: object = None                                   # the config used for top stats computation
+    buff_indices: dict = field(default_factory=dict)        # index of buff id -> entry for lists of buffs in player_json, see json_helper.get_buff_index
+    cumulative_distances_to_tag: object = None              # cumulative sum of the distances to tag at each position, see json_helper.get_average_distance_to_tag
+    stat_values: dict = field(default_factory=dict)         # values of all stats extracted so far, see json_helper.extract_stat
+    stat_times: dict = None                                 # if profiling, stat -> [number of calls, time in s] of the stat extractors
+    combat_time_index: object = None                        # CombatTimeIndex of the player, see json_helper.get_combat_time_index
+
+
+# This class stores the state of the top stats computation after all logs were added and the total values were computed,
+# but before the averages were computed. It is written to a state file, so new logs can be appended in the next run.
+# The states of consecutive shards of fights can be merged into one, see parse_top_stats_tools.merge_states.
+@dataclass
+class AggregateState:
+    config_hash: str = ""                                     # hash of the config fields the state depends on
+    processed_files: list = field(default_factory=list)       # names of all log files that were added, in the order of the fights
+    players: list = field(default_factory=list)               # list of all Players
+    player_index: dict = field(default_factory=dict)          # dictionary that matches each player/profession combo to its index in players list
+    account_index: dict = field(default_factory=dict)         # dictionary that matches each account name to a list of its indices in players list
+    fights: list = field(default_factory=list)                # list of all Fights, also the skipped ones
+    found_all_buff_ids: bool = False                          # were all buff ids found in the logs so far?
+    found_healing: bool = False                               # was healing found in the logs so far?
+    found_barrier: bool = False                               # was barrier found in the logs so far?
+    # buff ids and stacking types as read from the logs so far (see Config)
+    squad_buff_ids: dict = field(default_factory=dict)
+    self_buff_ids: dict = field(default_factory=dict)
+    buffs_stacking_duration: list = field(default_factory=list)
+    buffs_stacking_intensity: list = field(default_factory=list)
+    buffs_not_stacking: list = field(default_factory=list)
+
 
     
 # This class stores the configuration for running the top stats.
@@ -93,6 +496,7 @@ class Config:
     empty_stats: dict = field(default_factory=dict)                 # stat values to initialize player stats per fight
     stats_to_compute: list = field(default_factory=list)            # all stats that should be computed
     duration_for_averages: dict = field(default_factory=dict)       # which duration type should be used to compute the avg for each stat? (one of 'total', 'active', 'in_combat', 'not_running_back')
+    spike_dmg_windows: dict = field(default_factory=dict)           # time window in s for each spike damage stat
 
     squad_buff_ids: dict = field(default_factory=dict)              # dict of squad buff name to buff id as read from buffMap
     self_buff_ids: dict = field(default_factory=dict)               # dict of self buff name to buff id as read from buffMap
@@ -105,6 +509,10 @@ class Config:
     errors: list = field(default_factory=list)
     log_level: str = "info"
 
+    stat_extractors: list = field(default_factory=list)             # list of (stat, StatExtractor) for all stats to compute, see json_helper.get_stat_extractors
+    profile: bool = False                                           # measure the time needed for extracting each log and stat, see profiler.py
+    json_backend: str = "auto"                                      # json decoder for reading the logs, see json_reader.get_json_backend
+
     xls_column_names: list = field(default_factory=list)
 
     
@@ -135,6 +543,14 @@ def fill_config(config_input, log):
         if stat not in config.duration_for_averages:
             config.duration_for_averages[stat] = config_input.duration_for_averages_default
 
+    if hasattr(config_input, "spike_dmg_windows"):
+        config.spike_dmg_windows = config_input.spike_dmg_windows
+    else:
+        config.spike_dmg_windows = {'spike_dmg': 1}
+    for stat, window in config.spike_dmg_windows.items():
+        if not isinstance(window, int) or isinstance(window, bool) or window <= 0:
+            raise ValueError("The time window of "+stat+" in spike_dmg_windows has to be a positive whole number of seconds, not "+repr(window)+".")
+
     if hasattr(config_input, "sort_xls_by"):
         config.sort_xls_by = config_input.sort_xls_by
     else:
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+#    stats_database.py stores the stats extracted from each log in an SQLite database.
+#    Copyright (C) 2021 Freya Fleckenstein
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import sqlite3
+from datetime import datetime, time, timedelta, timezone
+
+import numpy as np
+
+from stat_classes import ExtractedLog, Fight
+from log_cache import get_config_hash
+
+# fights holds the header of each fight and everything else extracted from its log, players the players of each fight,
+# and stats the value of each stat of each player in each fight. The durations a player was present are stored as
+# stats duration_present.<duration type>. Values keep their type, so ints stay ints. start_time is the start time as
+# given by Elite Insights in the local time of the recording player, start_timestamp the same time as unix timestamp,
+# which is used for selecting and ordering fights.
+schema = """
+CREATE TABLE IF NOT EXISTS fights (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    start_timestamp INTEGER NOT NULL,
+    end_time TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    allies INTEGER NOT NULL,
+    enemies INTEGER NOT NULL,
+    kills INTEGER NOT NULL,
+    skipped INTEGER NOT NULL,
+    squad_composition TEXT NOT NULL,
+    players_running_healing_addon TEXT,
+    polling_rate INTEGER NOT NULL,
+    inch_to_pixel REAL NOT NULL,
+    tag_positions_until_death TEXT NOT NULL,
+    buff_map TEXT NOT NULL,
+    found_healing INTEGER NOT NULL,
+    found_barrier INTEGER NOT NULL,
+    log_output TEXT NOT NULL,
+    UNIQUE (filename, start_time)
+);
+CREATE TABLE IF NOT EXISTS players (
+    fight_id INTEGER NOT NULL,
+    player INTEGER NOT NULL,
+    account TEXT NOT NULL,
+    name TEXT NOT NULL,
+    profession TEXT NOT NULL,
+    errors TEXT NOT NULL,
+    PRIMARY KEY (fight_id, player)
+);
+CREATE TABLE IF NOT EXISTS stats (
+    fight_id INTEGER NOT NULL,
+    player INTEGER NOT NULL,
+    stat TEXT NOT NULL,
+    value,
+    PRIMARY KEY (fight_id, player, stat)
+);
+CREATE INDEX IF NOT EXISTS fights_start_timestamp ON fights (start_timestamp);
+CREATE INDEX IF NOT EXISTS players_account ON players (account);
+CREATE INDEX IF NOT EXISTS players_profession ON players (profession);
+CREATE INDEX IF NOT EXISTS stats_stat ON stats (stat, fight_id);
+"""
+
+
+
+# get the unix timestamp of a start time as given by Elite Insights
+# Input:
+# start_time = start time including the utc offset, e.g. 2022-01-17 19:58:05 +01:00
+# Output:
+# seconds since 1970-01-01 00:00:00 UTC
+def get_start_timestamp(start_time):
+    return int(datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S %z').timestamp())
+
+
+
+# get the unix timestamp of the beginning of a day in UTC
+# Input:
+# day = datetime.date
+# Output:
+# seconds since 1970-01-01 00:00:00 UTC
+def get_day_timestamp(day):
+    return int(datetime.combine(day, time(), timezone.utc).timestamp())
+
+
+
+# get the rows of the stats table for the stats of a player in a fight
+# Input:
+# player_stats = dict of stat -> value as in ExtractedLog.player_stats
+# Output:
+# list of (stat, value)
+def get_stat_rows(player_stats):
+    rows = list()
+    for stat, value in player_stats.items():
+        if stat == 'duration_present':
+            rows.extend(('duration_present.'+duration_type, duration) for duration_type, duration in value.items())
+        else:
+            rows.append((stat, value))
+    return rows
+
+
+
+# This class stores the ExtractedLog of each log file in an SQLite database, so the top stats of any set of fights can
+# be computed again without the logs. Fights are identified by the file name of their log and their start time, so
+# logs with the same name from different directories are kept apart, and can be selected by their start time. Fights
+# extracted with a config that changes the extracted stats are stored again, see log_cache.get_config_hash; only
+# fights extracted with the current config are read.
+class StatsDatabase:
+    def __init__(self, database_file, config):
+        self.config_hash = get_config_hash(config)
+        self.stats_to_compute = list(config.stats_to_compute)
+        self.connection = sqlite3.connect(database_file)
+        self.connection.executescript(schema)
+
+
+    def close(self):
+        self.connection.close()
+
+
+    # is this log stored with the current config?
+    # Input:
+    # filename = file name of the log
+    # start_time = start time of its fight, see Fight.start_time
+    def contains(self, filename, start_time):
+        row = self.connection.execute("SELECT config_hash FROM fights WHERE filename = ? AND start_time = ?", (filename, start_time)).fetchone()
+        return row is not None and row[0] == self.config_hash
+
+
+    # store an ExtractedLog, replacing an older entry for the same log. Everything of one fight is written in one
+    # transaction.
+    def put(self, extracted):
+        fight = extracted.fight
+        healing_addon = getattr(fight, 'players_running_healing_addon', None)
+        with self.connection:
+            self.delete(extracted.filename, fight.start_time)
+            cursor = self.connection.execute("INSERT INTO fights (filename, config_hash, start_time, start_timestamp, end_time, duration, allies, enemies, kills, skipped, squad_composition, players_running_healing_addon, polling_rate, inch_to_pixel, tag_positions_until_death, buff_map, found_healing, found_barrier, log_output) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                             (extracted.filename, self.config_hash, fight.start_time, get_start_timestamp(fight.start_time), fight.end_time, fight.duration, fight.allies, fight.enemies, fight.kills, fight.skipped,
+                                              json.dumps(fight.squad_composition), None if healing_addon is None else json.dumps(healing_addon),
+                                              fight.polling_rate, fight.inch_to_pixel, json.dumps(fight.tag_positions_until_death.tolist()),
+                                              json.dumps(extracted.buff_map), extracted.found_healing, extracted.found_barrier, extracted.log_output))
+            fight_id = cursor.lastrowid
+            self.connection.executemany("INSERT INTO players (fight_id, player, account, name, profession, errors) VALUES (?, ?, ?, ?, ?, ?)",
+                                        [(fight_id, player, account, name, profession, json.dumps(errors))
+                                         for player, (account, name, profession, player_stats, errors) in enumerate(extracted.player_stats)])
+            self.connection.executemany("INSERT INTO stats (fight_id, player, stat, value) VALUES (?, ?, ?, ?)",
+                                        [(fight_id, player, stat, value)
+                                         for player, (account, name, profession, player_stats, errors) in enumerate(extracted.player_stats)
+                                         for stat, value in get_stat_rows(player_stats)])
+
+
+    # remove a log from the database, see contains
+    def delete(self, filename, start_time):
+        row = self.connection.execute("SELECT id FROM fights WHERE filename = ? AND start_time = ?", (filename, start_time)).fetchone()
+        if row is None:
+            return
+        for table in ['stats', 'players']:
+            self.connection.execute("DELETE FROM "+table+" WHERE fight_id = ?", row)
+        self.connection.execute("DELETE FROM fights WHERE id = ?", row)
+
+
+    # store all extracted logs that are not in the database yet and pass them on
+    # Input:
+    # extracted_logs = iterable of ExtractedLogs, see parse_top_stats_tools.extract_logs
+    # Output:
+    # yields the same ExtractedLogs
+    def store_extracted_logs(self, extracted_logs):
+        for extracted in extracted_logs:
+            if not self.contains(extracted.filename, extracted.fight.start_time):
+                self.put(extracted)
+            yield extracted
+
+
+    # get the stored fights that started in a date range, ordered by their start time
+    # Input:
+    # from_date, to_date (optional) = datetime.date of the first and last day (UTC) of the fights to get
+    # skip_files (optional) = collection of file names of logs to leave out
+    # Output:
+    # yields the ExtractedLog of each fight
+    def get_extracted_logs(self, from_date = None, to_date = None, skip_files = ()):
+        query = "SELECT id, filename, start_time, end_time, duration, allies, enemies, kills, skipped, squad_composition, players_running_healing_addon, polling_rate, inch_to_pixel, tag_positions_until_death, buff_map, found_healing, found_barrier, log_output FROM fights WHERE config_hash = ?"
+        parameters = [self.config_hash]
+        if from_date is not None:
+            query += " AND start_timestamp >= ?"
+            parameters.append(get_day_timestamp(from_date))
+        if to_date is not None:
+            query += " AND start_timestamp < ?"
+            parameters.append(get_day_timestamp(to_date + timedelta(days = 1)))
+        query += " ORDER BY start_timestamp, filename"
+
+        for row in self.connection.execute(query, parameters).fetchall():
+            if row[1] in skip_files:
+                continue
+            yield self.get_extracted_log(row)
+
+
+    # build the ExtractedLog of a row of the fights table
+    def get_extracted_log(self, row):
+        (fight_id, filename, start_time, end_time, duration, allies, enemies, kills, skipped, squad_composition, healing_addon,
+         polling_rate, inch_to_pixel, tag_positions, buff_map, found_healing, found_barrier, log_output) = row
+        fight = Fight(skipped = bool(skipped), duration = duration, enemies = enemies, allies = allies, kills = kills, start_time = start_time,
+                      squad_composition = json.loads(squad_composition), polling_rate = polling_rate, inch_to_pixel = inch_to_pixel,
+                      tag_positions_until_death = np.asarray(json.loads(tag_positions), dtype=np.float64).reshape(-1, 2))
+        fight.end_time = end_time
+        fight.total_stats = {key: 0 for key in self.stats_to_compute}
+        fight.avg_stats = {key: 0 for key in self.stats_to_compute}
+        if healing_addon is not None:
+            fight.players_running_healing_addon = json.loads(healing_addon)
+
+        player_stats = {}
+        for player, stat, value in self.connection.execute("SELECT player, stat, value FROM stats WHERE fight_id = ? ORDER BY rowid", (fight_id,)):
+            stats = player_stats.setdefault(player, {})
+            if stat.startswith('duration_present.'):
+                stats.setdefault('duration_present', {})[stat[len('duration_present.'):]] = value
+            elif stat == 'present_in_fight':
+                stats[stat] = bool(value)
+            else:
+                stats[stat] = value
+        players = [(account, name, profession, player_stats.get(player, {}), json.loads(errors))
+                   for player, account, name, profession, errors in self.connection.execute("SELECT player, account, name, profession, errors FROM players WHERE fight_id = ? ORDER BY player", (fight_id,))]
+
+        return ExtractedLog(filename = filename, fight = fight, player_stats = players, buff_map = json.loads(buff_map),
+                            found_healing = bool(found_healing), found_barrier = bool(found_barrier), log_output = log_output)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+
+import sys
+from os import path
+sys.path.append( path.dirname( path.dirname( path.abspath(__file__) ) ) )
+
+import unittest
+import importlib
+import io
+import os
+import tempfile
+from aggregate_state import *
+from stat_classes import *
+
+class TestAggregateState(unittest.TestCase):
+    def setUp(self):
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        self.config = fill_config(parser_config, None)
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.directory.name, "top_stats_state.pickle")
+        self.log = io.StringIO()
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_save_and_load(self):
+        self.assertIsNone(load_state(self.state_file, self.config, self.log))
+
+        player = Player("acc", "name", "Scourge")
+        player.initialize(self.config)
+        player.total_stats['dmg_total'] = 1234.5678
+        fight = Fight(duration = 60)
+        self.config.squad_buff_ids = {'might': 740}
+        self.config.buffs_stacking_intensity = ['might']
+        save_state(self.state_file, ["log0.json"], [player], {"name Scourge": 0}, {"acc": [0]}, [fight], False, True, False, self.config)
+
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        new_config = fill_config(parser_config, None)
+        state = load_state(self.state_file, new_config, self.log)
+        self.assertEqual(state.processed_files, ["log0.json"])
+        self.assertEqual(state.players[0].total_stats['dmg_total'], 1234.5678)
+        self.assertEqual(state.player_index, {"name Scourge": 0})
+        self.assertEqual(state.account_index, {"acc": [0]})
+        self.assertEqual(state.fights[0].duration, 60)
+        self.assertEqual((state.found_all_buff_ids, state.found_healing, state.found_barrier), (False, True, False))
+        # buff ids are restored in the config
+        self.assertEqual(new_config.squad_buff_ids, {'might': 740})
+        self.assertEqual(new_config.buffs_stacking_intensity, ['might'])
+
+        # a state created with a different configuration is not used
+        new_config.min_enemy_players += 1
+        self.assertIsNone(load_state(self.state_file, new_config, self.log))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,11 +4,18 @@
 import sys
 from os import path
 sys.path.append( path.dirname( path.dirname( path.abspath(__file__) ) ) )
+sys.path.append( path.join( path.dirname( path.dirname( path.abspath(__file__) ) ), "benchmark" ) )
 
 import unittest
 import importlib
+import io
+import subprocess
+import argparse
+import tempfile
 from io_helper import *
 from stat_classes import *
+from parse_top_stats_tools import collect_stat_data, get_overall_squad_stats, get_overall_raid_stats, get_top_players, StatType
+from ei_log_generator import generate_logs
 
 class TestIoHelper(unittest.TestCase):
     def test_get_professions_and_length(self):
@@ -93,6 +100,57 @@ class TestIoHelper(unittest.TestCase):
         self.assertEqual(total_fight_duration['m'], 0)
         self.assertEqual(total_fight_duration['s'], 0)
 
+
+    def test_write_json_sections(self):
+        fight = Fight(duration = 30)
+        fight.tag_positions_until_death = np.array([[1.5, 2.], [3., 4.25]])
+        sections = [("stats", {'a': 1, 'b': {'c': [1, 2.5, "x"], 'd': {}}}), ("fights", [fight]), ("empty", [])]
+        expected = {"stats": sections[0][1], "fights": [get_json_value(fight)], "empty": []}
+        # fights are written as dicts of their attributes sorted by name
+        self.assertEqual(list(expected["fights"][0].keys()), sorted(vars(fight).keys()))
+        self.assertEqual(expected["fights"][0]["tag_positions_until_death"], [[1.5, 2.], [3., 4.25]])
+
+        for compact in [False, True]:
+            json_file = io.StringIO()
+            write_json_sections(json_file, [(key, value if key != "fights" else (get_json_value(f) for f in value)) for key, value in sections], compact)
+            if compact:
+                self.assertEqual(json_file.getvalue(), json.dumps(expected, separators=(',', ':')))
+            else:
+                self.assertEqual(json_file.getvalue(), json.dumps(expected, indent=4))
+
+
+    def test_xls_modules_are_imported_lazily(self):
+        # pandas and openpyxl are only needed for writing the xls file, checked in a fresh interpreter
+        check = "import sys; import parse_top_stats_tools, io_helper; print('pandas' in sys.modules, 'openpyxl' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", check], cwd = path.dirname( path.dirname( path.abspath(__file__) ) ), capture_output = True, text = True, check = True).stdout
+        self.assertEqual(output.split(), ["False", "False"])
+
+
+    def test_write_xls(self):
+        import openpyxl
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        log = io.StringIO()
+        config = fill_config(parser_config, log)
+        stats = ['dmg_total', 'deaths']
+        with tempfile.TemporaryDirectory() as directory:
+            generate_logs(directory, 3, 10, 20, 60)
+            args = argparse.Namespace(input_directory = directory, append = False, jobs = 1, cache_directory = None)
+            players, fights, found_healing, found_barrier = collect_stat_data(args, config, log)
+            overall_squad_stats = get_overall_squad_stats(fights, config)
+            overall_raid_stats = get_overall_raid_stats(fights)
+            top_average_stat_players = {stat: get_top_players(players, config, stat, StatType.AVERAGE) for stat in stats}
+            xls_output_filename = path.join(directory, "top_stats.xlsx")
+            write_xls(fights, overall_squad_stats, overall_raid_stats, players, top_average_stat_players, stats, config, xls_output_filename)
+
+            # the fights overview comes first, followed by one sheet per stat in the given order
+            book = openpyxl.load_workbook(xls_output_filename)
+            self.assertEqual(book.sheetnames, ["Fights Overview"] + [config.stat_names[stat] for stat in stats])
+            self.assertEqual(book["Fights Overview"].cell(row = len(fights) + 2, column = 1).value, "Sum/Avg. in used fights")
+            for stat in stats:
+                self.assertEqual(book[config.stat_names[stat]]["A1"].value, config.stat_descriptions[stat])
+            book.close()
+
+
         
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+
+import sys
+from os import path
+sys.path.append( path.dirname( path.dirname( path.abspath(__file__) ) ) )
+
+import unittest
+import importlib
+from json_helper import *
+from stat_classes import *
+from profiler import Profiler
+
+class TestJsonHelper(unittest.TestCase):
+    def setUp(self):
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        self.config = fill_config(parser_config, None)
+        self.config.squad_buff_ids = {'stab': '1122', 'fire_aura': '5544'}
+        self.config.self_buff_ids = {'med_kit': '30000'}
+        self.player_json = {'name': 'name',
+                            'dpsAll': [{'damage': 1000}],
+                            'targetDamage1S': [[[0, 100, 300]], [[0, 0, 50]]],
+                            'squadBuffs': [{'id': 1122, 'buffData': [{'generation': 12.5}]}],
+                            'buffUptimes': [{'id': 5544, 'buffData': [{'uptime': 3.25}]}],
+                            'selfBuffs': [{'id': 30000, 'buffData': [{'generation': 1}]}]}
+        self.duration_present = {'total': 3, 'active': 3, 'in_combat': 3, 'not_running_back': 3}
+
+
+    def test_get_stat_extractors(self):
+        stat_extractors = dict(get_stat_extractors(self.config))
+        self.assertEqual(list(stat_extractors.keys()), self.config.stats_to_compute)
+        self.assertEqual(stat_extractors['dmg_total'].extract, get_dmg_total)
+        self.assertEqual(stat_extractors['stab'].extract, get_squad_buff_generation)
+        self.assertEqual(stat_extractors['fire_aura'].extract, get_aura_uptime)
+        self.assertEqual(stat_extractors['med_kit'].extract, get_self_buff_present)
+        # extractors are only looked up once per config
+        self.assertIs(get_stat_extractors(self.config), get_stat_extractors(self.config))
+
+
+    def test_get_stat_from_player_json(self):
+        fight = Fight()
+        get_stat = lambda stat: get_stat_from_player_json(self.player_json, stat, fight, self.duration_present, self.config)
+        self.assertEqual(get_stat('dmg_total'), 1000)
+        self.assertEqual(get_stat('dmg_players'), 350)
+        self.assertEqual(get_stat('dmg_other'), 650)
+        self.assertEqual(get_stat('spike_dmg'), 250)
+        self.assertEqual(get_stat('stab'), 12.5)
+        self.assertEqual(get_stat('fire_aura'), 3.25)
+        self.assertEqual(get_stat('med_kit'), 1)
+        self.assertEqual(self.config.errors, [])
+
+        # buffs that are not in the log count as 0, buffs that are in the log but not in the player's json too, with an error
+        self.assertEqual(get_stat('might'), 0)
+        self.assertEqual(self.config.errors, [])
+        self.config.squad_buff_ids['might'] = '740'
+        self.assertEqual(get_stat('might'), 0)
+        self.assertEqual(len(self.config.errors), 1)
+
+        # missing values and players that weren't present give -1
+        self.config.errors = list()
+        del self.player_json['dpsAll']
+        self.assertEqual(get_stat('dmg_other'), -1)
+        self.assertEqual(len(self.config.errors), 1)
+        self.duration_present[self.config.duration_for_averages['stab']] = 0
+        self.assertEqual(get_stat('stab'), -1)
+        self.assertEqual(len(self.config.errors), 2)
+
+
+
+    def test_stat_dependencies(self):
+        self.assertEqual(get_stat_dependencies('dmg_other', self.config), ['dmg_total', 'dmg_players', 'dmg_other'])
+        self.assertEqual(get_stat_dependencies('dmg_total', self.config), ['dmg_total'])
+        self.assertIn(('players', 'dpsAll'), get_json_paths(self.config))
+
+        # base values are extracted once per player and fight and errors are reported once
+        del self.player_json['dpsAll']
+        context = PlayerFightContext(self.player_json, Fight(), self.duration_present, self.config)
+        self.assertEqual(extract_stat(context, 'dmg_total'), -1)
+        self.assertEqual(extract_stat(context, 'dmg_other'), -1)
+        self.assertEqual(context.stat_values, {'dmg_total': -1, 'dmg_players': 350, 'dmg_other': -1})
+        self.assertEqual(len(self.config.errors), 1)
+
+        stat_extractors['cyclic'] = StatExtractor(get_unsupported_stat, depends_on = ['cyclic'])
+        try:
+            self.assertRaises(ValueError, get_stat_dependencies, 'cyclic', self.config)
+        finally:
+            del stat_extractors['cyclic']
+
+
+    def test_stat_times(self):
+        # only actual extractions are counted, not memoized values
+        context = PlayerFightContext(self.player_json, Fight(), self.duration_present, self.config, stat_times = {})
+        extract_stat(context, 'dmg_other')
+        extract_stat(context, 'dmg_total')
+        extract_stat(context, 'dmg_other')
+        self.assertEqual({stat: times[0] for stat, times in context.stat_times.items()}, {'dmg_total': 1, 'dmg_players': 1, 'dmg_other': 1})
+        self.assertTrue(all(times[1] >= 0 for times in context.stat_times.values()))
+
+        profiler = Profiler(True)
+        with profiler.phase('extract'):
+            profiler.add_log(ExtractedLog(filename = 'log.json', profile = {'stats': context.stat_times, 'load_time': 0.5, 'extract_time': 0.25}))
+            profiler.add_log(ExtractedLog(filename = 'cached.json'))
+        report = profiler.get_report()
+        self.assertEqual(report['phases']['extract']['calls'], 1)
+        self.assertEqual(report['stats']['dmg_other']['calls'], 1)
+        self.assertEqual((report['logs']['num_extracted'], report['logs']['num_cached']), (1, 1))
+        self.assertEqual(report['slowest_logs'][0]['total_time'], 0.75)
+
+
+    def test_get_spike_dmg(self):
+        fight = Fight()
+        self.config.spike_dmg_windows = {'spike_dmg': 1, 'spike_dmg_2s': 2, 'spike_dmg_5s': 5}
+        self.config.duration_for_averages['spike_dmg_2s'] = 'total'
+        self.config.duration_for_averages['spike_dmg_5s'] = 'total'
+        # cumulative damage to both targets: 0, 100, 350, 400
+        self.player_json['targetDamage1S'] = [[[0, 100, 300, 300]], [[0, 0, 50, 100]]]
+        get_stat = lambda stat: get_stat_from_player_json(self.player_json, stat, fight, self.duration_present, self.config)
+        self.assertEqual(get_stat('spike_dmg'), 250)
+        self.assertEqual(get_stat('spike_dmg_2s'), 350)
+        self.assertEqual(get_stat('spike_dmg_5s'), 400)
+        self.assertIsInstance(get_stat('spike_dmg'), int)
+
+        self.player_json['targetDamage1S'] = [[[]]]
+        self.assertEqual(get_stat('spike_dmg'), -1)
+
+
+    def test_get_distance_to_tag(self):
+        player_positions = [[3, 4], [0, 0], [6.5, 1.5], [1, 1]]
+        tag_positions = [[0, 0], [0, 0], [0.5, 1.5]]
+        # only positions where both are known are used
+        self.assertEqual(get_distance_to_tag(player_positions, tag_positions, 0.5), (5 + 0 + 6) / 3 / 0.5)
+        self.assertEqual(get_distance_to_tag([], tag_positions, 0.5), -1)
+
+        fight = Fight(inch_to_pixel = 0.5)
+        fight.tag_positions_until_death = np.asarray(tag_positions, dtype=np.float64)
+        self.player_json['combatReplayData'] = {'positions': player_positions}
+        context = PlayerFightContext(self.player_json, fight, self.duration_present, self.config)
+        self.assertEqual(get_average_distance_to_tag(context, 1), 5 / 1 / 0.5)
+        self.assertEqual(get_average_distance_to_tag(context, 2), 5 / 2 / 0.5)
+        self.assertEqual(get_average_distance_to_tag(context, 10), 11 / 3 / 0.5)
+        self.assertEqual(get_average_distance_to_tag(context, 0), -1)
+
+
+    def test_get_combat_time_breakpoints(self):
+        # took damage at 2 s, died at 5 s after being downed at 4 s, dealt damage again at 9 s, died again without being downed
+        self.player_json['damage1S'] = [[0] * 15]
+        self.player_json['healthPercents'] = [[0, 100], [2000, 80], [3000, 90], [8000, 100]]
+        self.player_json['powerDamage1S'] = [[0, 0, 0, 0, 0, 0, 0, 0, 0, 10, 10, 10, 10, 10, 10]]
+        self.player_json['combatReplayData'] = {'dead': [[5000, 7000], [12000, 13000]], 'down': [[4000, 5000]]}
+        context = PlayerFightContext(self.player_json, Fight(), self.duration_present, self.config)
+        combat_time_index = get_combat_time_index(context)
+        self.assertEqual(combat_time_index.health_drops.tolist(), [1])
+        self.assertEqual(combat_time_index.power_damage_changes.tolist(), [9])
+        self.assertEqual(get_combat_time_breakpoints(self.player_json, combat_time_index), [[2000, 5000], [9000, 15000]])
+        self.assertEqual(get_first_down_and_death_time(self.player_json, combat_time_index), (4, 5))
+        self.assertEqual(get_time_in_combat(context, 'time_in_combat'), 9)
+        # without any damage, combat starts at the initial time
+        self.assertEqual(get_combat_start_from_player_json(10000, self.player_json, combat_time_index), 10000)
+
+
+    def test_get_buff_index(self):
+        context = PlayerFightContext(self.player_json, Fight(), self.duration_present, self.config)
+        buffs = [{'id': 1, 'buffData': 'first'}, {'buffData': 'no id'}, {'id': 2, 'buffData': 'second'}, {'id': 1, 'buffData': 'duplicate'}]
+        buff_index = get_buff_index(context, 'squadBuffs', buffs)
+        self.assertEqual(buff_index, {1: buffs[0], 2: buffs[2]})
+        # the index is built only once per context
+        self.assertIs(get_buff_index(context, 'squadBuffs', []), buff_index)
+
+        # regen healing uses the same kind of index
+        fight = Fight()
+        fight.players_running_healing_addon = ['name']
+        self.config.squad_buff_ids['regen'] = '718'
+        self.player_json['extHealingStats'] = {'totalHealingDist': [[{'id': 1, 'totalHealing': 5, 'hits': 1}, {'id': 718, 'totalHealing': 600, 'hits': 30}]]}
+        self.assertEqual(get_stat_from_player_json(self.player_json, 'heal_from_regen', fight, self.duration_present, self.config), 600)
+        self.assertEqual(get_stat_from_player_json(self.player_json, 'hits_from_regen', fight, self.duration_present, self.config), 30)
+        del self.config.squad_buff_ids['regen']
+        self.assertEqual(get_stat_from_player_json(self.player_json, 'heal_from_regen', fight, self.duration_present, self.config), -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
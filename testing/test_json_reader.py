@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+
+import sys
+from os import path
+sys.path.append( path.dirname( path.dirname( path.abspath(__file__) ) ) )
+
+import unittest
+import unittest.mock
+import gzip
+import io
+import json
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+from json_reader import *
+
+class TestJsonReader(unittest.TestCase):
+    def test_get_projection_from_paths(self):
+        paths = [('a',), ('b', 'c'), ('b', 'd', 'e'), ('f', 'g'), ('f',)]
+        projection = get_projection_from_paths(paths)
+        self.assertEqual(projection, {'a': True, 'b': {'c': True, 'd': {'e': True}}, 'f': True})
+
+
+    def test_loads_projected(self):
+        json_data = {"duration": "01m 30s 100ms",
+                     "players": [{"name": "A", "rotation": [{"id": 1, "skills": [{"castTime": 0}]}], "statsAll": [{"killed": 1}],
+                                  "combatReplayData": {"positions": [[1.5, 2], [3, 4]], "dead": [], "start": 0}},
+                                 {"name": "B \"quoted\" {[", "statsAll": [], "combatReplayData": {}}],
+                     "targets": [],
+                     "buffMap": {"b740": {"name": "Might", "stacking": True}}}
+        projection = get_projection_from_paths([('duration',), ('buffMap',), ('players', 'name'), ('players', 'statsAll'),
+                                                ('players', 'combatReplayData', 'positions'), ('targets', 'enemyPlayer')])
+        expected = {"duration": "01m 30s 100ms",
+                    "players": [{"name": "A", "statsAll": [{"killed": 1}], "combatReplayData": {"positions": [[1.5, 2], [3, 4]]}},
+                                {"name": "B \"quoted\" {[", "statsAll": [], "combatReplayData": {}}],
+                    "targets": [],
+                    "buffMap": {"b740": {"name": "Might", "stacking": True}}}
+
+        # compact and indented documents give the same result
+        self.assertEqual(loads_projected(json.dumps(json_data), projection), expected)
+        self.assertEqual(loads_projected(json.dumps(json_data, indent=4), projection), expected)
+        # without projection, everything is kept
+        self.assertEqual(loads_projected(json.dumps(json_data), None), json_data)
+
+        # all installed backends give the same result, also when decoding from a memory-mapped file
+        for backend in json_backends:
+            try:
+                get_json_backend(backend)
+            except ValueError:
+                continue
+            self.assertEqual(loads_json(json.dumps(json_data).encode('utf-8'), projection, backend), expected)
+            self.assertEqual(loads_json(json.dumps(json_data).encode('utf-8'), None, backend), json_data)
+            with tempfile.TemporaryDirectory() as directory:
+                with open(os.path.join(directory, "log.json"), 'w', encoding='utf-8') as f:
+                    json.dump(json_data, f, indent=4)
+                self.assertEqual(load_json_file(os.path.join(directory, "log.json"), projection, backend), expected)
+        self.assertIn(get_json_backend('auto'), json_backends)
+        self.assertRaises(ValueError, get_json_backend, 'unknown')
+
+        with self.assertRaises(json.JSONDecodeError):
+            loads_projected('{"duration": "1m 2s" "players": []}', projection)
+        with self.assertRaises(json.JSONDecodeError):
+            loads_projected('{"duration": "1m 2s"} []', projection)
+
+
+    def test_loads_projected_in_chunks(self):
+        json_data = {"duration": -0.5, "name": "\u00fcn\u00ef \"{[c]}\" \u20ac",
+                     "players": [{"name": "A B", "skipped": {"nested": [[[[1.25e-3, "]"], {"x": "}"}]]], "s": "a b"}, "kept": [12345, -6.5e7, True, None]},
+                                 {"skipped": "x\\\" y", "kept": {"a": [1, [2, {"b": "c d"}]]}, "name": "C"}]}
+        projection = get_projection_from_paths([('duration',), ('name',), ('players', 'name'), ('players', 'kept')])
+        expected = {"duration": -0.5, "name": json_data["name"],
+                    "players": [{"name": "A B", "kept": [12345, -6.5e7, True, None]}, {"kept": {"a": [1, [2, {"b": "c d"}]]}, "name": "C"}]}
+        # chunks end in the middle of strings, numbers, multi-byte characters and skipped values
+        with unittest.mock.patch("json_reader.chunk_size", 1):
+            for document in [json.dumps(json_data), json.dumps(json_data, indent=4, ensure_ascii=False)]:
+                self.assertEqual(loads_projected(document, projection), expected)
+                self.assertEqual(loads_projected(document.encode('utf-8'), projection), expected)
+                self.assertEqual(load_projected(io.BytesIO(document.encode('utf-8')), projection), expected)
+                # truncated documents are errors
+                with self.assertRaises(ValueError):
+                    loads_projected(document.encode('utf-8')[:len(document) // 2], projection)
+
+
+    def test_load_json_file_compressed(self):
+        json_data = {"duration": "01m 30s 100ms", "players": [{"name": "A", "rotation": [1, 2]}, {"name": "B"}]}
+        projection = get_projection_from_paths([('duration',), ('players', 'name')])
+        expected = {"duration": "01m 30s 100ms", "players": [{"name": "A"}, {"name": "B"}]}
+        document = json.dumps(json_data).encode('utf-8')
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "log.json.gz"), 'wb') as f:
+                f.write(gzip.compress(document))
+            # the size in the trailer of the last member doesn't cover the earlier members
+            with open(os.path.join(directory, "members.json.gz"), 'wb') as f:
+                f.write(gzip.compress(document[:10]) + gzip.compress(document[10:]))
+            with zipfile.ZipFile(os.path.join(directory, "logs.zip"), 'w') as archive:
+                archive.writestr("log.json", document)
+                archive.writestr("log.json.gz", gzip.compress(document))
+            file_paths = [os.path.join(directory, "log.json.gz"), os.path.join(directory, "members.json.gz"),
+                          (os.path.join(directory, "logs.zip"), "log.json"), (os.path.join(directory, "logs.zip"), "log.json.gz")]
+
+            # all installed backends give the same result for gzipped logs and logs in archives
+            for backend in json_backends:
+                try:
+                    get_json_backend(backend)
+                except ValueError:
+                    continue
+                for file_path in file_paths:
+                    self.assertEqual(load_json_file(file_path, projection, backend), expected)
+                    self.assertEqual(load_json_file(file_path, None, backend), json_data)
+            close_archive()
+
+            with open(os.path.join(directory, "members.json.gz"), 'rb') as f:
+                self.assertEqual(read_gzip(f), document)
+            self.assertEqual(read_gzip(io.BytesIO(b'')), b'')
+
+
+    def test_get_log_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            logs = {"b.json": b'{"fight": "b"}', "a.json.gz": gzip.compress(b'{"fight": "a"}'), "notes.txt": b'',
+                    "top_stats_detailed.json": b'{}'}
+            for filename, content in logs.items():
+                with open(os.path.join(directory, filename), 'wb') as f:
+                    f.write(content)
+            with zipfile.ZipFile(os.path.join(directory, "c.zip"), 'w') as archive:
+                archive.writestr("night/2.json", b'{"fight": "c2"}')
+                archive.writestr("night/1.json.gz", gzip.compress(b'{"fight": "c1"}'))
+                archive.writestr("night/readme.txt", b'')
+            with tarfile.open(os.path.join(directory, "d.tar.gz"), 'w:gz') as archive:
+                for member, content in [("4.json", b'{"fight": "d4"}'), ("3.json", b'{"fight": "d3"}')]:
+                    info = tarfile.TarInfo(member)
+                    info.size = len(content)
+                    archive.addfile(info, io.BytesIO(content))
+
+            # logs in archives are sorted by their name in the archive and take the place of the archive
+            log_files = get_log_files(directory)
+            self.assertEqual([filename for file_path, filename in log_files],
+                             ["a.json.gz", "b.json", "c.zip/night/1.json.gz", "c.zip/night/2.json", "d.tar.gz/3.json", "d.tar.gz/4.json"])
+            self.assertEqual([load_json_file(file_path)["fight"] for file_path, filename in log_files], ["a", "b", "c1", "c2", "d3", "d4"])
+            self.assertEqual([filename for file_path, filename in get_log_files(os.path.join(directory, "d.tar.gz"))], ["d.tar.gz/3.json", "d.tar.gz/4.json"])
+
+            # glob patterns given as input only match directories and archives, each input is used once
+            self.assertEqual(get_input_paths([os.path.join(directory, "*.zip"), os.path.join(directory, "*"), "missing"]),
+                             [os.path.join(directory, "c.zip"), os.path.join(directory, "d.tar.gz"), "missing"])
+
+            # files that were changed recently may still be written
+            for filename in os.listdir(directory):
+                os.utime(os.path.join(directory, filename), (time.time() - 60, time.time() - 60))
+            os.utime(os.path.join(directory, "b.json"))
+            self.assertEqual(len(get_log_files(directory, 30)), 5)
+            self.assertEqual(len(get_log_files(directory)), 6)
+            close_archive()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+
+import sys
+from os import path
+sys.path.append( path.dirname( path.dirname( path.abspath(__file__) ) ) )
+
+import unittest
+import importlib
+import os
+import tempfile
+import time
+from log_cache import *
+from stat_classes import *
+
+class TestLogCache(unittest.TestCase):
+    def setUp(self):
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        self.config = fill_config(parser_config, None)
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_files = list()
+        for i in range(3):
+            log_file = os.path.join(self.directory.name, "log"+str(i)+".json")
+            with open(log_file, 'w') as f:
+                f.write("{}")
+            self.log_files.append(log_file)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_get_and_put(self):
+        cache = LogCache(os.path.join(self.directory.name, "cache"), 1024 * 1024, self.config)
+        self.assertIsNone(cache.get(self.log_files[0]))
+
+        cache.put(self.log_files[0], ExtractedLog(filename = "log0.json"))
+        self.assertEqual(cache.get(self.log_files[0]).filename, "log0.json")
+        self.assertIsNone(cache.get(self.log_files[1]))
+
+        # changing the log file invalidates the entry
+        with open(self.log_files[0], 'w') as f:
+            f.write("{\"changed\": true}")
+        self.assertIsNone(cache.get(self.log_files[0]))
+
+        # changing relevant parts of the config invalidates the entry
+        cache.put(self.log_files[1], ExtractedLog(filename = "log1.json"))
+        self.config.min_enemy_players += 1
+        other_cache = LogCache(os.path.join(self.directory.name, "cache"), 1024 * 1024, self.config)
+        self.assertIsNone(other_cache.get(self.log_files[1]))
+
+
+    def test_evict(self):
+        cache_directory = os.path.join(self.directory.name, "cache")
+        cache = LogCache(cache_directory, 1024 * 1024, self.config)
+        for i, log_file in enumerate(self.log_files):
+            cache.put(log_file, ExtractedLog(filename = "log"+str(i)+".json"))
+            # make sure modification times differ
+            entry_path = cache.get_entry_path(log_file)
+            os.utime(entry_path, ns = (time.time_ns(), time.time_ns() - (10 - i) * 10**9))
+        entry_size = os.path.getsize(cache.get_entry_path(self.log_files[0]))
+
+        # using log 0 makes log 1 the least recently used one
+        self.assertIsNotNone(cache.get(self.log_files[0]))
+        cache.max_size = 2 * entry_size
+        cache.evict()
+        self.assertIsNotNone(cache.get(self.log_files[0]))
+        self.assertIsNone(cache.get(self.log_files[1]))
+        self.assertIsNotNone(cache.get(self.log_files[2]))
+        self.assertLessEqual(cache.size, 2 * entry_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+
+import sys
+from os import path
+sys.path.append( path.dirname( path.dirname( path.abspath(__file__) ) ) )
+sys.path.append( path.join( path.dirname( path.dirname( path.abspath(__file__) ) ), "benchmark" ) )
+
+import unittest
+import importlib
+import argparse
+import copy
+import io
+import os
+import pickle
+import tempfile
+from parse_top_stats_tools import *
+from io_helper import get_json_value
+from ei_log_generator import generate_logs
+
+class TestParseTopStatsTools(unittest.TestCase):
+    def setUp(self):
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        self.config = fill_config(parser_config, None)
+        self.config.stats_to_compute = ['dmg_total', 'deaths', 'stripped']
+        self.config.num_players_considered_top = {'dmg_total': 2, 'deaths': 1, 'stripped': 1}
+        self.config.empty_stats = {stat: -1 for stat in self.config.stats_to_compute}
+        self.config.empty_stats['duration_present'] = {'total': 0, 'active': 0, 'in_combat': 0, 'not_running_back': 0}
+        self.config.empty_stats['present_in_fight'] = False
+
+
+    def add_fight(self, players, stats_per_fight, values):
+        fight_number = stats_per_fight.add_fight()
+        for player, player_values in values.items():
+            player_stats = {key: value for key, value in self.config.empty_stats.items()}
+            player_stats['present_in_fight'] = True
+            player_stats.update(player_values)
+            players[player].stats_per_fight[fight_number] = player_stats
+        return fight_number
+
+
+    def test_increase_top_x_reached(self):
+        stats_per_fight = StatsPerFight(self.config)
+        players = list()
+        for i in range(5):
+            player = Player("account"+str(i), "name"+str(i), "Firebrand")
+            player.initialize(self.config)
+            player.stats_per_fight = stats_per_fight.add_player()
+            players.append(player)
+
+        # double places count as top, players that weren't in the fight don't
+        fight_number = self.add_fight(players, stats_per_fight, {0: {'dmg_total': 500, 'deaths': 0, 'stripped': 3},
+                                                                 1: {'dmg_total': 300, 'deaths': 0, 'stripped': 0},
+                                                                 2: {'dmg_total': 300, 'deaths': 1, 'stripped': 0},
+                                                                 4: {'dmg_total': 0, 'deaths': -1, 'stripped': -1}})
+        increase_top_x_reached(players, self.config, fight_number)
+        self.assertEqual([player.consistency_stats['dmg_total'] for player in players], [1, 1, 1, 0, 0])
+        self.assertEqual([player.consistency_stats['deaths'] for player in players], [1, 1, 0, 0, 0])
+        self.assertEqual([player.consistency_stats['stripped'] for player in players], [0, 1, 1, 0, 0])
+
+        # only valid values can be top; if nobody had 0 deaths, the fewest deaths are top
+        fight_number = self.add_fight(players, stats_per_fight, {0: {'dmg_total': 0, 'deaths': 2, 'stripped': -1},
+                                                                 3: {'dmg_total': 10, 'deaths': 1, 'stripped': -1}})
+        increase_top_x_reached(players, self.config, fight_number)
+        self.assertEqual([player.consistency_stats['dmg_total'] for player in players], [1, 1, 1, 1, 0])
+        self.assertEqual([player.consistency_stats['deaths'] for player in players], [1, 1, 0, 1, 0])
+        self.assertEqual([player.consistency_stats['stripped'] for player in players], [0, 1, 1, 0, 0])
+
+
+
+    def test_collect_stat_data_in_parallel(self):
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        log = io.StringIO()
+        config = fill_config(parser_config, log)
+        with tempfile.TemporaryDirectory() as directory:
+            generate_logs(directory, 4, 10, 20, 60)
+            results = list()
+            for jobs in [1, 2]:
+                args = argparse.Namespace(input_directory = directory, append = False, jobs = jobs, cache_directory = None)
+                results.append(collect_stat_data(args, config, log))
+
+        # the logs are added in the same order, so everything is the same as when parsing them one after another
+        (players, fights, found_healing, found_barrier), (parallel_players, parallel_fights, parallel_found_healing, parallel_found_barrier) = results
+        self.assertEqual(len(fights), 4)
+        self.assertEqual([get_json_value(player) for player in parallel_players], [get_json_value(player) for player in players])
+        self.assertEqual([get_json_value(fight) for fight in parallel_fights], [get_json_value(fight) for fight in fights])
+        self.assertEqual((parallel_found_healing, parallel_found_barrier), (found_healing, found_barrier))
+
+
+    def test_add_logs_per_input(self):
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        log = io.StringIO()
+        config = fill_config(parser_config, log)
+        with tempfile.TemporaryDirectory() as directory:
+            log_files = generate_logs(directory, 5, 10, 20, 60)
+            for night, night_log_files in [("night1", log_files[:3]), ("night2", log_files[3:])]:
+                os.makedirs(os.path.join(directory, night))
+                for log_file in night_log_files:
+                    os.rename(log_file, os.path.join(directory, night, path.basename(log_file)))
+            input_paths = [os.path.join(directory, "night1"), os.path.join(directory, "night2")]
+
+            state = AggregateState()
+            input_states = dict(add_logs_per_input(state, [(input_path, get_log_files(input_path)) for input_path in input_paths], config, 1, None, log, Profiler()))
+            self.assertEqual([len(input_states[input_path].fights) for input_path in input_paths], [3, 2])
+            self.assertEqual(len(state.fights), 5)
+            self.assertEqual(state.processed_files, input_states[input_paths[0]].processed_files + input_states[input_paths[1]].processed_files)
+
+            # players are identified across inputs, and their totals are the sums of the totals of each input
+            self.assertEqual(set(state.player_index), set(input_states[input_paths[0]].player_index) | set(input_states[input_paths[1]].player_index))
+            for name_and_prof, player_number in state.player_index.items():
+                input_totals = [input_state.players[input_state.player_index[name_and_prof]].total_stats['dmg_total']
+                                for input_state in input_states.values() if name_and_prof in input_state.player_index]
+                self.assertEqual(state.players[player_number].total_stats['dmg_total'], sum(input_totals))
+
+
+
+    def test_merge_states(self):
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        log = io.StringIO()
+        config = fill_config(parser_config, log)
+        # everything a state holds that the final top stats depend on
+        get_values = lambda state: ([(player.account, player.name, player.profession, player.num_fights_present, player.duration_present, player.normalization_time_allies,
+                                      player.swapped_build, player.consistency_stats, player.total_stats, player.stats_per_fight.to_list()) for player in state.players],
+                                    state.player_index, state.account_index, [fight.total_stats for fight in state.fights], state.processed_files)
+        with tempfile.TemporaryDirectory() as directory:
+            generate_logs(directory, 6, 10, 20, 60)
+            log_files = get_log_files(directory)
+            single_state = AggregateState()
+            add_logs_to_state(single_state, log_files, config, 1, None, log, Profiler())
+
+            shards = list()
+            for first_log in range(0, 6, 2):
+                shard = AggregateState()
+                add_logs_to_state(shard, log_files[first_log:first_log+2], config, 1, None, log, Profiler())
+                # shards can be computed elsewhere and stored
+                shards.append(pickle.loads(pickle.dumps(shard)))
+
+        shard_values = [get_values(shard) for shard in shards]
+        left_merged = merge_states(merge_states(copy.deepcopy(shards[0]), shards[1], config), shards[2], config)
+        right_merged = merge_states(copy.deepcopy(shards[0]), merge_states(copy.deepcopy(shards[1]), shards[2], config), config)
+        self.assertEqual(get_values(left_merged), get_values(single_state))
+        self.assertEqual(get_values(right_merged), get_values(single_state))
+        # the merged states are not changed
+        self.assertEqual([get_values(shard) for shard in shards], shard_values)
+
+        self.assertEqual(get_values(merge_states(AggregateState(), single_state, config)), get_values(single_state))
+        self.assertRaises(ValueError, merge_states, AggregateState(config_hash = "a"), AggregateState(config_hash = "b"), config)
+
+
+    def test_compute_final_stats(self):
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        log = io.StringIO()
+        config = fill_config(parser_config, log)
+        get_final_values = lambda players, fights: ([(player.total_stats, player.average_stats, player.portion_top_stats, player.attendance_percentage) for player in players],
+                                                    [(fight.total_stats, fight.avg_stats) for fight in fights])
+        with tempfile.TemporaryDirectory() as directory:
+            generate_logs(directory, 4, 10, 20, 60)
+            log_files = get_log_files(directory)
+            single_state = AggregateState()
+            add_logs_to_state(single_state, log_files, config, 1, None, log, Profiler())
+
+            # the state isn't changed, so more logs can be added to it afterwards
+            state = AggregateState()
+            add_logs_to_state(state, log_files[:2], config, 1, None, log, Profiler())
+            state_values = pickle.dumps(state)
+            players, fights, found_healing, found_barrier = compute_final_stats(state, directory, config, log, True, Profiler())
+            self.assertEqual(pickle.dumps(state), state_values)
+            self.assertTrue(all(player.name.startswith("Anon ") for player in players))
+            add_logs_to_state(state, log_files[2:], config, 1, None, log, Profiler())
+
+        self.assertEqual(get_final_values(*compute_final_stats(state, directory, config, log, False, Profiler())[:2]),
+                         get_final_values(*compute_final_stats(single_state, directory, config, log, False, Profiler())[:2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+
+import sys
+from os import path
+sys.path.append( path.dirname( path.dirname( path.abspath(__file__) ) ) )
+
+import unittest
+import importlib
+import pickle
+import types
+from stat_classes import *
+
+class TestStatsPerFight(unittest.TestCase):
+    def setUp(self):
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        self.config = fill_config(parser_config, None)
+
+
+    def get_player_stats(self, value):
+        player_stats = {key: value for key, value in self.config.empty_stats.items()}
+        player_stats['duration_present'] = {'total': 60, 'active': 50, 'in_combat': 40, 'not_running_back': 30.5}
+        player_stats['present_in_fight'] = True
+        player_stats['dmg_total'] = value
+        player_stats['might'] = value / 4
+        player_stats['group'] = 2
+        return player_stats
+
+
+    def test_stats_per_fight(self):
+        stats_per_fight = StatsPerFight(self.config)
+        players_stats_per_fight = list()
+        # add enough fights and players to resize the matrix
+        for fight in range(20):
+            self.assertEqual(stats_per_fight.add_fight(), fight)
+            players_stats_per_fight.append(stats_per_fight.add_player())
+            players_stats_per_fight[-1][fight] = self.get_player_stats(fight * 100)
+
+        empty_stats = {key: value for key, value in self.config.empty_stats.items()}
+        for player, player_stats_per_fight in enumerate(players_stats_per_fight):
+            self.assertEqual(len(player_stats_per_fight), 20)
+            # players that joined later have empty stats in the fights before
+            self.assertEqual(player_stats_per_fight[0].to_dict(), empty_stats if player > 0 else self.get_player_stats(0))
+            self.assertFalse('group' in player_stats_per_fight[-1] and player < 19)
+            player_stats = player_stats_per_fight[player].to_dict()
+            self.assertEqual(player_stats, self.get_player_stats(player * 100))
+            self.assertEqual(list(player_stats.keys()), list(self.get_player_stats(0).keys()))
+            # ints stay ints and floats stay floats
+            self.assertIsInstance(player_stats['dmg_total'], int)
+            self.assertIsInstance(player_stats['might'], float)
+            self.assertIsInstance(player_stats['duration_present']['total'], int)
+            self.assertIsInstance(player_stats['duration_present']['not_running_back'], float)
+            self.assertEqual(player_stats_per_fight[-1]['dmg_total'], 1900 if player == 19 else -1)
+
+        self.assertEqual(stats_per_fight.get_stat_values(5, 'dmg_total'), [-1] * 5 + [500] + [-1] * 14)
+        self.assertEqual(stats_per_fight.get_duration_values(5, 'total'), [0] * 5 + [60] + [0] * 14)
+
+        # pickling keeps the stats and the players' access to them
+        unpickled = pickle.loads(pickle.dumps(players_stats_per_fight))
+        self.assertEqual([p.to_list() for p in unpickled], [p.to_list() for p in players_stats_per_fight])
+        self.assertEqual(unpickled[0].stats.add_fight(), 20)
+        self.assertEqual(unpickled[3][20]['dmg_total'], -1)
+
+
+    def test_only_participations_are_stored(self):
+        stats_per_fight = StatsPerFight(self.config)
+        players_stats_per_fight = [stats_per_fight.add_player() for player in range(3)]
+        for fight in range(4):
+            stats_per_fight.add_fight()
+        players_stats_per_fight[2][1] = self.get_player_stats(200)
+        players_stats_per_fight[0][1] = self.get_player_stats(100)
+        players_stats_per_fight[2][3] = self.get_player_stats(300)
+
+        self.assertEqual(stats_per_fight.num_rows, 3)
+        self.assertEqual(stats_per_fight.get_fight_players(1), [0, 2])
+        self.assertEqual(stats_per_fight.get_fight_players(2), [])
+        self.assertEqual(players_stats_per_fight[2].get_fights(), [1, 3])
+        self.assertEqual(stats_per_fight.get_fight_stat_values(1, 'dmg_total'), [100, 200])
+        self.assertEqual(stats_per_fight.get_fight_duration_values(3, 'not_running_back'), [30.5])
+        self.assertEqual(stats_per_fight.get_stat_values(1, 'dmg_total'), [100, -1, 200])
+        self.assertEqual(stats_per_fight.get_stat_array(3, 'dmg_total').tolist(), [-1, -1, 300])
+        # reading the stats of a player who wasn't in a fight doesn't add an entry
+        self.assertFalse(players_stats_per_fight[1][1]['present_in_fight'])
+        self.assertEqual(stats_per_fight.num_rows, 3)
+
+
+
+class TestFillConfig(unittest.TestCase):
+    def test_spike_dmg_windows(self):
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        config_input = types.SimpleNamespace(**vars(parser_config))
+        config_input.spike_dmg_windows = {'spike_dmg': 1, 'spike_dmg_5s': 5}
+        self.assertEqual(fill_config(config_input, None).spike_dmg_windows, {'spike_dmg': 1, 'spike_dmg_5s': 5})
+        # time windows have to be positive whole numbers of seconds
+        for window in [0, -1, 1.5, "1", True, None]:
+            config_input = types.SimpleNamespace(**vars(parser_config))
+            config_input.spike_dmg_windows = {'spike_dmg': 1, 'spike_dmg_long': window}
+            with self.assertRaisesRegex(ValueError, "spike_dmg_long"):
+                fill_config(config_input, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+
+import sys
+from os import path
+sys.path.append( path.dirname( path.dirname( path.abspath(__file__) ) ) )
+sys.path.append( path.join( path.dirname( path.dirname( path.abspath(__file__) ) ), "benchmark" ) )
+
+import unittest
+import copy
+import importlib
+import tempfile
+from datetime import date
+from stats_database import *
+from stat_classes import *
+from io_helper import get_json_value
+from parse_top_stats_tools import extract_stats_from_file
+from ei_log_generator import generate_logs
+
+class TestStatsDatabase(unittest.TestCase):
+    def setUp(self):
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        self.config = fill_config(parser_config, None)
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_file = path.join(self.directory.name, "stats.sqlite")
+        self.extracted_logs = list()
+        for i, log_file in enumerate(generate_logs(self.directory.name, 3, 10, 20, 60)):
+            extracted = extract_stats_from_file(log_file, "log"+str(i)+".json", self.config)
+            extracted.fight.start_time = "2022-01-"+str(17 + i)+" 20:00:00 +01:00"
+            self.extracted_logs.append(extracted)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_put_and_get(self):
+        database = StatsDatabase(self.database_file, self.config)
+        self.assertEqual(list(database.store_extracted_logs(self.extracted_logs)), self.extracted_logs)
+        self.assertTrue(database.contains("log1.json", "2022-01-18 20:00:00 +01:00"))
+        self.assertFalse(database.contains("log1.json", "2022-01-17 20:00:00 +01:00"))
+        database.close()
+
+        # everything extracted from the logs is stored with the same types
+        database = StatsDatabase(self.database_file, self.config)
+        stored_logs = list(database.get_extracted_logs())
+        self.assertEqual([get_json_value(extracted) for extracted in stored_logs], [get_json_value(extracted) for extracted in self.extracted_logs])
+        self.assertIsInstance(stored_logs[0].player_stats[0][3]['dmg_total'], int)
+
+        # fights are selected by their start day
+        get_filenames = lambda *args: [extracted.filename for extracted in database.get_extracted_logs(*args)]
+        self.assertEqual(get_filenames(date(2022, 1, 18)), ["log1.json", "log2.json"])
+        self.assertEqual(get_filenames(None, date(2022, 1, 18)), ["log0.json", "log1.json"])
+        self.assertEqual(get_filenames(date(2022, 1, 18), date(2022, 1, 18), {"log1.json"}), [])
+
+        # storing a log again replaces it
+        self.extracted_logs[0].fight.kills = 100
+        database.put(self.extracted_logs[0])
+        self.assertEqual([extracted.fight.kills for extracted in database.get_extracted_logs()][0], 100)
+        self.assertEqual(database.connection.execute("SELECT COUNT(*) FROM players").fetchone()[0], sum(len(extracted.player_stats) for extracted in self.extracted_logs))
+
+        # a log with the same name from another directory is a different fight
+        other_log = copy.deepcopy(self.extracted_logs[1])
+        other_log.filename = "log0.json"
+        database.put(other_log)
+        self.assertEqual(get_filenames(), ["log0.json", "log0.json", "log1.json", "log2.json"])
+        self.assertEqual([extracted.fight.kills for extracted in database.get_extracted_logs()][0], 100)
+        database.close()
+
+        # logs extracted with a different config are not used
+        self.config.min_enemy_players += 1
+        database = StatsDatabase(self.database_file, self.config)
+        self.assertFalse(database.contains("log1.json", "2022-01-18 20:00:00 +01:00"))
+        self.assertEqual(list(database.get_extracted_logs()), [])
+        database.close()
+
+
+    def test_select_by_utc_time(self):
+        # 2022-01-18 16:00:00 UTC, before log1, and 2022-01-18 22:30:00 UTC, on the same day as log1
+        self.extracted_logs[0].fight.start_time = "2022-01-18 21:00:00 +05:00"
+        self.extracted_logs[2].fight.start_time = "2022-01-19 00:30:00 +02:00"
+        database = StatsDatabase(self.database_file, self.config)
+        list(database.store_extracted_logs(self.extracted_logs))
+        get_filenames = lambda *args: [extracted.filename for extracted in database.get_extracted_logs(*args)]
+        self.assertEqual(get_filenames(), ["log0.json", "log1.json", "log2.json"])
+        self.assertEqual(get_filenames(date(2022, 1, 18), date(2022, 1, 18)), ["log0.json", "log1.json", "log2.json"])
+        self.assertEqual(get_filenames(date(2022, 1, 19)), [])
+        database.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+
+import sys
+from os import path
+sys.path.append( path.dirname( path.dirname( path.abspath(__file__) ) ) )
+sys.path.append( path.join( path.dirname( path.dirname( path.abspath(__file__) ) ), "benchmark" ) )
+
+import unittest
+import unittest.mock
+import argparse
+import importlib
+import io
+import os
+import tempfile
+from top_stats_server import *
+from ei_log_generator import generate_logs
+
+class TestTopStatsServer(unittest.TestCase):
+    def setUp(self):
+        parser_config = importlib.import_module("parser_configs.parser_config_detailed" , package=None)
+        self.log = io.StringIO()
+        self.config = fill_config(parser_config, self.log)
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_directory = os.path.join(self.directory.name, "logs")
+        os.makedirs(self.log_directory)
+        self.args = argparse.Namespace(input_directory = self.log_directory, append = True, jobs = 1, cache_directory = None,
+                                       state_file = os.path.join(self.directory.name, "top_stats_state.pickle"))
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_queries(self):
+        queries = TopStatsQueries(self.args.state_file, self.config, self.log)
+        self.assertEqual(queries.query('/stats', {})[0], 503)
+
+        # the logs are added in two runs, like during a raid
+        new_logs = generate_logs(self.directory.name, 5, 10, 20, 60)
+        for log_file in new_logs[:3]:
+            os.rename(log_file, os.path.join(self.log_directory, path.basename(log_file)))
+        players, fights, found_healing, found_barrier = collect_stat_data(self.args, self.config, self.log)
+        status, response = queries.query('/top', {'stat': 'dmg_total', 'type': 'total', 'n': '3'})
+        self.assertEqual(status, 200)
+        top_players = get_top_players(players, self.config, 'dmg_total', StatType.TOTAL)
+        self.assertEqual([player['account'] for player in response['players']], [players[i].account for i in top_players[:3]])
+        self.assertIn('comparison_value', queries.query('/top', {'stat': 'deaths', 'type': 'percentage'})[1])
+
+        status, response = queries.query('/player', {'account': players[0].account})
+        self.assertEqual(status, 200)
+        self.assertEqual(len(response['characters'][0]['fights']), players[0].num_fights_present)
+        self.assertEqual(len(queries.query('/fights', {})[1]['fights']), len(fights))
+
+        self.assertEqual(queries.query('/top', {'stat': 'unknown'})[0], 400)
+        self.assertEqual(queries.query('/top', {'stat': 'dmg_total', 'type': 'median'})[0], 400)
+        self.assertEqual(queries.query('/top', {'stat': 'dmg_total', 'n': '-1'})[0], 400)
+        self.assertEqual(queries.query('/player', {'account': 'unknown'})[0], 404)
+        self.assertEqual(queries.query('/unknown', {})[0], 404)
+
+        # responses are cached until the state file changes
+        self.assertIs(queries.query('/fights', {}), queries.query('/fights', {}))
+        self.assertFalse(queries.update())
+        for log_file in new_logs[3:]:
+            os.rename(log_file, os.path.join(self.log_directory, path.basename(log_file)))
+        collect_stat_data(self.args, self.config, self.log)
+        self.assertEqual(len(queries.query('/fights', {})[1]['fights']), len(fights) + 2)
+
+
+    def test_unusable_state_file(self):
+        with open(self.args.state_file, 'wb') as f:
+            f.write(b'not a state')
+        queries = TopStatsQueries(self.args.state_file, self.config, self.log)
+        with unittest.mock.patch('top_stats_server.load_state', wraps=load_state) as mocked_load_state:
+            for i in range(3):
+                self.assertEqual(queries.query('/stats', {})[0], 503)
+            # the state file is only read again once it changed
+            self.assertEqual(mocked_load_state.call_count, 1)
+            with open(self.args.state_file, 'ab') as f:
+                f.write(b'!')
+            queries.query('/stats', {})
+            self.assertEqual(mocked_load_state.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+#    top_stats_server.py answers queries about computed top stats over http.
+#    Copyright (C) 2021 Freya Fleckenstein
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import importlib
+import json
+import os
+from collections import OrderedDict
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from parse_top_stats_tools import *
+from io_helper import get_json_value
+from aggregate_state import load_state
+
+stat_types = {'total': StatType.TOTAL, 'average': StatType.AVERAGE, 'consistent': StatType.CONSISTENT, 'percentage': StatType.PERCENTAGE}
+
+
+
+# This class holds the top stats computed from a state file as written by parse_top_stats_detailed.py with --append or
+# --watch, and answers queries about them. The state file is only read again when it changed, and the responses are
+# cached until then.
+class TopStatsQueries:
+    def __init__(self, state_file, config, log, anonymize = False, max_cached_responses = 256):
+        self.state_file = state_file
+        self.config = config
+        self.log = log
+        self.anonymize = anonymize
+        self.max_cached_responses = max_cached_responses
+        self.state_signature = None         # (size, modification time) of the state file that was loaded
+        self.players = None                 # list of Players, or None if no valid fights were found
+        self.fights = None
+        self.found_healing = False
+        self.found_barrier = False
+        self.overall_squad_stats = None
+        self.overall_raid_stats = None
+        self.responses = OrderedDict()      # query -> (http status, response) of the most recent queries
+
+
+    # load the state file again if it changed since it was loaded last
+    # Output:
+    # True if the top stats were loaded again
+    def update(self):
+        try:
+            file_stat = os.stat(self.state_file)
+        except OSError:
+            return False
+        signature = (file_stat.st_size, file_stat.st_mtime_ns)
+        if signature == self.state_signature:
+            return False
+
+        # an unusable state file is also only read again once it changed
+        self.state_signature = signature
+        state = load_state(self.state_file, self.config, self.log, "keeping the top stats loaded before")
+        if state is None:
+            return False
+        self.responses.clear()
+        self.players, self.fights, self.found_healing, self.found_barrier = compute_final_stats(state, self.state_file, self.config, self.log, self.anonymize, Profiler())
+        if self.players is not None:
+            self.overall_squad_stats = get_overall_squad_stats(self.fights, self.config)
+            self.overall_raid_stats = get_overall_raid_stats(self.fights)
+        return True
+
+
+    # answer a query, using the cached response if the same query was answered since the top stats were loaded
+    # Input:
+    # path = path of the query, e.g. /top
+    # parameters = dict of parameter -> value of the query
+    # Output:
+    # http status, json response as dict
+    def query(self, path, parameters):
+        self.update()
+        key = (path, tuple(sorted(parameters.items())))
+        if key in self.responses:
+            self.responses.move_to_end(key)
+            return self.responses[key]
+
+        response = self.get_response(path, parameters)
+        self.responses[key] = response
+        if len(self.responses) > self.max_cached_responses:
+            self.responses.popitem(last = False)
+        return response
+
+
+    # compute the response to a query
+    # Input:
+    # see query
+    # Output:
+    # http status, json response as dict
+    def get_response(self, path, parameters):
+        if self.players is None:
+            return 503, {'error': "No top stats available yet"}
+        if path == '/stats':
+            return 200, {'stats': [{'stat': stat, 'name': self.config.stat_names[stat]} for stat in self.config.stats_to_compute]}
+        if path == '/top':
+            return self.get_top_response(parameters)
+        if path == '/player':
+            return self.get_player_response(parameters)
+        if path == '/fights':
+            return 200, self.get_fights_response()
+        return 404, {'error': "Unknown query "+path+", use /stats, /top, /player or /fights"}
+
+
+    # top players for one stat, see get_top_players and get_top_percentage_players
+    # Input:
+    # parameters = 'stat', 'type' (total, average, consistent or percentage; default total) and 'n' (optional, maximum number of players)
+    def get_top_response(self, parameters):
+        stat = parameters.get('stat')
+        if stat not in self.config.stats_to_compute:
+            return 400, {'error': "Unknown stat "+str(stat)}
+        stat_type = parameters.get('type', 'total')
+        if stat_type not in stat_types:
+            return 400, {'error': "Unknown type "+stat_type+", use one of "+", ".join(stat_types)}
+        try:
+            num_players = int(parameters['n']) if 'n' in parameters else None
+        except ValueError:
+            return 400, {'error': "n has to be a number"}
+        if num_players is not None and num_players < 0:
+            return 400, {'error': "n can't be negative"}
+
+        response = {'stat': stat, 'type': stat_type, 'players': []}
+        if (stat == 'heal' and not self.found_healing) or (stat == 'barrier' and not self.found_barrier):
+            return 200, response
+        if stat_types[stat_type] == StatType.PERCENTAGE:
+            top_consistent_players = get_top_players(self.players, self.config, stat, StatType.CONSISTENT)
+            top_players, response['comparison_value'] = get_top_percentage_players(self.players, self.config, stat, self.overall_raid_stats['num_used_fights'], top_consistent_players)
+        else:
+            top_players = get_top_players(self.players, self.config, stat, stat_types[stat_type])
+
+        for i in top_players[:num_players]:
+            player = self.players[i]
+            response['players'].append({'account': player.account,
+                                        'name': player.name,
+                                        'profession': player.profession,
+                                        'num_fights_present': player.num_fights_present,
+                                        'attendance_percentage': player.attendance_percentage,
+                                        'total': player.total_stats[stat],
+                                        'average': player.average_stats.get(stat),
+                                        'times_top': player.consistency_stats[stat],
+                                        'percentage_top': player.portion_top_stats[stat]})
+        return 200, response
+
+
+    # all characters of one account with their stats in each fight they took part in
+    # Input:
+    # parameters = 'account'
+    def get_player_response(self, parameters):
+        account = parameters.get('account')
+        characters = [player for player in self.players if player.account == account]
+        if not characters:
+            return 404, {'error': "Unknown account "+str(account)}
+
+        response = {'account': account, 'characters': []}
+        for player in characters:
+            response['characters'].append({'name': player.name,
+                                           'profession': player.profession,
+                                           'num_fights_present': player.num_fights_present,
+                                           'total_stats': get_json_value(player.total_stats),
+                                           'average_stats': get_json_value(player.average_stats),
+                                           'fights': [dict(get_json_value(player.stats_per_fight[fight_number]), fight = fight_number)
+                                                      for fight_number in player.stats_per_fight.get_fights()]})
+        return 200, response
+
+
+    # overview of all fights and the overall raid and squad stats
+    def get_fights_response(self):
+        fights = list()
+        for fight_number, fight in enumerate(self.fights):
+            fight_json = get_json_value(fight)
+            # the tag positions are only needed for the computation
+            del fight_json['tag_positions_until_death']
+            fight_json['fight'] = fight_number
+            fights.append(fight_json)
+        return {'overall_raid_stats': get_json_value(self.overall_raid_stats),
+                'overall_squad_stats': get_json_value(self.overall_squad_stats),
+                'fights': fights}
+
+
+
+# answers GET requests with the responses of server.queries
+class TopStatsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parameters = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        status, response = self.server.queries.query(url.path, parameters)
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='This answers queries about top stats over http. The top stats are read from the state file written by parse_top_stats_detailed.py with --append or --watch --append, and read again whenever it changes.')
+    parser.add_argument('state_file', help='State file written by parse_top_stats_detailed.py')
+    parser.add_argument('-c', '--config_file', dest="config_file", help="Config file with all the settings; has to be the one used for writing the state file", default="parser_config_detailed")
+    parser.add_argument('-a', '--anonymized', dest="anonymize", help="Replace all account and character names.", default=False, action='store_true')
+    parser.add_argument('--host', dest="host", help="Address to listen on", default="127.0.0.1")
+    parser.add_argument('--port', dest="port", type=int, help="Port to listen on", default=8000)
+    args = parser.parse_args()
+
+    log = open(os.devnull, "w")
+    parser_config = importlib.import_module("parser_configs."+args.config_file , package=None)
+    config = fill_config(parser_config, log)
+    queries = TopStatsQueries(args.state_file, config, log, args.anonymize)
+    if not queries.update():
+        print("Couldn't load the top stats from "+args.state_file+"; waiting for it to be written.")
+
+    server = HTTPServer((args.host, args.port), TopStatsRequestHandler)
+    server.queries = queries
+    print("Answering queries on http://"+args.host+":"+str(server.server_port)+"/ (/stats, /top?stat=dmg_total&type=total&n=5, /player?account=..., /fights). Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()